@@ -12,4 +12,11 @@ limitations under the License.
 """
 from .queues import Queue
 from .unique_queues import UniqueQueue
+from .sorted_unique_queues import SortedUniqueQueue
 from .pools import Pool
+from .sharded_pools import ShardedPool
+from .fair_pools import FairPool
+from .stream_queues import StreamQueue
+from .multi_queues import MultiQueue
+from .topics import Topic
+from .batch_sizes import AdaptiveBatchSize
@@ -0,0 +1,119 @@
+"""
+Copyright (c) 2021 Heureka Group a.s. All Rights Reserved.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import math
+import time
+
+DEFAULT_MIN_COUNT = 1
+DEFAULT_MAX_COUNT = 1000
+DEFAULT_SMOOTHING = 0.3
+DEFAULT_CONSUMERS = 1
+DEFAULT_DEPTH_CHECK_INTERVAL = 10  # seconds
+MAX_GROWTH = 2
+
+
+class AdaptiveBatchSize(object):
+    """
+    AdaptiveBatchSize tunes the number of items a consumer gets at once, so that processing of a batch takes about
+    the target duration. Too small batches are dominated by the round trips, too big ones hold the items other
+    consumers could process (or strand them when the consumer crashes).
+
+    The batch size follows the moving average of the processing time per item (recorded by the consumer), it grows at
+    most twice per batch and it is capped by the share of this consumer of the queue depth (checked periodically).
+    Works with anything having get_items(count), i.e. the queues and the pools.
+
+    author: Heureka.cz <vyvoj@heureka.cz>
+    """
+
+    def __init__(self, source, target_duration: float, **kwargs):
+        """
+        :param source: Queue, UniqueQueue, Pool... the items are got from
+        :param target_duration: Desired processing time of a batch in seconds
+        :param **kwargs: [
+            min_count: int Minimum number of items got at once (1 as of default)
+            max_count: int Maximum number of items got at once (1000 as of default)
+            initial_count: int Number of items got before any processing time is recorded, min_count as of default
+            smoothing: float Weight of the latest batch in the moving average of the processing time (0.3 as of
+                       default)
+            consumers: int Number of consumers sharing the source, the count is capped by the queue depth divided by
+                       them (1 as of default)
+            depth_check_interval: int Number of seconds between the checks of the queue depth (get_count_to_process
+                                  of the pools, get_count otherwise), 0 disables the cap
+        ]
+        """
+        self.source = source
+        self.target_duration = target_duration
+        self.options = kwargs
+        self.batch_size = self.options.get('initial_count') or self._min_count
+        self._item_duration = None
+        self._depth = None
+        self._depth_checked_at = None
+
+    def get_items(self) -> list:
+        """
+        :return: List of items got from the source by the current batch size
+        """
+        return self.source.get_items(self.get_batch_size())
+
+    def get_batch_size(self) -> int:
+        """
+        :return: Number of items to be got by the next batch
+        """
+        depth = self._get_depth()
+        if depth is None:
+            return self.batch_size
+        share = int(math.ceil(depth / (self.options.get('consumers') or DEFAULT_CONSUMERS)))
+        return max(self._min_count, min(self.batch_size, share))
+
+    def record(self, count: int, duration: float):
+        """ Adjusts the batch size by the processing time of a batch
+        :param count: Number of processed items
+        :param duration: Processing time of the items in seconds
+        """
+        if count <= 0:
+            return
+        item_duration = max(duration, 0) / count
+        if self._item_duration is None:
+            self._item_duration = item_duration
+        else:
+            smoothing = self.options.get('smoothing') or DEFAULT_SMOOTHING
+            self._item_duration = smoothing * item_duration + (1 - smoothing) * self._item_duration
+
+        if self._item_duration > 0:
+            count = int(self.target_duration / self._item_duration)
+        else:
+            count = self._max_count
+        self.batch_size = max(self._min_count, min(count, self.batch_size * MAX_GROWTH, self._max_count))
+
+    def _get_depth(self):
+        """
+        :return: Number of items waiting in the source, cached for depth_check_interval, None if disabled
+        """
+        interval = self.options.get('depth_check_interval', DEFAULT_DEPTH_CHECK_INTERVAL)
+        if not interval:
+            return None
+        now = time.time()
+        if self._depth_checked_at is None or now - self._depth_checked_at >= interval:
+            if hasattr(self.source, 'get_count_to_process'):
+                self._depth = self.source.get_count_to_process()
+            else:
+                self._depth = self.source.get_count()
+            self._depth_checked_at = now
+        return self._depth
+
+    @property
+    def _min_count(self):
+        return self.options.get('min_count') or DEFAULT_MIN_COUNT
+
+    @property
+    def _max_count(self):
+        return self.options.get('max_count') or DEFAULT_MAX_COUNT
@@ -0,0 +1,402 @@
+"""
+Copyright (c) 2021 Heureka Group a.s. All Rights Reserved.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import time
+
+from pyrq import helpers
+
+DEFAULT_CHUNK_SIZE = 100
+DEFAULT_SYNC_SLAVES_COUNT = 0
+DEFAULT_SYNC_SLAVES_TIMEOUT = 100
+DEFAULT_ACK_TTL = 600  # seconds
+DEFAULT_ACK_VALID_FOR = 129600  # seconds
+DEFAULT_TENANT_WEIGHT = 1
+TENANTS_SUFFIX = '-tenants'
+WEIGHTS_SUFFIX = '-weights'
+ITEMS_SUFFIX = '-items'
+CURSOR_SUFFIX = '-cursor'
+TENANT_POOL_SUFFIX = '-tenant-'
+
+
+class FairPool(object):
+    def __init__(self, name: str, redis, **kwargs):
+        """
+        FairPool is a Pool shared by many tenants. Every tenant has its own Sorted Set of items and the items are
+        leased in weighted round-robin across the tenants with due items, so a tenant with a huge backlog cannot
+        starve the others. Each round gives every tenant up to its weight (1 as of default) of items and the first
+        tenant of the round rotates between the calls.
+
+        The items are processed periodically exactly like in Pool - the items being processed are marked by
+        a fractional part of their score and the acknowledged items are valid for ack_valid_for seconds. Item belongs
+        to a single tenant, the tenant of an item is kept in a Hash so ack and remove do not need it.
+
+        The names of the tenant Sorted Sets are derived inside the scripts, so FairPool is not Redis Cluster ready.
+
+        :param name: Name of the pool
+        :param redis: Redis client
+        :param **kwargs: [
+            chunk_size: int Size of chunks
+            synced_slaves_enabled: bool Enables slave synchronous syncing
+            synced_slaves_count: int Number of slaves that need to be synced in order to continue
+            synced_slaves_timeout: int Timeout for syncing slaves. If reached, exception is raised
+            ack_ttl: int Acknowledge timeout of the just processed items
+            ack_valid_for: int Validity of the acknowledged items
+        ]
+        """
+        self.redis = redis
+        self.name = name
+        self.options = self._load_options(kwargs)
+        self._register_commands()
+
+    @staticmethod
+    def _load_options(kwargs):
+        return {
+            'chunk_size': kwargs.get('chunk_size', DEFAULT_CHUNK_SIZE),
+            'synced_slaves_enabled': kwargs.get('synced_slaves_enabled', False),
+            'synced_slaves_count': kwargs.get('synced_slaves_count', DEFAULT_SYNC_SLAVES_COUNT),
+            'synced_slaves_timeout': kwargs.get('synced_slaves_timeout', DEFAULT_SYNC_SLAVES_TIMEOUT),
+            'ack_ttl': kwargs.get('ack_ttl', DEFAULT_ACK_TTL),
+            'ack_valid_for': kwargs.get('ack_valid_for', DEFAULT_ACK_VALID_FOR),
+        }
+
+    def _register_commands(self):
+        self.add_command = helpers.register_script(self.redis, self.PoolCommand.add())
+        self.get_command = helpers.register_script(self.redis, self.PoolCommand.get())
+        self.ack_command = helpers.register_script(self.redis, self.PoolCommand.ack())
+        self.remove_command = helpers.register_script(self.redis, self.PoolCommand.remove())
+        self.count_to_process_command = helpers.register_script(self.redis, self.PoolCommand.count_to_process())
+
+    def get_count(self) -> int:
+        """
+        :return: Number of items in the pool
+        """
+        return self.redis.hlen(self.items_name)
+
+    def get_count_to_process(self) -> int:
+        """
+        :return: Number of items in the pool which should be processed
+        """
+        return self.count_to_process_command(keys=[self.tenants_name],
+                                             args=[int(time.time()), self.tenant_pool_prefix])
+
+    def get_tenant_count(self, tenant) -> int:
+        """
+        :param tenant: Anything that is convertible to str
+        :return: Number of items of the tenant
+        """
+        return self.redis.zcard(self.get_tenant_pool_name(tenant))
+
+    def is_in_pool(self, item) -> bool:
+        """
+        :return: Checks if the given item is present in the pool
+        """
+        return self.redis.hexists(self.items_name, item)
+
+    def set_tenant_weight(self, tenant, weight: int):
+        """
+        :param tenant: Anything that is convertible to str
+        :param weight: Number of items the tenant gets in each round of leasing, 0 pauses the tenant
+        """
+        if int(weight) < 0:
+            raise ValueError('Weight of a tenant must not be negative')
+        self.redis.hset(self.weights_name, tenant, int(weight))
+        self._wait_for_synced_slaves()
+
+    def add_item(self, item, tenant):
+        """
+        :param item: Anything that is convertible to str
+        :param tenant: Tenant the item belongs to, anything that is convertible to str
+        """
+        self.add_items([item], tenant)
+
+    def add_items(self, items, tenant):
+        """
+        :param items: List of items to be added via pipeline
+        :param tenant: Tenant the items belong to, anything that is convertible to str
+        """
+        def add_chunk(chunk, pipeline):
+            self.add_command(keys=[self.tenants_name, self.items_name],
+                             args=[self.tenant_pool_prefix, tenant, int(time.time())] + list(chunk),
+                             client=pipeline)
+
+        helpers.execute_in_chunks(self.redis, items, self.options['chunk_size'], add_chunk)
+        self._wait_for_synced_slaves()
+
+    def get_items(self, count: int) -> list:
+        """
+        :param count: Number of items to be returned
+        :return: List of items, interleaved by tenant
+        """
+        return self.get_command(keys=[self.tenants_name, self.weights_name, self.cursor_name],
+                                args=[count, int(time.time()), self.options['ack_ttl'], self.tenant_pool_prefix,
+                                      DEFAULT_TENANT_WEIGHT])
+
+    def ack_item(self, item):
+        """ Acknowledges an item that was processed correctly
+        :param item: Anything that is convertible to str
+        """
+        self.ack_items([item])
+
+    def ack_items(self, items) -> list:
+        """ Acknowledges items that were processed correctly
+        :param items: List of items that are convertible to str
+        :return: List of flags telling whether the corresponding item was acknowledged
+        """
+        def ack_chunk(chunk, pipeline):
+            self.ack_command(keys=[self.items_name],
+                             args=[self.tenant_pool_prefix, int(time.time()), self.options['ack_valid_for']]
+                             + list(chunk),
+                             client=pipeline)
+
+        result = [bool(acked) for chunk_result in
+                  helpers.execute_in_chunks(self.redis, items, self.options['chunk_size'], ack_chunk)
+                  for acked in chunk_result]
+        self._wait_for_synced_slaves()
+        return result
+
+    def remove_item(self, item):
+        """ Removes an item that is no longer valid
+        :param item: Anything that is convertible to str
+        """
+        self.remove_items([item])
+
+    def remove_items(self, items) -> list:
+        """ Removes items that are no longer valid
+        :param items: List of items that are convertible to str
+        :return: List of flags telling whether the corresponding item was removed
+        """
+        def remove_chunk(chunk, pipeline):
+            self.remove_command(keys=[self.tenants_name, self.items_name],
+                                args=[self.tenant_pool_prefix] + list(chunk),
+                                client=pipeline)
+
+        result = [bool(removed) for chunk_result in
+                  helpers.execute_in_chunks(self.redis, items, self.options['chunk_size'], remove_chunk)
+                  for removed in chunk_result]
+        self._wait_for_synced_slaves()
+        return result
+
+    def clear_pool(self, chunked: bool=False):
+        """ Clears all the items from the pool, the tenant weights are kept
+        :param chunked: Deletes the items in chunks of chunk_size, for servers without UNLINK
+        """
+        tenant_pools = [self.get_tenant_pool_name(tenant) for tenant in self.redis.smembers(self.tenants_name)]
+        keys = [self.tenants_name, self.items_name, self.cursor_name] + tenant_pools
+        helpers.purge_keys(self.redis, keys, chunked, self.options['chunk_size'])
+
+    def get_tenant_pool_name(self, tenant) -> str:
+        """
+        :param tenant: Anything that is convertible to str
+        :return: Name of the sorted set of the tenant items
+        """
+        tenant = tenant.decode() if isinstance(tenant, bytes) else str(tenant)
+        return self.tenant_pool_prefix + tenant
+
+    @property
+    def tenant_pool_prefix(self):
+        """
+        :return: Prefix of the names of the tenant sorted sets
+        """
+        return self.name + TENANT_POOL_SUFFIX
+
+    @property
+    def tenants_name(self):
+        """
+        :return: Name of the set of tenants with items
+        """
+        return self.name + TENANTS_SUFFIX
+
+    @property
+    def weights_name(self):
+        """
+        :return: Name of the hash of tenant weights
+        """
+        return self.name + WEIGHTS_SUFFIX
+
+    @property
+    def items_name(self):
+        """
+        :return: Name of the hash of item tenants
+        """
+        return self.name + ITEMS_SUFFIX
+
+    @property
+    def cursor_name(self):
+        """
+        :return: Name of the round-robin cursor
+        """
+        return self.name + CURSOR_SUFFIX
+
+    def _wait_for_synced_slaves(self):
+        if self.options['synced_slaves_enabled']:
+            helpers.wait_for_synced_slaves(self.redis, self.options['synced_slaves_count'],
+                                           self.options['synced_slaves_timeout'])
+
+    class PoolCommand(object):
+
+        @staticmethod
+        def add():
+            """
+            :return: LUA Script for ADD command
+            """
+            return """
+            local tenants = KEYS[1]
+            local items = KEYS[2]
+            local prefix = ARGV[1]
+            local tenant = ARGV[2]
+            local time = ARGV[3]
+
+            local previous
+            for i = 4, #ARGV, 1 do
+                previous = redis.call('hget', items, ARGV[i])
+                if previous and previous ~= tenant then
+                    redis.call('zrem', prefix .. previous, ARGV[i])
+                    if redis.call('exists', prefix .. previous) == 0 then
+                        redis.call('srem', tenants, previous)
+                    end
+                end
+                redis.call('hset', items, ARGV[i], tenant)
+                redis.call('zadd', prefix .. tenant, time, ARGV[i])
+            end
+            redis.call('sadd', tenants, tenant)
+            """
+
+        @staticmethod
+        def get():
+            """
+            :return: LUA Script for GET command, weighted round-robin across the tenants
+            """
+            return """
+            local tenants = KEYS[1]
+            local weights = KEYS[2]
+            local cursor = KEYS[3]
+            local size = tonumber(ARGV[1])
+            local time = tonumber(ARGV[2])
+            local ackTTL = tonumber(ARGV[3])
+            local prefix = ARGV[4]
+            local defaultWeight = tonumber(ARGV[5])
+
+            local names = redis.call('smembers', tenants)
+            local result = {}
+            if #names == 0 or size < 1 then
+                return result
+            end
+            table.sort(names)
+
+            local start = redis.call('incr', cursor) % #names
+            local active = {}
+            for i = 1, #names, 1 do
+                table.insert(active, names[(start + i - 1) % #names + 1])
+            end
+
+            while #result < size and #active > 0 do
+                local stillActive = {}
+                for i = 1, #active, 1 do
+                    if #result >= size then
+                        break
+                    end
+                    local weight = tonumber(redis.call('hget', weights, active[i])) or defaultWeight
+                    local take = math.min(weight, size - #result)
+                    if take > 0 then
+                        local due = redis.call('zrangebyscore', prefix .. active[i], '-inf', time, 'LIMIT', 0, take)
+                        for j = 1, #due, 1 do
+                            redis.call('zadd', prefix .. active[i], time + ackTTL + 0.1, due[j])
+                            table.insert(result, due[j])
+                        end
+                        if #due == take then
+                            table.insert(stillActive, active[i])
+                        end
+                    end
+                end
+                active = stillActive
+            end
+
+            return result
+            """
+
+        @staticmethod
+        def ack():
+            """
+            :return: LUA Script for ACK command
+            """
+            return """
+            local items = KEYS[1]
+            local prefix = ARGV[1]
+            local time = tonumber(ARGV[2])
+            local validFor = tonumber(ARGV[3])
+
+            local result = {}
+            local tenant
+            local score
+            for i = 4, #ARGV, 1 do
+                tenant = redis.call('hget', items, ARGV[i])
+                score = tenant and redis.call('zscore', prefix .. tenant, ARGV[i])
+                if score and score - math.floor(score) > 0.01 then
+                    redis.call('zadd', prefix .. tenant, time + validFor, ARGV[i])
+                    table.insert(result, 1)
+                else
+                    table.insert(result, 0)
+                end
+            end
+
+            return result
+            """
+
+        @staticmethod
+        def remove():
+            """
+            :return: LUA Script for REMOVE command
+            """
+            return """
+            local tenants = KEYS[1]
+            local items = KEYS[2]
+            local prefix = ARGV[1]
+
+            local result = {}
+            local tenant
+            local score
+            for i = 2, #ARGV, 1 do
+                tenant = redis.call('hget', items, ARGV[i])
+                score = tenant and redis.call('zscore', prefix .. tenant, ARGV[i])
+                if score and score - math.floor(score) > 0.01 then
+                    redis.call('zrem', prefix .. tenant, ARGV[i])
+                    redis.call('hdel', items, ARGV[i])
+                    if redis.call('exists', prefix .. tenant) == 0 then
+                        redis.call('srem', tenants, tenant)
+                    end
+                    table.insert(result, 1)
+                else
+                    table.insert(result, 0)
+                end
+            end
+
+            return result
+            """
+
+        @staticmethod
+        def count_to_process():
+            """
+            :return: LUA Script for COUNT TO PROCESS command
+            """
+            return """
+            local tenants = KEYS[1]
+            local time = ARGV[1]
+            local prefix = ARGV[2]
+
+            local count = 0
+            local names = redis.call('smembers', tenants)
+            for i = 1, #names, 1 do
+                count = count + redis.call('zcount', prefix .. names[i], '-inf', time)
+            end
+
+            return count
+            """
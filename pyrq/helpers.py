@@ -10,6 +10,14 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import uuid
+import weakref
+
+DEFAULT_PURGE_CHUNK_SIZE = 1000
+PIPELINE_CHUNKS = 10
+PURGING_SUFFIX = '-purging-'
+
+_registered_scripts = weakref.WeakKeyDictionary()
 
 
 def wait_for_synced_slaves(redis, count: int, timeout: int):
@@ -18,6 +26,136 @@ def wait_for_synced_slaves(redis, count: int, timeout: int):
         raise NotEnoughSyncedSlavesError('There are only {} synced slaves. Required {}'.format(synced, count))
 
 
+def get_read_client(redis, read_redis=None, max_staleness: int=None):
+    """
+    Returns the client for read-only commands - the read client (e.g. a replica) if there is any and it is not lagging
+    behind its master for more than max_staleness seconds, the primary client otherwise.
+    :param redis: Redis client of the primary
+    :param read_redis: Redis client for read-only commands
+    :param max_staleness: Maximum number of seconds since the replica heard from its master, not checked if None
+    :return: Redis client
+    """
+    if read_redis is None:
+        return redis
+    if max_staleness is None:
+        return read_redis
+    replication = read_redis.info('replication')
+    if replication.get('role') != 'slave':
+        return read_redis
+    if replication.get('master_link_status') != 'up' \
+            or int(replication.get('master_last_io_seconds_ago', 0)) > max_staleness:
+        return redis
+    return read_redis
+
+
+def register_script(redis, script: str):
+    """
+    Returns Script object shared by all the instances using the same Redis client. The script is loaded into the script
+    cache of the server (SCRIPT LOAD) when it is registered for the first time, so the calls are always single EVALSHA.
+    :param redis: Redis client
+    :param script: LUA Script
+    :return: Script
+    """
+    scripts = _registered_scripts.setdefault(redis, {})
+    if script not in scripts:
+        redis.script_load(script)
+        scripts[script] = redis.register_script(script)
+    return scripts[script]
+
+
+def ack_batch_prelude() -> str:
+    """
+    :return: LUA prelude acknowledging the items at the end of ARGV (used by ack_and_get of the queues), which are
+             followed by the index of the processing queue in KEYS and the number of the items, the rest of ARGV is
+             left to the script it is prepended to
+    """
+    return """
+    local ackedCount = tonumber(ARGV[#ARGV])
+    local ackedProcessing = KEYS[tonumber(ARGV[#ARGV - 1])]
+    for i = #ARGV - 1 - ackedCount, #ARGV - 2, 1 do
+        redis.call('lrem', ackedProcessing, -1, ARGV[i])
+    end
+    """
+
+
+def load_scripts(redis):
+    """
+    Loads all the scripts registered for the given Redis client into the script cache of the server. Call it after
+    a failover or a SCRIPT FLUSH so the first calls do not have to fall back from NOSCRIPT errors.
+    :param redis: Redis client
+    """
+    scripts = _registered_scripts.get(redis, {})
+    pipeline = redis.pipeline(transaction=False)
+    for script in scripts:
+        pipeline.script_load(script)
+    pipeline.execute()
+
+
+def purge_keys(redis, keys, chunked: bool=False, chunk_size: int=DEFAULT_PURGE_CHUNK_SIZE):
+    """
+    Deletes the keys without blocking the server for the time proportional to their size. The keys are UNLINKed, so
+    the memory is freed in a background thread of the server. Servers without UNLINK (older than 4.0) can use
+    the chunked mode - every key is renamed away (so it is empty at once) and then deleted in chunks.
+    :param redis: Redis client
+    :param keys: Names of the keys
+    :param chunked: Deletes the keys in chunks instead of UNLINK
+    :param chunk_size: Number of members deleted at once in the chunked mode
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    if not chunked:
+        redis.unlink(*keys)
+        return
+
+    for key in keys:
+        if not redis.exists(key):
+            continue
+        purged_key = key + PURGING_SUFFIX + uuid.uuid4().hex
+        redis.rename(key, purged_key)
+        _delete_in_chunks(redis, purged_key, chunk_size)
+
+
+def _delete_in_chunks(redis, key: str, chunk_size: int):
+    key_type = redis.type(key)
+    key_type = key_type.decode() if isinstance(key_type, bytes) else key_type
+    if key_type == 'list':
+        while redis.exists(key):
+            redis.ltrim(key, chunk_size, -1)
+    elif key_type == 'zset':
+        while redis.exists(key):
+            redis.zremrangebyrank(key, 0, chunk_size - 1)
+    elif key_type in ('set', 'hash'):
+        scan, remove = (redis.sscan, redis.srem) if key_type == 'set' else (redis.hscan, redis.hdel)
+        cursor = None
+        while cursor != 0:
+            cursor, members = scan(key, cursor or 0, count=chunk_size)
+            if members:
+                remove(key, *members)
+    redis.delete(key)
+
+
+def execute_in_chunks(redis, items, chunk_size: int, call, pipeline_chunks: int=None) -> list:
+    """
+    Runs a command for every chunk of the items by a non-transactional pipeline executed every pipeline_chunks chunks,
+    so a huge batch neither runs as a single MULTI/EXEC blocking the server nor buffers all the results on the client
+    :param redis: Redis client
+    :param items: List of items
+    :param chunk_size: Number of items passed to a single command
+    :param call: Function (chunk, pipeline) adding the command of the chunk to the pipeline
+    :param pipeline_chunks: Number of chunks sent by a single pipeline execution, PIPELINE_CHUNKS as of default
+    :return: List of the results of the commands, one per chunk
+    """
+    pipeline_chunks = pipeline_chunks or PIPELINE_CHUNKS
+    result = []
+    pipeline = redis.pipeline(transaction=False)
+    for index, chunk in enumerate(create_chunks(items, chunk_size), 1):
+        call(chunk, pipeline)
+        if index % pipeline_chunks == 0:
+            result += pipeline.execute()
+    return result + pipeline.execute()
+
+
 def create_chunks(items, chunk_size):
     for chunk in [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]:
         yield chunk
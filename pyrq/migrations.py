@@ -0,0 +1,180 @@
+"""
+Copyright (c) 2021 Heureka Group a.s. All Rights Reserved.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Streaming export and import of the queues and pools, e.g. to move them between Redis instances. The file is a text file
+of JSON lines, the first line is a header and every next line is a single item (a [item, score, durations] triple for
+the pools). Binary items which are not valid UTF-8 are written as {"base64": ...} objects. Redis is read in bounded
+chunks, so it is never blocked by a huge key, and the client keeps just a single chunk in memory. Run it when
+the producers and consumers are stopped, the items changed during the export may be missed or exported twice.
+"""
+import base64
+import itertools
+import json
+
+from pyrq.queues import Queue
+from pyrq.unique_queues import UniqueQueue
+from pyrq.pools import Pool
+
+FORMAT_NAME = 'pyrq'
+FORMAT_VERSION = 2
+READABLE_VERSIONS = (1, 2)
+BINARY_KEY = 'base64'
+QUEUE_TYPE = 'queue'
+POOL_TYPE = 'pool'
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def export_queue(queue, file, chunk_size: int=DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Writes all the items of Queue or UniqueQueue, the items in processing go first, the order in which they would be
+    got from the queue is kept
+    :param queue: Queue or UniqueQueue instance
+    :param file: Text file opened for writing
+    :param chunk_size: Number of items read by a single LRANGE
+    :return: Number of exported items
+    """
+    _write_header(file, QUEUE_TYPE)
+    lists = [processing_queue for processing_queue, value_time in queue._get_sorted_processing_queues()]
+    lists.append(queue.queue_name if isinstance(queue, UniqueQueue) else queue.name)
+
+    count = 0
+    for name in lists:
+        for chunk in _iterate_list(queue.redis, name, chunk_size):
+            if isinstance(queue, Queue):
+                chunk = queue._check_out(chunk)
+            for item in chunk:
+                _write_line(file, item)
+            count += len(chunk)
+    return count
+
+
+def import_queue(queue, file, chunk_size: int=DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Adds the exported items to Queue or UniqueQueue by add_items, so the options of the queue (uniqueness, bounds...)
+    are applied
+    :param queue: Queue or UniqueQueue instance
+    :param file: Text file opened for reading
+    :param chunk_size: Number of items added at once
+    :return: Number of imported items
+    """
+    _read_header(file, QUEUE_TYPE)
+    count = 0
+    for chunk in _iterate_chunks(file, chunk_size):
+        count += queue.add_items(chunk)
+    return count
+
+
+def export_pool(pool: Pool, file, chunk_size: int=DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Writes all the items of Pool with their scores and per item durations (if any)
+    :param pool: Pool instance
+    :param file: Text file opened for writing
+    :param chunk_size: Number of items read by a single ZSCAN
+    :return: Number of exported items
+    """
+    _write_header(file, POOL_TYPE)
+    count = 0
+    items = pool.redis.zscan_iter(pool.name, count=chunk_size)
+    for chunk in iter(lambda: list(itertools.islice(items, chunk_size)), []):
+        durations = pool.redis.hmget(pool.durations_name, [item for item, score in chunk])
+        for (item, score), item_durations in zip(chunk, durations):
+            _write_line(file, [item, score, item_durations])
+        count += len(chunk)
+    return count
+
+
+def import_pool(pool: Pool, file, chunk_size: int=DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Adds the exported items to Pool keeping their scores and durations, every chunk is written by a single pipeline
+    :param pool: Pool instance
+    :param file: Text file opened for reading
+    :param chunk_size: Number of items written by a single pipeline
+    :return: Number of imported items
+    """
+    _read_header(file, POOL_TYPE)
+    count = 0
+    for chunk in _iterate_chunks(file, chunk_size):
+        pipeline = pool.redis.pipeline()
+        pipeline.zadd(pool.name, {item: score for item, score, durations in chunk})
+        durations = {item: durations for item, score, durations in chunk if durations is not None}
+        if durations:
+            pipeline.hset(pool.durations_name, mapping=durations)
+        pipeline.execute()
+        count += len(chunk)
+    pool._wait_for_synced_slaves()
+    return count
+
+
+def _iterate_list(redis, name: str, chunk_size: int):
+    """
+    :return: Generator of the chunks of the list from its end (the next item to be got) to its start
+    """
+    offset = 0
+    while True:
+        chunk = redis.lrange(name, -offset - chunk_size, -offset - 1)
+        if not chunk:
+            return
+        yield list(reversed(chunk))
+        offset += len(chunk)
+
+
+def _iterate_chunks(file, chunk_size: int):
+    """
+    :return: Generator of the chunks of the items read from the file
+    """
+    items = (_decode(json.loads(line)) for line in file if line.strip())
+    return iter(lambda: list(itertools.islice(items, chunk_size)), [])
+
+
+def _write_header(file, structure_type: str):
+    _write_line(file, {'format': FORMAT_NAME, 'version': FORMAT_VERSION, 'type': structure_type})
+
+
+def _read_header(file, structure_type: str):
+    try:
+        header = json.loads(file.readline())
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('format') != FORMAT_NAME:
+        raise ValueError('File is not a py-rq export')
+    if header.get('version') not in READABLE_VERSIONS or header.get('type') != structure_type:
+        raise ValueError('Export of {} version {} cannot be imported to a {}'.format(
+            header.get('type'), header.get('version'), structure_type))
+
+
+def _write_line(file, value):
+    file.write(json.dumps(_encode(value), separators=(',', ':')) + '\n')
+
+
+def _encode(value):
+    """
+    :return: JSON serializable value, bytes are decoded from UTF-8 or wrapped in a base64 object if they are binary
+    """
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if not isinstance(value, bytes):
+        return value
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return {BINARY_KEY: base64.b64encode(value).decode('ascii')}
+
+
+def _decode(value):
+    """
+    :return: Value read from the file with the binary items decoded back to bytes
+    """
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if isinstance(value, dict) and list(value) == [BINARY_KEY]:
+        return base64.b64decode(value[BINARY_KEY])
+    return value
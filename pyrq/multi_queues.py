@@ -0,0 +1,188 @@
+"""
+Copyright (c) 2021 Heureka Group a.s. All Rights Reserved.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import time
+
+from pyrq import helpers
+
+DEFAULT_WEIGHT = 1
+DEFAULT_SYNC_SLAVES_COUNT = 0
+DEFAULT_SYNC_SLAVES_TIMEOUT = 100
+
+
+class MultiQueue(object):
+    """
+    MultiQueue is a consumer of several Queues. It gets the items from all the queues in weighted round-robin by
+    a single script call, so an idle queue does not cost a round trip. Each round takes up to the weight of items from
+    every queue which still has some. The acknowledged and rejected items are routed back to the processing queue of
+    the queue they came from, the queue of every item handed out is remembered by the instance.
+
+    All the queues must use the same Redis client. To use it with Redis Cluster, the names of the queues must share
+    a hash tag (e.g. '{orders}-high' and '{orders}-low'), so all their keys live in the same slot.
+
+    author: Heureka.cz <vyvoj@heureka.cz>
+    """
+
+    def __init__(self, queues: list, weights: list=None, **kwargs):
+        """
+        :param queues: List of Queue instances
+        :param weights: List of weights of the queues, 1 for every queue as of default
+        :param **kwargs: [
+            synced_slaves_enabled: bool Enables slave synchronous syncing
+            synced_slaves_count: int Number of slaves that need to be synced in order to continue
+            synced_slaves_timeout: int Timeout for syncing slaves. If reached, exception is raised
+        ]
+        """
+        if weights is not None and len(weights) != len(queues):
+            raise ValueError('There must be a weight for every queue')
+        if any(queue.options.get('max_bytes') or queue.options.get('claim_check_threshold')
+               or queue.options.get('track_latency') for queue in queues):
+            raise ValueError('Queues with max_bytes, claim_check_threshold or track_latency option are not supported')
+        self.queues = list(queues)
+        self.weights = list(weights) if weights is not None else [DEFAULT_WEIGHT] * len(self.queues)
+        self.redis = self.queues[0].redis
+        self.options = kwargs
+        self._deliveries = {}
+        self.get_command = helpers.register_script(self.redis, self.QueueCommand.get())
+
+    def get_count(self) -> int:
+        """
+        :return: Number of items in all the queues
+        """
+        pipeline = self.redis.pipeline(transaction=False)
+        for queue in self.queues:
+            pipeline.llen(queue.name)
+        return sum(pipeline.execute())
+
+    def get_items(self, count: int) -> list:
+        """
+        :param count: Number of items to be returned
+        :return: List of items
+        """
+        keys = []
+        for queue in self.queues:
+            keys += [queue.name, queue.processing_queue_name, queue.timeouts_hash_name]
+        response = self.get_command(keys=keys, args=[count, int(time.time())] + self.weights)
+
+        result = []
+        for i in range(0, len(response), 2):
+            queue_index, item = int(response[i]), response[i + 1]
+            self._deliveries.setdefault(item, []).append(queue_index)
+            result.append(item)
+        return result
+
+    def ack_item(self, item):
+        """
+        :param item: Anything that is convertible to str
+        """
+        self.ack_items([item])
+
+    def ack_items(self, items: list):
+        """
+        :param items: List of items that are convertible to str
+        """
+        pipeline = self.redis.pipeline()
+        for queue, item in self._pop_queues(items):
+            queue.ack_command(keys=[queue.processing_queue_name, queue.timeouts_hash_name], args=[str(item)],
+                              client=pipeline)
+        pipeline.execute()
+        self._wait_for_synced_slaves()
+
+    def reject_item(self, item):
+        """
+        :param item: Anything that is convertible to str
+        """
+        self.reject_items([item])
+
+    def reject_items(self, items: list):
+        """
+        :param items: List of items that are convertible to str
+        """
+        pipeline = self.redis.pipeline()
+        for queue, item in reversed(self._pop_queues(items)):
+            queue.reject_command(keys=[queue.name, queue.processing_queue_name, queue.timeouts_hash_name],
+                                 args=[str(item)], client=pipeline)
+        pipeline.execute()
+        self._wait_for_synced_slaves()
+
+    def _pop_queues(self, items: list) -> list:
+        """
+        :param items: List of items handed out by this instance
+        :return: List of (queue, item) tuples, items not handed out by this instance are skipped
+        """
+        result = []
+        for item in items:
+            key = item if self._deliveries.get(item) else str(item)
+            if not self._deliveries.get(key):
+                continue
+            result.append((self.queues[self._deliveries[key].pop(0)], item))
+            if not self._deliveries[key]:
+                del self._deliveries[key]
+        return result
+
+    def _wait_for_synced_slaves(self):
+        if self.options.get('synced_slaves_enabled'):
+            count = self.options['synced_slaves_count'] if self.options['synced_slaves_count'] \
+                else DEFAULT_SYNC_SLAVES_COUNT
+            timeout = self.options['synced_slaves_timeout'] if self.options['synced_slaves_timeout'] \
+                else DEFAULT_SYNC_SLAVES_TIMEOUT
+            helpers.wait_for_synced_slaves(self.redis, count, timeout)
+
+    class QueueCommand(object):
+
+        @staticmethod
+        def get():
+            """
+            :return: LUA Script for GET command, keys are triples of queue, processing queue and timeouts hash
+            """
+            return """
+            local size = tonumber(ARGV[1])
+            local time = ARGV[2]
+
+            local result = {}
+            local count = 0
+            local active = {}
+            for i = 1, #KEYS / 3, 1 do
+                table.insert(active, i)
+            end
+
+            while count < size and #active > 0 do
+                local stillActive = {}
+                for _, index in ipairs(active) do
+                    local queue = KEYS[index * 3 - 2]
+                    local processing = KEYS[index * 3 - 1]
+                    local timeouts = KEYS[index * 3]
+                    local take = math.min(tonumber(ARGV[index + 2]), size - count)
+                    local taken = 0
+                    local item
+                    while taken < take do
+                        item = redis.call('rpoplpush', queue, processing)
+                        if not item then
+                            break
+                        end
+                        if taken == 0 then
+                            redis.call('hset', timeouts, processing, time)
+                        end
+                        table.insert(result, index - 1)
+                        table.insert(result, item)
+                        taken = taken + 1
+                    end
+                    count = count + taken
+                    if taken == take and take > 0 then
+                        table.insert(stillActive, index)
+                    end
+                end
+                active = stillActive
+            end
+
+            return result
+            """
@@ -13,6 +13,10 @@ limitations under the License.
 import time
 import socket
 import os
+import random
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from pyrq import helpers
 
@@ -21,6 +25,12 @@ DEFAULT_SYNC_SLAVES_COUNT = 0
 DEFAULT_SYNC_SLAVES_TIMEOUT = 100
 DEFAULT_ACK_TTL = 600  # seconds
 DEFAULT_ACK_VALID_FOR = 129600  # seconds
+DEFAULT_JITTER = 0  # seconds
+DEFAULT_STATS_BUCKETS = (-3600, -600, -60, 0, 60, 600, 3600)  # seconds relative to now
+LEASES_SUFFIX = '-leases'
+DURATIONS_SUFFIX = '-durations'
+
+logger = logging.getLogger(__name__)
 
 
 class Pool(object):
@@ -33,6 +43,16 @@ class Pool(object):
         There is no need for a garbage collector process - items that were failed to process are automatically processed
         after the ACK_TTL time has passed.
 
+        By default the items being processed are marked by a fractional part of their score. With lease_index enabled,
+        the leases are kept in a separate Sorted Set scored by the lease expiry instead, so the items being processed
+        can be counted and listed in O(log N).
+
+        Validity (ack_valid_for) and lease duration (ack_ttl) can be set per item when adding it. These are stored in
+        a Hash, so one pool (and one consumer loop) can serve items with different refresh rates.
+
+        Items added or acknowledged together become due at the same second. Use jitter to spread them randomly over
+        the given number of seconds, so a bulk import does not turn into a thundering herd every ack_valid_for.
+
         :param name: Name of the pool
         :param redis: Redis client
         :param **kwargs: [
@@ -41,6 +61,10 @@ class Pool(object):
             synced_slaves_count: int Number of slaves that need to be synced in order to continue
             synced_slaves_timeout: int Timeout for syncing slaves. If reached, exception is raised
             ack_ttl: int Acknowledge timeout of the just processed items
+            ack_valid_for: int Validity of the acknowledged items
+            lease_index: bool Keeps the leases of the items being processed in a separate Sorted Set
+            jitter: int Maximum random delay added to the due time of the added and acknowledged items
+            read_redis: Redis client for read-only commands (e.g. a replica), the primary is used as of default
         ]
         """
         self.client_id = '{0}[{1}][{2}]'.format(socket.gethostname(), os.getpid(), int(time.time()))
@@ -57,51 +81,136 @@ class Pool(object):
             'synced_slaves_count': kwargs.get('synced_slaves_count', DEFAULT_SYNC_SLAVES_COUNT),
             'synced_slaves_timeout': kwargs.get('synced_slaves_timeout', DEFAULT_SYNC_SLAVES_TIMEOUT),
             'ack_ttl': kwargs.get('ack_ttl', DEFAULT_ACK_TTL),
-            'ack_valid_for': kwargs.get('ack_valid_for', DEFAULT_ACK_VALID_FOR)
+            'ack_valid_for': kwargs.get('ack_valid_for', DEFAULT_ACK_VALID_FOR),
+            'lease_index': kwargs.get('lease_index', False),
+            'jitter': kwargs.get('jitter', DEFAULT_JITTER),
+            'read_redis': kwargs.get('read_redis')
         }
 
     def _register_commands(self):
-        self.ack_command = self.redis.register_script(self.PoolCommand.ack())
-        self.get_command = self.redis.register_script(self.PoolCommand.get())
-        self.remove_command = self.redis.register_script(self.PoolCommand.remove())
+        durations = self.PoolCommand.durations()
+        if self.options['lease_index']:
+            self.ack_command = helpers.register_script(self.redis, durations + self.PoolCommand.ack_indexed())
+            self.ack_batch_command = helpers.register_script(self.redis,
+                                                            durations + self.PoolCommand.ack_batch_indexed())
+            self.get_command = helpers.register_script(self.redis, durations + self.PoolCommand.get_indexed())
+            self.renew_command = helpers.register_script(self.redis, durations + self.PoolCommand.renew_indexed())
+            self.remove_command = helpers.register_script(self.redis, self.PoolCommand.remove_indexed())
+            self.remove_batch_command = helpers.register_script(self.redis, self.PoolCommand.remove_batch_indexed())
+        else:
+            self.ack_command = helpers.register_script(self.redis, durations + self.PoolCommand.ack())
+            self.ack_batch_command = helpers.register_script(self.redis, durations + self.PoolCommand.ack_batch())
+            self.get_command = helpers.register_script(self.redis, durations + self.PoolCommand.get())
+            self.renew_command = helpers.register_script(self.redis, durations + self.PoolCommand.renew())
+            self.remove_command = helpers.register_script(self.redis, self.PoolCommand.remove())
+            self.remove_batch_command = helpers.register_script(self.redis, self.PoolCommand.remove_batch())
+        self.stats_command = helpers.register_script(self.redis, self.PoolCommand.stats())
 
-    def get_count(self) -> int:
+    def get_count(self, max_staleness: int=None) -> int:
         """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
         :return: Number of items in the pool
         """
-        return self.redis.zcard(self.name)
+        return self._get_read_redis(max_staleness).zcard(self.name)
 
-    def get_count_to_process(self) -> int:
+    def get_count_to_process(self, max_staleness: int=None) -> int:
         """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
         :return: Number of items in the pool which should be processed
         """
-        return self.redis.zcount(self.name, '-inf', int(time.time()))
+        return self._get_read_redis(max_staleness).zcount(self.name, '-inf', int(time.time()))
+
+    def get_count_in_flight(self, max_staleness: int=None) -> int:
+        """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
+        :return: Number of items in the pool which are being processed, requires lease_index option
+        """
+        self._check_lease_index()
+        return self._get_read_redis(max_staleness).zcount(self.leases_name, '(' + str(int(time.time())), '+inf')
 
-    def is_in_pool(self, item) -> bool:
+    def get_items_in_flight(self, count: int=None, max_staleness: int=None) -> list:
         """
+        :param count: Maximum number of items to be returned, all of them as of default
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
+        :return: List of items being processed with their lease expiry, the soonest to expire first, requires
+                 lease_index option
+        """
+        self._check_lease_index()
+        client = self._get_read_redis(max_staleness)
+        return client.zrangebyscore(self.leases_name, '(' + str(int(time.time())), '+inf', start=0 if count else None,
+                                    num=count, withscores=True)
+
+    def get_stats(self, buckets: tuple=DEFAULT_STATS_BUCKETS) -> dict:
+        """ Returns the backlog statistics of the pool (e.g. for autoscaling) in one round trip
+        :param buckets: Sorted upper bounds of the due time buckets in seconds relative to now, negative for overdue
+        :return: {
+            'due': List of (upper bound, number of items) tuples, the last one with None bound is not bounded. Items
+                   being processed fall into the buckets of their lease expiry.
+            'in_flight': Number of items being processed, None without lease_index option (the leases marked by
+                         the fractional part of the scores could be counted only by scanning all the future items)
+            'oldest_overdue_age': Number of seconds the oldest item is overdue, 0 if no item is overdue
+        }
+        """
+        counts, in_flight, oldest_overdue_age = self.stats_command(keys=self._keys,
+                                                                   args=[int(time.time())] + list(buckets))
+        return {
+            'due': list(zip(list(buckets) + [None], counts)),
+            'in_flight': in_flight if self.options['lease_index'] else None,
+            'oldest_overdue_age': oldest_overdue_age
+        }
+
+    def is_in_pool(self, item, max_staleness: int=None) -> bool:
+        """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
         :return: Checks if the given item is present in the pool
         """
-        return self.redis.zscore(self.name, item) is not None
+        return self._get_read_redis(max_staleness).zscore(self.name, item) is not None
 
-    def add_item(self, item):
+    def add_item(self, item, valid_for: int=None, ack_ttl: int=None):
         """
         :param item: Anything that is convertible to str
+        :param valid_for: Validity of the item after it is acknowledged, ack_valid_for option as of default
+        :param ack_ttl: Acknowledge timeout of the item, ack_ttl option as of default
         """
-        self.redis.zadd(self.name, {item: int(time.time())})
+        pipeline = self.redis.pipeline()
+        pipeline.zadd(self.name, {item: int(time.time()) + self._get_jitter()})
+        if valid_for is not None or ack_ttl is not None:
+            pipeline.hset(self.durations_name, item, self._format_durations(valid_for, ack_ttl))
+        else:
+            pipeline.hdel(self.durations_name, item)
+        pipeline.execute()
         self._wait_for_synced_slaves()
 
-    def add_items(self, items):
+    def add_items(self, items, valid_for=None, ack_ttl=None):
         """
         :param items: List of items to be added via pipeline
+        :param valid_for: Validity of the items after they are acknowledged, either int for all the items or dict
+                          item -> int, ack_valid_for option as of default
+        :param ack_ttl: Acknowledge timeout of the items, either int for all the items or dict item -> int, ack_ttl
+                        option as of default
+        Durations set by an earlier add of the items without them are cleared.
         """
         pipeline = self.redis.pipeline()
         for chunk in helpers.create_chunks(items, self.options['chunk_size']):
             current_time = int(time.time())
             prepared_items = {
-                item: current_time
+                item: current_time + self._get_jitter()
                 for item in chunk
             }
             pipeline.zadd(self.name, prepared_items)
+            prepared_durations = {}
+            default_items = []
+            for item in chunk:
+                item_valid_for = valid_for.get(item) if isinstance(valid_for, dict) else valid_for
+                item_ack_ttl = ack_ttl.get(item) if isinstance(ack_ttl, dict) else ack_ttl
+                if item_valid_for is not None or item_ack_ttl is not None:
+                    prepared_durations[item] = self._format_durations(item_valid_for, item_ack_ttl)
+                else:
+                    default_items.append(item)
+            if prepared_durations:
+                pipeline.hset(self.durations_name, mapping=prepared_durations)
+            if default_items:
+                pipeline.hdel(self.durations_name, *default_items)
         pipeline.execute()
         self._wait_for_synced_slaves()
 
@@ -110,7 +219,7 @@ class Pool(object):
         :param count: Number of items to be returned
         :return: List of items
         """
-        return self.get_command(keys=[self.name],
+        return self.get_command(keys=self._keys,
                                 args=[count, int(time.time()), self.options['ack_ttl']])
 
     def get_all_items(self) -> list:
@@ -118,60 +227,182 @@ class Pool(object):
         :return: List of all items
         """
         result = []
-        while True:
-            chunk = self.get_items(self.options['chunk_size'])
+        for chunk in self.iter_items():
             result += chunk
-
-            if len(chunk) < self.options['chunk_size']:
-                break
         return result
 
-    def ack_item(self, item):
+    def iter_items(self, chunk_size: int=None, prefetch: bool=False):
+        """ Leases the items to process chunk by chunk, so the processing can start after the first round trip
+        :param chunk_size: Number of items leased at once (chunk_size option as of default)
+        :param prefetch: Leases the next chunk in a background thread while the current one is being processed.
+                         If the iteration is stopped early, the prefetched chunk is processed again after ack_ttl.
+        :return: Generator of lists of items
+        """
+        chunk_size = chunk_size or self.options['chunk_size']
+        if not prefetch:
+            while True:
+                chunk = self.get_items(chunk_size)
+                if chunk:
+                    yield chunk
+                if len(chunk) < chunk_size:
+                    return
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self.get_items, chunk_size)
+            while True:
+                chunk = future.result()
+                if len(chunk) == chunk_size:
+                    future = executor.submit(self.get_items, chunk_size)
+                if chunk:
+                    yield chunk
+                if len(chunk) < chunk_size:
+                    return
+
+    def ack_item(self, item, valid_for: int=None):
         """ Acknowledges an item that was processed correctly
         :param item: Anything that is convertible to str
+        :param valid_for: Validity of the item after this acknowledgement, the validity set when adding the item (or
+                          ack_valid_for option) as of default
         """
-        self.ack_command(keys=[self.name],
-                         args=[item, int(time.time()) + self.options['ack_valid_for']])
+        self.ack_command(keys=self._keys,
+                         args=[item, int(time.time()), self.options['ack_valid_for'], self._get_jitter(),
+                               '' if valid_for is None else int(valid_for)])
         self._wait_for_synced_slaves()
 
-    def ack_items(self, items):
+    def ack_items(self, items, valid_for=None) -> list:
         """ Acknowledges items that were processed correctly
         :param items: List of items that are convertible to str
+        :param valid_for: Validity of the items after this acknowledgement, either int for all the items or dict
+                          item -> int, the validity set when adding the items (or ack_valid_for option) as of default
+        :return: List of flags telling whether the corresponding item was acknowledged
         """
-        for chunk in helpers.create_chunks(items, self.options['chunk_size']):
-            pipeline = self.redis.pipeline()
+        def ack_chunk(chunk, pipeline):
+            args = [int(time.time()), self.options['ack_valid_for']]
             for item in chunk:
-                self.ack_command(keys=[self.name],
-                                 args=[item, int(time.time()) + self.options['ack_valid_for']])
-            pipeline.execute()
-            self._wait_for_synced_slaves()
+                item_valid_for = valid_for.get(item) if isinstance(valid_for, dict) else valid_for
+                args += [self._get_jitter(), '' if item_valid_for is None else int(item_valid_for), item]
+            self.ack_batch_command(keys=self._keys, args=args, client=pipeline)
+
+        result = [bool(acked) for chunk_result in
+                  helpers.execute_in_chunks(self.redis, items, self.options['chunk_size'], ack_chunk)
+                  for acked in chunk_result]
+        self._wait_for_synced_slaves()
+        return result
+
+    def renew_items(self, items) -> list:
+        """ Extends the lease of items that are still being processed, so they are not handed out again
+        :param items: List of items that are convertible to str
+        :return: List of flags telling whether the lease of the corresponding item was renewed
+        """
+        def renew_chunk(chunk, pipeline):
+            self.renew_command(keys=self._keys, args=[int(time.time()), self.options['ack_ttl']] + list(chunk),
+                               client=pipeline)
+
+        result = [bool(renewed) for chunk_result in
+                  helpers.execute_in_chunks(self.redis, items, self.options['chunk_size'], renew_chunk)
+                  for renewed in chunk_result]
+        self._wait_for_synced_slaves()
+        return result
+
+    def heartbeat(self, items, interval: int=None):
+        """ Renews the lease of the items periodically in a background thread until stopped
+        :param items: List of items that are convertible to str
+        :param interval: Seconds between the renewals (third of the shortest ack_ttl of the items as of default)
+        :return: PoolHeartbeat, already started, usable as a context manager
+        """
+        heartbeat = PoolHeartbeat(self, items, interval or max(1, self._get_shortest_ack_ttl(items) // 3))
+        heartbeat.start()
+        return heartbeat
 
     def remove_item(self, item):
         """ Removes an item that is no longer valid
         :param item: Anything that is convertible to str
         """
-        self.remove_command(keys=[self.name],
+        self.remove_command(keys=self._keys,
                             args=[item])
         self._wait_for_synced_slaves()
 
-    def remove_items(self, items):
-        """ Removes an item that is no longer valid
+    def remove_items(self, items) -> list:
+        """ Removes items that are no longer valid
         :param items: List of items that are convertible to str
+        :return: List of flags telling whether the corresponding item was removed
         """
-        for chunk in helpers.create_chunks(items, self.options['chunk_size']):
-            pipeline = self.redis.pipeline()
-            for item in chunk:
-                self.remove_command(keys=[self.name],
-                                    args=[item])
-            pipeline.execute()
-            self._wait_for_synced_slaves()
-
-    def clear_pool(self):
-        """ Clears all the items from the pool """
-        while True:
-            removed = self.redis.zremrangebyrank(self.name, 0, self.options['chunk_size'])
-            if not removed:
-                break
+        def remove_chunk(chunk, pipeline):
+            self.remove_batch_command(keys=self._keys, args=list(chunk), client=pipeline)
+
+        result = [bool(removed) for chunk_result in
+                  helpers.execute_in_chunks(self.redis, items, self.options['chunk_size'], remove_chunk)
+                  for removed in chunk_result]
+        self._wait_for_synced_slaves()
+        return result
+
+    def clear_pool(self, chunked: bool=False):
+        """ Clears all the items from the pool, the memory is freed in background (see helpers.purge_keys)
+        :param chunked: Deletes the items in chunks of chunk_size, for servers without UNLINK
+        """
+        helpers.purge_keys(self.redis, self._keys, chunked, self.options['chunk_size'])
+
+    @staticmethod
+    def _format_durations(valid_for: int=None, ack_ttl: int=None) -> str:
+        """
+        :return: Durations of an item as stored in the durations Hash
+        """
+        return '{}:{}'.format('' if valid_for is None else int(valid_for), '' if ack_ttl is None else int(ack_ttl))
+
+    def _get_shortest_ack_ttl(self, items) -> int:
+        """
+        :param items: List of items that are convertible to str
+        :return: Shortest acknowledge timeout of the items, including their per item ack_ttl
+        """
+        ack_ttls = [self.options['ack_ttl']]
+        if items:
+            for durations in self.redis.hmget(self.durations_name, list(items)):
+                durations = durations.decode() if isinstance(durations, bytes) else durations
+                if durations and durations.split(':')[1]:
+                    ack_ttls.append(int(durations.split(':')[1]))
+        return min(ack_ttls)
+
+    def _get_jitter(self) -> int:
+        """
+        :return: Random delay of the due time
+        """
+        if self.options['jitter']:
+            return random.randint(0, self.options['jitter'])
+        return 0
+
+    @property
+    def leases_name(self):
+        """
+        :return: Name of the sorted set of leases
+        """
+        return self.name + LEASES_SUFFIX
+
+    @property
+    def durations_name(self):
+        """
+        :return: Name of the hash of per item durations
+        """
+        return self.name + DURATIONS_SUFFIX
+
+    @property
+    def _keys(self):
+        """
+        :return: Names of the keys the pool scripts operate on
+        """
+        if self.options['lease_index']:
+            return [self.name, self.durations_name, self.leases_name]
+        return [self.name, self.durations_name]
+
+    def _get_read_redis(self, max_staleness: int=None):
+        """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
+        :return: Redis client for read-only commands
+        """
+        return helpers.get_read_client(self.redis, self.options['read_redis'], max_staleness)
+
+    def _check_lease_index(self):
+        if not self.options['lease_index']:
+            raise ValueError('Pool {} is not created with lease_index option'.format(self.name))
 
     def _wait_for_synced_slaves(self):
         if self.options['synced_slaves_enabled']:
@@ -180,6 +411,25 @@ class Pool(object):
 
     class PoolCommand(object):
 
+        @staticmethod
+        def durations():
+            """
+            :return: LUA function reading the per item durations, to be prepended to the scripts
+            """
+            return """
+            local function getDuration(durations, item, index, default)
+                local value = redis.call('hget', durations, item)
+                if not value then
+                    return tonumber(default)
+                end
+                local validFor, ackTTL = string.match(value, '^(%d*):(%d*)$')
+                if index == 1 then
+                    return tonumber(validFor) or tonumber(default)
+                end
+                return tonumber(ackTTL) or tonumber(default)
+            end
+            """
+
         @staticmethod
         def ack():
             """
@@ -187,13 +437,48 @@ class Pool(object):
             """
             return """
             local pool = KEYS[1]
+            local durations = KEYS[2]
             local item = ARGV[1]
-            local validUntil = ARGV[2]
+            local time = tonumber(ARGV[2])
+            local validFor = ARGV[3]
+            local jitter = tonumber(ARGV[4])
 
             local score = redis.call('zscore', pool, item)
             if score and score - math.floor(score) > 0.01 then
-                redis.call('zadd', pool, validUntil, item)
+                validFor = tonumber(ARGV[5]) or getDuration(durations, item, 1, validFor)
+                redis.call('zadd', pool, time + validFor + jitter, item)
+            end
+            """
+
+        @staticmethod
+        def ack_batch():
+            """
+            :return: LUA Script for batch ACK command, items are passed as triples of jitter, validity (empty for
+                     the default) and item
+            """
+            return """
+            local pool = KEYS[1]
+            local durations = KEYS[2]
+            local time = tonumber(ARGV[1])
+            local validFor = ARGV[2]
+
+            local result = {}
+            local score
+            local item
+            local itemValidFor
+            for i = 3, #ARGV, 3 do
+                item = ARGV[i + 2]
+                score = redis.call('zscore', pool, item)
+                if score and score - math.floor(score) > 0.01 then
+                    itemValidFor = tonumber(ARGV[i + 1]) or getDuration(durations, item, 1, validFor)
+                    redis.call('zadd', pool, time + itemValidFor + ARGV[i], item)
+                    table.insert(result, 1)
+                else
+                    table.insert(result, 0)
+                end
             end
+
+            return result
             """
 
         @staticmethod
@@ -203,6 +488,7 @@ class Pool(object):
             """
             return """
             local pool = KEYS[1]
+            local durations = KEYS[2]
             local size = ARGV[1]
             local time = ARGV[2]
             local ackTTL = ARGV[3]
@@ -215,13 +501,39 @@ class Pool(object):
             for i = 1, #result, 2 do
                 value = result[i]
                 score = math.floor(result[i + 1])
-                redis.call('zadd', pool, score + tonumber(ackTTL) + 0.1, value)
+                redis.call('zadd', pool, score + getDuration(durations, value, 2, ackTTL) + 0.1, value)
                 table.insert(finalResult, value)
             end
 
             return finalResult
             """
 
+        @staticmethod
+        def renew():
+            """
+            :return: LUA Script for RENEW command
+            """
+            return """
+            local pool = KEYS[1]
+            local durations = KEYS[2]
+            local time = tonumber(ARGV[1])
+            local ackTTL = ARGV[2]
+
+            local result = {}
+            local score
+            for i = 3, #ARGV, 1 do
+                score = redis.call('zscore', pool, ARGV[i])
+                if score and score - math.floor(score) > 0.01 then
+                    redis.call('zadd', pool, time + getDuration(durations, ARGV[i], 2, ackTTL) + 0.1, ARGV[i])
+                    table.insert(result, 1)
+                else
+                    table.insert(result, 0)
+                end
+            end
+
+            return result
+            """
+
         @staticmethod
         def remove():
             """
@@ -229,10 +541,271 @@ class Pool(object):
             """
             return """
             local pool = KEYS[1]
+            local durations = KEYS[2]
             local item = ARGV[1]
 
             local score = redis.call('zscore', pool, item)
             if score and score - math.floor(score) > 0.01 then
                 redis.call('zrem', pool, item)
+                redis.call('hdel', durations, item)
+            end
+            """
+
+        @staticmethod
+        def remove_batch():
+            """
+            :return: LUA Script for batch REMOVE command
+            """
+            return """
+            local pool = KEYS[1]
+            local durations = KEYS[2]
+
+            local result = {}
+            local score
+            for i = 1, #ARGV, 1 do
+                score = redis.call('zscore', pool, ARGV[i])
+                if score and score - math.floor(score) > 0.01 then
+                    redis.call('zrem', pool, ARGV[i])
+                    redis.call('hdel', durations, ARGV[i])
+                    table.insert(result, 1)
+                else
+                    table.insert(result, 0)
+                end
+            end
+
+            return result
+            """
+
+        @staticmethod
+        def get_indexed():
+            """
+            :return: LUA Script for GET command with lease index
+            """
+            return """
+            local pool = KEYS[1]
+            local durations = KEYS[2]
+            local leases = KEYS[3]
+            local size = ARGV[1]
+            local time = tonumber(ARGV[2])
+            local ackTTL = ARGV[3]
+
+            local result = redis.call('zrangebyscore', pool, '-inf', time, 'LIMIT', 0, size)
+            local i
+            local leaseUntil
+            for i = 1, #result, 1 do
+                leaseUntil = time + getDuration(durations, result[i], 2, ackTTL)
+                redis.call('zadd', pool, leaseUntil, result[i])
+                redis.call('zadd', leases, leaseUntil, result[i])
+            end
+
+            return result
+            """
+
+        @staticmethod
+        def ack_indexed():
+            """
+            :return: LUA Script for ACK command with lease index
+            """
+            return """
+            local pool = KEYS[1]
+            local durations = KEYS[2]
+            local leases = KEYS[3]
+            local item = ARGV[1]
+            local time = tonumber(ARGV[2])
+            local validFor = ARGV[3]
+            local jitter = tonumber(ARGV[4])
+
+            if redis.call('zrem', leases, item) == 1 and redis.call('zscore', pool, item) then
+                validFor = tonumber(ARGV[5]) or getDuration(durations, item, 1, validFor)
+                redis.call('zadd', pool, time + validFor + jitter, item)
+            end
+            """
+
+        @staticmethod
+        def ack_batch_indexed():
+            """
+            :return: LUA Script for batch ACK command with lease index, items are passed as triples of jitter,
+                     validity (empty for the default) and item
+            """
+            return """
+            local pool = KEYS[1]
+            local durations = KEYS[2]
+            local leases = KEYS[3]
+            local time = tonumber(ARGV[1])
+            local validFor = ARGV[2]
+
+            local result = {}
+            local item
+            local itemValidFor
+            for i = 3, #ARGV, 3 do
+                item = ARGV[i + 2]
+                if redis.call('zrem', leases, item) == 1 and redis.call('zscore', pool, item) then
+                    itemValidFor = tonumber(ARGV[i + 1]) or getDuration(durations, item, 1, validFor)
+                    redis.call('zadd', pool, time + itemValidFor + ARGV[i], item)
+                    table.insert(result, 1)
+                else
+                    table.insert(result, 0)
+                end
+            end
+
+            return result
+            """
+
+        @staticmethod
+        def renew_indexed():
+            """
+            :return: LUA Script for RENEW command with lease index
+            """
+            return """
+            local pool = KEYS[1]
+            local durations = KEYS[2]
+            local leases = KEYS[3]
+            local time = tonumber(ARGV[1])
+            local ackTTL = ARGV[2]
+
+            local result = {}
+            local leaseUntil
+            for i = 3, #ARGV, 1 do
+                if redis.call('zscore', leases, ARGV[i]) and redis.call('zscore', pool, ARGV[i]) then
+                    leaseUntil = time + getDuration(durations, ARGV[i], 2, ackTTL)
+                    redis.call('zadd', pool, leaseUntil, ARGV[i])
+                    redis.call('zadd', leases, leaseUntil, ARGV[i])
+                    table.insert(result, 1)
+                else
+                    table.insert(result, 0)
+                end
+            end
+
+            return result
+            """
+
+        @staticmethod
+        def remove_indexed():
+            """
+            :return: LUA Script for REMOVE command with lease index
+            """
+            return """
+            local pool = KEYS[1]
+            local durations = KEYS[2]
+            local leases = KEYS[3]
+            local item = ARGV[1]
+
+            if redis.call('zrem', leases, item) == 1 then
+                redis.call('zrem', pool, item)
+                redis.call('hdel', durations, item)
+            end
+            """
+
+        @staticmethod
+        def remove_batch_indexed():
+            """
+            :return: LUA Script for batch REMOVE command with lease index
+            """
+            return """
+            local pool = KEYS[1]
+            local durations = KEYS[2]
+            local leases = KEYS[3]
+
+            local result = {}
+            for i = 1, #ARGV, 1 do
+                if redis.call('zrem', leases, ARGV[i]) == 1 then
+                    redis.call('hdel', durations, ARGV[i])
+                    table.insert(result, redis.call('zrem', pool, ARGV[i]))
+                else
+                    table.insert(result, 0)
+                end
+            end
+
+            return result
+            """
+
+        @staticmethod
+        def stats():
+            """
+            :return: LUA Script for STATS command
+            """
+            return """
+            local pool = KEYS[1]
+            local leases = KEYS[3]
+            local time = tonumber(ARGV[1])
+
+            local counts = {}
+            local lower = '-inf'
+            local upper
+            for i = 2, #ARGV, 1 do
+                upper = time + tonumber(ARGV[i])
+                table.insert(counts, redis.call('zcount', pool, lower, upper))
+                lower = '(' .. upper
+            end
+            table.insert(counts, redis.call('zcount', pool, lower, '+inf'))
+
+            local inFlight = 0
+            if leases then
+                inFlight = redis.call('zcount', leases, '(' .. time, '+inf')
             end
+
+            local oldestOverdueAge = 0
+            local oldest = redis.call('zrange', pool, 0, 0, 'WITHSCORES')
+            if oldest[2] and tonumber(oldest[2]) < time then
+                oldestOverdueAge = math.floor(time - tonumber(oldest[2]))
+            end
+
+            return {counts, inFlight, oldestOverdueAge}
             """
+
+
+class PoolHeartbeat(object):
+    def __init__(self, pool, items, interval: int):
+        """
+        PoolHeartbeat renews the lease of the items being processed in a background thread, so long running jobs can
+        use a short ack_ttl. Stop it (or leave the with block) before acknowledging the items.
+
+        A failed renewal (e.g. a connection error) is logged and retried after the interval. If the last renewal
+        failed, stop raises its error, so the caller knows the leases may have expired.
+
+        :param pool: Pool (or ShardedPool) the items were leased from
+        :param items: List of items that are convertible to str
+        :param interval: Seconds between the renewals
+        """
+        self.pool = pool
+        self.items = list(items)
+        self.interval = interval
+        self.error = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the renewals, raises the error of the last renewal if it failed
+        """
+        self._stop()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _stop(self):
+        self._stopped.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.pool.renew_items(self.items)
+                self.error = None
+            except Exception as e:
+                logger.warning('Renewal of %d leased items failed, retrying in %s seconds: %s', len(self.items),
+                               self.interval, e)
+                self.error = e
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.stop()
+        else:
+            self._stop()
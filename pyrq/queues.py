@@ -13,13 +13,24 @@ limitations under the License.
 import time
 import socket
 import os
+import re
+import hashlib
 
 from pyrq import helpers
 
 CHUNK_SIZE = 10
 PROCESSING_SUFFIX = '-processing'
 PROCESSING_TIMEOUT_SUFFIX = '-timeouts'
+BYTES_SUFFIX = '-bytes'
+PAYLOAD_SUFFIX = '-payload-'
+REFERENCES_SUFFIX = '-references'
+ENQUEUED_SUFFIX = '-enqueued'
+LATENCY_SUFFIX = '-latency'
 PROCESSING_TIMEOUT = 7200  # seconds
+BOUNDED_CHUNK_SIZE = 1000
+BLOCK_POLL_INTERVAL = 0.1  # seconds
+DEFAULT_CLAIM_CHECK_TTL = 604800  # seconds
+DEFAULT_LATENCY_BUCKETS = (0.01, 0.1, 1, 10, 60, 600, 3600)  # seconds
 
 DEFAULT_SYNC_SLAVES_COUNT = 0
 DEFAULT_SYNC_SLAVES_TIMEOUT = 100
@@ -54,6 +65,15 @@ class Queue(object):
             synced_slaves_enabled: bool Enables slave synchronous syncing
             synced_slaves_count: int Number of slaves that need to be synced in order to continue
             synced_slaves_timeout: int Timeout for syncing slaves. If reached, exception is raised
+            read_redis: Redis client for read-only commands (e.g. a replica), the primary is used as of default
+            max_length: int Maximum number of items waiting in the queue, unbounded as of default
+            max_bytes: int Maximum total size of the items waiting in the queue in bytes, unbounded as of default
+            claim_check_threshold: int Items bigger than this number of bytes are stored aside and only their
+                                   reference is queued, disabled as of default
+            claim_check_ttl: int Expiration of the items stored aside in seconds (7 days as of default)
+            track_latency: bool Records the enqueue time of the items and the histograms of their waiting and
+                           processing times, all the producers of the queue must enable it
+            latency_buckets: tuple Sorted upper bounds of the histogram buckets in seconds
         ]
         :return:
         """
@@ -61,65 +81,145 @@ class Queue(object):
         self.redis = redis
         self.name = name
         self.options = kwargs
+        self._get_times = {}
         self._register_commands()
 
     def _register_commands(self):
-        self.ack_command = self.redis.register_script(self.QueueCommand.ack())
-        self.get_command = self.redis.register_script(self.QueueCommand.get())
-        self.reject_command = self.redis.register_script(self.QueueCommand.reject())
-        self.re_enqueue_command = self.redis.register_script(self.QueueCommand.re_enqueue())
-
-    def get_count(self) -> int:
+        if self._is_bounded:
+            self.add_command = helpers.register_script(self.redis, self.QueueCommand.add_bounded())
+        if self.options.get('claim_check_threshold'):
+            self.release_command = helpers.register_script(self.redis, self.QueueCommand.release())
+        self.ack_command = helpers.register_script(self.redis, self.QueueCommand.ack())
+        self.get_command = helpers.register_script(self.redis, self.QueueCommand.get())
+        self.ack_and_get_command = helpers.register_script(self.redis,
+                                                           helpers.ack_batch_prelude() + self.QueueCommand.get())
+        self.reject_command = helpers.register_script(self.redis, self.QueueCommand.reject())
+        self.re_enqueue_command = helpers.register_script(self.redis, self.QueueCommand.re_enqueue())
+
+    def get_count(self, max_staleness: int=None) -> int:
         """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
         :return: Number of items in the queue
         """
-        return self.redis.llen(self.name)
+        return self._get_read_redis(max_staleness).llen(self.name)
 
     def add_item(self, item) -> bool:
         """
         :param item: Anything that is convertible to str
         :return: Returns true if item was inserted into queue, false otherwise
         """
+        if self._is_bounded or self.options.get('claim_check_threshold') or self.options.get('track_latency'):
+            return self.add_items([item]) == 1
+
         result = self.redis.lpush(self.name, item)
         self._wait_for_synced_slaves()
         return result
 
-    def add_items(self, items: list):
+    def add_items(self, items: list, block: bool=False, timeout: int=None) -> int:
         """
         :param items: List of items to be added via pipeline
+        :param block: Waits for the capacity of a bounded queue (max_length or max_bytes option) until all the items
+                      are added, ValueError is raised for an item bigger than max_bytes
+        :param timeout: Maximum number of seconds to wait for the capacity, waits forever as of default
+        :return: Number of items added, a bounded queue adds just the items that fit (from the start of the list)
         """
+        if self._is_bounded:
+            return self._add_items_bounded(items, block, timeout)
+
         pipeline = self.redis.pipeline()
+        items = self._check_in(items, pipeline)
+        timestamp = self._get_timestamp()
 
         for chunk in helpers.create_chunks(items, CHUNK_SIZE):
             pipeline.lpush(self.name, *chunk)
+            if self.options.get('track_latency'):
+                pipeline.lpush(self.enqueued_name, *([timestamp] * len(chunk)))
         pipeline.execute()
         self._wait_for_synced_slaves()
+        return len(items)
+
+    def _add_items_bounded(self, items: list, block: bool, timeout: int) -> int:
+        max_bytes = self.options.get('max_bytes')
+        if max_bytes:
+            for item in items:
+                queued = self._get_reference(item) or item
+                if len(queued if isinstance(queued, bytes) else str(queued).encode('utf-8')) > max_bytes:
+                    raise ValueError('Item bigger than max_bytes {} can never be added'.format(max_bytes))
+
+        if self.options.get('claim_check_threshold'):
+            pipeline = self.redis.pipeline()
+            items = self._check_in(items, pipeline)
+            pipeline.execute()
+
+        deadline = time.time() + timeout if timeout else None
+        added = 0
+        while True:
+            for chunk in helpers.create_chunks(items[added:], BOUNDED_CHUNK_SIZE):
+                chunk_added = self.add_command(keys=[self.name] + self._bytes_keys + self._latency_keys,
+                                               args=[self.options.get('max_length') or 0,
+                                                     self.options.get('max_bytes') or 0,
+                                                     self._get_timestamp()] + list(chunk))
+                added += chunk_added
+                if chunk_added < len(chunk):
+                    break
+            if added == len(items) or not block or (deadline is not None and time.time() >= deadline):
+                break
+            time.sleep(BLOCK_POLL_INTERVAL)
+
+        if self.options.get('claim_check_threshold') and added < len(items):
+            pipeline = self.redis.pipeline()
+            self._release(items[added:], pipeline)
+            pipeline.execute()
+        self._wait_for_synced_slaves()
+        return added
 
     def get_items(self, count: int) -> list:
         """
         :param count: Number of items to be returned
+        :return: List of items, the big items whose storage expired are acknowledged and left out
+        """
+        keys, args = self._get_get_arguments(count)
+        return self._check_out(self._remember_get_times(self.get_command(keys=keys, args=args)), ack_expired=True)
+
+    def ack_and_get(self, acked: list, count: int) -> list:
+        """ Acknowledges the items (e.g. the previous batch) and gets the next ones by a single script call
+        :param acked: List of items that are convertible to str
+        :param count: Number of items to be returned
         :return: List of items
         """
-        return self.get_command(keys=[self.name, self.processing_queue_name, self.timeouts_hash_name],
-                                args=[count, int(time.time())])
+        acked = [self._get_queued_item(item) for item in acked]
+        keys, args = self._get_get_arguments(count)
+        pipeline = self.redis.pipeline()
+        self._record_processing_times(acked, pipeline)
+        if self.options.get('claim_check_threshold'):
+            # the acks releasing the items stored aside go first in the same round trip
+            for item in acked:
+                self._ack(item, pipeline)
+            self.get_command(keys=keys, args=args, client=pipeline)
+        else:
+            self.ack_and_get_command(keys=keys, args=args + acked + [keys.index(self.processing_queue_name) + 1,
+                                                                     len(acked)],
+                                     client=pipeline)
+        items = pipeline.execute()[-1]
+        self._wait_for_synced_slaves()
+        return self._check_out(self._remember_get_times(items), ack_expired=True)
 
     def ack_item(self, item):
         """
         :param item: Anything that is convertible to str
         :return: Success
         """
-        self.ack_command(keys=[self.processing_queue_name, self.timeouts_hash_name],
-                         args=[str(item)])
-        self._wait_for_synced_slaves()
+        self.ack_items([item])
 
     def ack_items(self, items: list):
         """
         :param items: List of items that are convertible to str
         """
         pipeline = self.redis.pipeline()
+        items = [self._get_queued_item(item) for item in items]
         for item in items:
-            self.ack_command(keys=[self.processing_queue_name, self.timeouts_hash_name], args=[str(item)],
-                             client=pipeline)
+            self._ack(item, pipeline)
+        self._record_processing_times(items, pipeline)
         pipeline.execute()
         self._wait_for_synced_slaves()
 
@@ -127,18 +227,20 @@ class Queue(object):
         """
         :param item: Anything that is convertible to str
         """
-        self.reject_command(keys=[self.name, self.processing_queue_name, self.timeouts_hash_name],
-                            args=[str(item)])
-        self._wait_for_synced_slaves()
+        self.reject_items([item])
 
     def reject_items(self, items: list):
         """
         :param items: List of items that are convertible to str
         """
         pipeline = self.redis.pipeline()
+        items = [self._get_queued_item(item) for item in items]
+        timestamp = self._get_timestamp()
         for item in reversed(items):
-            self.reject_command(keys=[self.name, self.processing_queue_name, self.timeouts_hash_name], args=[str(item)],
-                                client=pipeline)
+            self.reject_command(keys=[self.name, self.processing_queue_name,
+                                      self.timeouts_hash_name] + self._bytes_keys + self._latency_keys,
+                                args=[item, timestamp], client=pipeline)
+        self._pop_get_times(items)
         pipeline.execute()
         self._wait_for_synced_slaves()
 
@@ -148,12 +250,14 @@ class Queue(object):
         """
         for queue, value_time in self._get_sorted_processing_queues():
             if int(float(value_time)) + timeout < int(time.time()):
-                self.re_enqueue_command(keys=[self.name, queue, self.timeouts_hash_name])
+                self.re_enqueue_command(keys=[self.name, queue, self.timeouts_hash_name] + self._bytes_keys
+                                        + self._latency_keys, args=[self._get_timestamp()])
         self._wait_for_synced_slaves()
 
     def re_enqueue_all_items(self):
         for queue, value_time in self._get_sorted_processing_queues():
-            self.re_enqueue_command(keys=[self.name, queue, self.timeouts_hash_name])
+            self.re_enqueue_command(keys=[self.name, queue, self.timeouts_hash_name] + self._bytes_keys
+                                    + self._latency_keys, args=[self._get_timestamp()])
         self._wait_for_synced_slaves()
 
     def drop_timeout_items(self, timeout: int=PROCESSING_TIMEOUT):
@@ -172,9 +276,269 @@ class Queue(object):
             self.redis.hdel(self.timeouts_hash_name, queue)
         self._wait_for_synced_slaves()
 
+    def clear_queue(self, chunked: bool=False):
+        """ Clears all the items from the queue including the processing queues and the items stored aside, the memory
+        is freed in background
+        :param chunked: Deletes the items in chunks, for servers without UNLINK (see helpers.purge_keys)
+        """
+        processing_queues = [queue for queue, value_time in self._get_sorted_processing_queues()]
+        helpers.purge_keys(self.redis, [self.name] + processing_queues + [self.timeouts_hash_name] + self._bytes_keys
+                           + self._latency_keys, chunked)
+        if self.options.get('claim_check_threshold'):
+            # the stored items and their reference counters are found by SCAN, so the server is not blocked
+            pattern = re.sub(r'([*?\[\]\\])', r'\\\1', self.name + PAYLOAD_SUFFIX) + '*'
+            helpers.purge_keys(self.redis, self.redis.scan_iter(match=pattern, count=BOUNDED_CHUNK_SIZE), chunked)
+        self._wait_for_synced_slaves()
+
+    def get_latency_stats(self, max_staleness: int=None) -> dict:
+        """ Returns the latency histograms of the queue (track_latency option) in one round trip
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
+        :return: {
+            'wait': List of (upper bound, number of items) tuples of the time the items waited in the queue before
+                    they were got, the last one with None bound is not bounded. Rejected and re-enqueued items wait
+                    since they returned to the queue.
+            'processing': Same histogram of the time between getting and acknowledging the items, the items are
+                          counted by the instance which got them
+        }
+        """
+        bounds = list(self._latency_buckets) + [None]
+        fields = [kind + ':' + self._get_latency_bucket_name(bound)
+                  for kind in ['wait', 'processing'] for bound in bounds]
+        counts = [int(count or 0) for count in self._get_read_redis(max_staleness).hmget(self.latency_name, fields)]
+        return {
+            'wait': list(zip(bounds, counts[:len(bounds)])),
+            'processing': list(zip(bounds, counts[len(bounds):]))
+        }
+
+    def oldest_item_age(self, max_staleness: int=None):
+        """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
+        :return: Number of seconds the next item to be got waits in the queue, 0 for an empty queue, None without
+                 track_latency option
+        """
+        if not self.options.get('track_latency'):
+            return None
+        enqueued_at = self._get_read_redis(max_staleness).lindex(self.enqueued_name, -1)
+        if enqueued_at is None:
+            return 0
+        return max(0, time.time() - float(enqueued_at))
+
+    def _get_reference(self, item):
+        """
+        :param item: Anything that is convertible to str
+        :return: Reference of the item stored aside (name of its content addressed key), None for small items
+        """
+        threshold = self.options.get('claim_check_threshold')
+        if not threshold:
+            return None
+        encoded = item if isinstance(item, bytes) else str(item).encode('utf-8')
+        if len(encoded) <= threshold:
+            return None
+        return self.name + PAYLOAD_SUFFIX + hashlib.sha1(encoded).hexdigest()
+
+    def _get_queued_item(self, item) -> str:
+        """
+        :param item: Anything that is convertible to str
+        :return: Value of the item in the queue - the reference for the big items, str of the item otherwise
+        """
+        return self._get_reference(item) or str(item)
+
+    def _check_in(self, items: list, pipeline) -> list:
+        """
+        Stores the big items aside (same items share the storage, counting their references)
+        :param items: List of items
+        :param pipeline: Pipeline to store the items with
+        :return: List of items to be queued
+        """
+        if not self.options.get('claim_check_threshold'):
+            return items
+        ttl = self.options.get('claim_check_ttl') or DEFAULT_CLAIM_CHECK_TTL
+        result = []
+        for item in items:
+            reference = self._get_reference(item)
+            if reference:
+                pipeline.set(reference, item, ex=ttl)
+                pipeline.incr(reference + REFERENCES_SUFFIX)
+                pipeline.expire(reference + REFERENCES_SUFFIX, ttl)
+            result.append(reference or item)
+        return result
+
+    def _check_out(self, items: list, ack_expired: bool=False) -> list:
+        """
+        Replaces the references of the items stored aside by the items with a single MGET. The items whose storage
+        expired are left out.
+        :param items: List of items got from the queue
+        :param ack_expired: Acknowledges the left out items, so they do not stay in the processing queue
+        :return: List of items
+        """
+        if not self.options.get('claim_check_threshold'):
+            return items
+        prefix = self.name + PAYLOAD_SUFFIX
+        positions = [i for i, item in enumerate(items)
+                     if (item.decode('utf-8', 'replace') if isinstance(item, bytes) else item).startswith(prefix)]
+        if not positions:
+            return items
+        result = list(items)
+        expired = []
+        for position, payload in zip(positions, self.redis.mget([items[i] for i in positions])):
+            if payload is None:
+                expired.append(position)
+            else:
+                result[position] = payload
+        if expired and ack_expired:
+            pipeline = self.redis.pipeline()
+            for position in expired:
+                self._ack(items[position], pipeline)
+            self._pop_get_times([items[position] for position in expired])
+            pipeline.execute()
+        return [item for position, item in enumerate(result) if position not in expired]
+
+    def _ack(self, item, pipeline):
+        """
+        Removes the item from the processing queue, a reference of the item stored aside is released only if it
+        was removed, so acknowledging an item twice does not delete the storage of its other copies
+        :param item: Item in the queue
+        :param pipeline: Pipeline to acknowledge the item with
+        """
+        keys = [self.processing_queue_name, self.timeouts_hash_name]
+        name = item.decode('utf-8', 'replace') if isinstance(item, bytes) else item
+        if self.options.get('claim_check_threshold') and isinstance(name, str) \
+                and name.startswith(self.name + PAYLOAD_SUFFIX):
+            keys += [name, name + REFERENCES_SUFFIX]
+        self.ack_command(keys=keys, args=[item], client=pipeline)
+
+    def _release(self, items: list, pipeline):
+        """
+        Drops a reference of the items stored aside which were not queued, the item is deleted with its last reference
+        :param items: List of items checked in
+        :param pipeline: Pipeline to release the items with
+        """
+        if not self.options.get('claim_check_threshold'):
+            return
+        prefix = self.name + PAYLOAD_SUFFIX
+        for item in items:
+            if isinstance(item, str) and item.startswith(prefix):
+                self.release_command(keys=[item, item + REFERENCES_SUFFIX], client=pipeline)
+
+    def _get_get_arguments(self, count: int) -> tuple:
+        """
+        :param count: Number of items to be returned
+        :return: Keys and arguments of the GET command
+        """
+        keys = [self.name, self.processing_queue_name, self.timeouts_hash_name] + self._bytes_keys + self._latency_keys
+        args = [count, int(time.time())]
+        if self.options.get('track_latency'):
+            args += [self._get_timestamp(), len(self._latency_buckets)] \
+                + [str(bound) for bound in self._latency_buckets]
+        return keys, args
+
+    def _remember_get_times(self, items: list) -> list:
+        """
+        :param items: List of items got from the queue
+        :return: The same list of items
+        """
+        if self.options.get('track_latency'):
+            got_at = time.time()
+            for item in items:
+                self._get_times.setdefault(item.decode('utf-8') if isinstance(item, bytes) else item, []).append(got_at)
+        return items
+
+    def _record_processing_times(self, items: list, pipeline):
+        """
+        :param items: List of acknowledged items in the queue
+        :param pipeline: Pipeline to update the processing histogram with
+        """
+        now = time.time()
+        for got_at in self._pop_get_times(items):
+            pipeline.hincrby(self.latency_name, 'processing:' + self._get_latency_bucket(now - got_at), 1)
+
+    def _pop_get_times(self, items: list) -> list:
+        """
+        :param items: List of items in the queue
+        :return: List of the times the items were got, items not got by this instance are skipped
+        """
+        result = []
+        for item in items:
+            if not self._get_times.get(item):
+                continue
+            result.append(self._get_times[item].pop(0))
+            if not self._get_times[item]:
+                del self._get_times[item]
+        return result
+
+    def _get_latency_bucket(self, seconds: float) -> str:
+        """
+        :return: Name of the histogram bucket of the duration
+        """
+        for bound in self._latency_buckets:
+            if seconds <= bound:
+                return self._get_latency_bucket_name(bound)
+        return self._get_latency_bucket_name(None)
+
+    @staticmethod
+    def _get_latency_bucket_name(bound) -> str:
+        return 'inf' if bound is None else str(bound)
+
+    @staticmethod
+    def _get_timestamp() -> str:
+        return '{:.3f}'.format(time.time())
+
     def _get_sorted_processing_queues(self):
         return sorted(self.redis.hscan_iter(self.timeouts_hash_name), reverse=True)
 
+    def _get_read_redis(self, max_staleness: int=None):
+        """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
+        :return: Redis client for read-only commands
+        """
+        return helpers.get_read_client(self.redis, self.options.get('read_redis'), max_staleness)
+
+    @property
+    def _is_bounded(self):
+        """
+        :return: True if the queue has max_length or max_bytes option
+        """
+        return bool(self.options.get('max_length') or self.options.get('max_bytes'))
+
+    @property
+    def bytes_name(self):
+        """
+        :return: Name of the counter of bytes waiting in the queue
+        """
+        return self.name + BYTES_SUFFIX
+
+    @property
+    def _bytes_keys(self):
+        """
+        :return: Names of the keys tracking the size of the queue
+        """
+        return [self.bytes_name] if self.options.get('max_bytes') else []
+
+    @property
+    def _latency_buckets(self):
+        return self.options.get('latency_buckets') or DEFAULT_LATENCY_BUCKETS
+
+    @property
+    def _latency_keys(self):
+        """
+        :return: Names of the keys tracking the latency of the queue
+        """
+        return [self.enqueued_name, self.latency_name] if self.options.get('track_latency') else []
+
+    @property
+    def enqueued_name(self):
+        """
+        :return: Name of the list of enqueue times, it is aligned with the queue
+        """
+        return self.name + ENQUEUED_SUFFIX
+
+    @property
+    def latency_name(self):
+        """
+        :return: Name of the hash of latency histograms
+        """
+        return self.name + LATENCY_SUFFIX
+
     @property
     def processing_queue_name(self):
         """
@@ -199,6 +563,62 @@ class Queue(object):
 
     class QueueCommand(object):
 
+        @staticmethod
+        def release():
+            """
+            :return: LUA Script for RELEASE command of the items stored aside
+            """
+            return """
+            local payload = KEYS[1]
+            local references = KEYS[2]
+
+            if redis.call('decr', references) <= 0 then
+                redis.call('del', payload, references)
+            end
+            """
+
+        @staticmethod
+        def add_bounded():
+            """
+            :return: LUA Script for ADD command of bounded queue, adds the items until the queue is full
+            """
+            return """
+            local queue = KEYS[1]
+            local bytes = (#KEYS == 2 or #KEYS == 4) and KEYS[2] or nil
+            local enqueued = #KEYS >= 3 and KEYS[#KEYS - 1] or nil
+            local maxLength = tonumber(ARGV[1])
+            local maxBytes = tonumber(ARGV[2])
+            local time = ARGV[3]
+
+            local length = redis.call('llen', queue)
+            local size = 0
+            if bytes then
+                size = tonumber(redis.call('get', bytes) or 0)
+            end
+            local addedBytes = 0
+            local added = 0
+            for i = 4, #ARGV, 1 do
+                if maxLength > 0 and length + added >= maxLength then
+                    break
+                end
+                if maxBytes > 0 and size + addedBytes + #ARGV[i] > maxBytes then
+                    break
+                end
+                redis.call('lpush', queue, ARGV[i])
+                if enqueued then
+                    redis.call('lpush', enqueued, time)
+                end
+                added = added + 1
+                addedBytes = addedBytes + #ARGV[i]
+            end
+
+            if bytes and addedBytes > 0 then
+                redis.call('incrby', bytes, addedBytes)
+            end
+
+            return added
+            """
+
         @staticmethod
         def ack():
             """
@@ -207,10 +627,16 @@ class Queue(object):
             return """
             local processing = KEYS[1]
             local timeouts = KEYS[2]
+            local payload = KEYS[3]
+            local references = KEYS[4]
             local item = ARGV[1]
 
             local result = redis.call('lrem', processing, -1, item)
 
+            if result > 0 and payload and redis.call('decr', references) <= 0 then
+                redis.call('del', payload, references)
+            end
+
             local count = redis.call('llen', processing)
             if count == 0 then
                redis.call('hdel', timeouts, processing)
@@ -226,11 +652,15 @@ class Queue(object):
             local queue = KEYS[1]
             local processing = KEYS[2]
             local timeouts = KEYS[3]
+            local bytes = (#KEYS == 4 or #KEYS == 6) and KEYS[4] or nil
+            local enqueued = #KEYS >= 5 and KEYS[#KEYS - 1] or nil
+            local latency = #KEYS >= 5 and KEYS[#KEYS] or nil
             local size = ARGV[1]
             local time = ARGV[2]
 
             local item
             local items = {}
+            local removedBytes = 0
 
             redis.call('hset', timeouts, processing, time)
 
@@ -242,6 +672,28 @@ class Queue(object):
                 end
 
                 table.insert(items, item)
+                removedBytes = removedBytes + #item
+            end
+
+            if bytes and removedBytes > 0 then
+                redis.call('decrby', bytes, removedBytes)
+            end
+
+            if enqueued then
+                local now = tonumber(ARGV[3])
+                for i = 1, #items, 1 do
+                    local enqueuedAt = redis.call('rpop', enqueued)
+                    if enqueuedAt then
+                        local bucket = 'inf'
+                        for j = 5, 4 + tonumber(ARGV[4]), 1 do
+                            if now - tonumber(enqueuedAt) <= tonumber(ARGV[j]) then
+                                bucket = ARGV[j]
+                                break
+                            end
+                        end
+                        redis.call('hincrby', latency, 'wait:' .. bucket, 1)
+                    end
+                end
             end
 
             return items
@@ -256,12 +708,20 @@ class Queue(object):
             local queue = KEYS[1]
             local processing = KEYS[2]
             local timeouts = KEYS[3]
+            local bytes = (#KEYS == 4 or #KEYS == 6) and KEYS[4] or nil
+            local enqueued = #KEYS >= 5 and KEYS[#KEYS - 1] or nil
             local item = ARGV[1]
 
             local removed = redis.call('lrem', processing, -1, item)
 
             if removed == 1 then
                 redis.call('rpush', queue, item)
+                if bytes then
+                    redis.call('incrby', bytes, #item)
+                end
+                if enqueued then
+                    redis.call('rpush', enqueued, ARGV[2])
+                end
             end
 
             local count = redis.call('llen', processing)
@@ -279,6 +739,8 @@ class Queue(object):
             local queue = KEYS[1]
             local processing = KEYS[2]
             local timeouts = KEYS[3]
+            local bytes = (#KEYS == 4 or #KEYS == 6) and KEYS[4] or nil
+            local enqueued = #KEYS >= 5 and KEYS[#KEYS - 1] or nil
 
             local item
             while true do
@@ -289,6 +751,12 @@ class Queue(object):
                 end
 
                 redis.call('rpush', queue, item)
+                if bytes then
+                    redis.call('incrby', bytes, #item)
+                end
+                if enqueued then
+                    redis.call('rpush', enqueued, ARGV[1])
+                end
             end
 
             redis.call('hdel', timeouts, processing)
@@ -0,0 +1,208 @@
+"""
+Copyright (c) 2021 Heureka Group a.s. All Rights Reserved.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import zlib
+
+from pyrq.pools import Pool, PoolHeartbeat
+
+DEFAULT_SHARDS_COUNT = 8
+
+
+class ShardedPool(object):
+    def __init__(self, name: str, redis, shards_count: int=DEFAULT_SHARDS_COUNT, **kwargs):
+        """
+        ShardedPool is a Pool which hashes the items across multiple Sorted Sets (shards), so a huge pool is not
+        a single hot key. Every shard is a regular Pool with its own hash tag in the name, so all the keys of one
+        shard live in the same cluster slot while different shards are spread over the cluster.
+
+        Getting the items merges the due items across the shards (starting with a different shard every time),
+        acknowledging and removing the items is routed to the shard of each item.
+
+        :param name: Name of the pool
+        :param redis: Redis client
+        :param shards_count: Number of shards, must not be changed for an existing pool
+        :param **kwargs: Options of the shard pools, see Pool
+        """
+        self.redis = redis
+        self.name = name
+        self.shards = [Pool(self._get_shard_name(index), redis, **kwargs) for index in range(shards_count)]
+        self._next_shard = 0
+
+    def get_count(self, max_staleness: int=None) -> int:
+        """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
+        :return: Number of items in the pool
+        """
+        pipeline = self.shards[0]._get_read_redis(max_staleness).pipeline(transaction=False)
+        for shard in self.shards:
+            pipeline.zcard(shard.name)
+        return sum(pipeline.execute())
+
+    def get_count_to_process(self, max_staleness: int=None) -> int:
+        """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
+        :return: Number of items in the pool which should be processed
+        """
+        return sum(shard.get_count_to_process(max_staleness) for shard in self.shards)
+
+    def is_in_pool(self, item, max_staleness: int=None) -> bool:
+        """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
+        :return: Checks if the given item is present in the pool
+        """
+        return self._get_shard(item).is_in_pool(item, max_staleness)
+
+    def add_item(self, item, valid_for: int=None, ack_ttl: int=None):
+        """
+        :param item: Anything that is convertible to str
+        :param valid_for: Validity of the item after it is acknowledged, see Pool.add_item
+        :param ack_ttl: Acknowledge timeout of the item, see Pool.add_item
+        """
+        self._get_shard(item).add_item(item, valid_for, ack_ttl)
+
+    def add_items(self, items, valid_for=None, ack_ttl=None):
+        """
+        :param items: List of items to be added
+        :param valid_for: Validity of the items after they are acknowledged, see Pool.add_items
+        :param ack_ttl: Acknowledge timeout of the items, see Pool.add_items
+        """
+        for shard, shard_items in self._group_by_shard(items):
+            shard.add_items([item for index, item in shard_items], valid_for, ack_ttl)
+
+    def get_items(self, count: int) -> list:
+        """
+        :param count: Number of items to be returned
+        :return: List of items
+        """
+        result = []
+        start = self._next_shard
+        self._next_shard = (self._next_shard + 1) % len(self.shards)
+        for index in range(len(self.shards)):
+            shard = self.shards[(start + index) % len(self.shards)]
+            result += shard.get_items(count - len(result))
+            if len(result) >= count:
+                break
+        return result
+
+    def get_all_items(self) -> list:
+        """
+        :return: List of all items
+        """
+        result = []
+        for shard in self.shards:
+            result += shard.get_all_items()
+        return result
+
+    def ack_item(self, item, valid_for: int=None):
+        """ Acknowledges an item that was processed correctly
+        :param item: Anything that is convertible to str
+        :param valid_for: Validity of the item after this acknowledgement, see Pool.ack_item
+        """
+        self._get_shard(item).ack_item(item, valid_for)
+
+    def ack_items(self, items, valid_for=None) -> list:
+        """ Acknowledges items that were processed correctly
+        :param items: List of items that are convertible to str
+        :param valid_for: Validity of the items after this acknowledgement, see Pool.ack_items
+        :return: List of flags telling whether the corresponding item was acknowledged
+        """
+        result = [False] * len(items)
+        for shard, shard_items in self._group_by_shard(items):
+            acked = shard.ack_items([item for index, item in shard_items], valid_for)
+            for (index, item), flag in zip(shard_items, acked):
+                result[index] = flag
+        return result
+
+    def renew_items(self, items) -> list:
+        """ Extends the lease of items that are still being processed
+        :param items: List of items that are convertible to str
+        :return: List of flags telling whether the lease of the corresponding item was renewed
+        """
+        result = [False] * len(items)
+        for shard, shard_items in self._group_by_shard(items):
+            renewed = shard.renew_items([item for index, item in shard_items])
+            for (index, item), flag in zip(shard_items, renewed):
+                result[index] = flag
+        return result
+
+    def heartbeat(self, items, interval: int=None):
+        """ Renews the lease of the items periodically in a background thread until stopped
+        :param items: List of items that are convertible to str
+        :param interval: Seconds between the renewals (third of the shortest ack_ttl of the items as of default)
+        :return: PoolHeartbeat, already started, usable as a context manager
+        """
+        if not interval:
+            ack_ttl = min([self.shards[0].options['ack_ttl']]
+                          + [shard._get_shortest_ack_ttl([item for index, item in shard_items])
+                             for shard, shard_items in self._group_by_shard(items)])
+            interval = max(1, ack_ttl // 3)
+        heartbeat = PoolHeartbeat(self, items, interval)
+        heartbeat.start()
+        return heartbeat
+
+    def remove_item(self, item):
+        """ Removes an item that is no longer valid
+        :param item: Anything that is convertible to str
+        """
+        self._get_shard(item).remove_item(item)
+
+    def remove_items(self, items) -> list:
+        """ Removes items that are no longer valid
+        :param items: List of items that are convertible to str
+        :return: List of flags telling whether the corresponding item was removed
+        """
+        result = [False] * len(items)
+        for shard, shard_items in self._group_by_shard(items):
+            removed = shard.remove_items([item for index, item in shard_items])
+            for (index, item), flag in zip(shard_items, removed):
+                result[index] = flag
+        return result
+
+    def clear_pool(self, chunked: bool=False):
+        """ Clears all the items from the pool
+        :param chunked: Deletes the items in chunks, for servers without UNLINK
+        """
+        for shard in self.shards:
+            shard.clear_pool(chunked)
+
+    def _get_shard_name(self, index: int) -> str:
+        """
+        :param index: Index of the shard
+        :return: Name of the shard with hash tag
+        """
+        return '{' + self.name + '-' + str(index) + '}'
+
+    def _get_shard(self, item) -> Pool:
+        """
+        :param item: Anything that is convertible to str
+        :return: Shard the item belongs to
+        """
+        return self.shards[self._get_shard_index(item)]
+
+    def _get_shard_index(self, item) -> int:
+        """
+        :param item: Anything that is convertible to str, bytes are hashed as they are stored in Redis
+        :return: Index of the shard the item belongs to
+        """
+        item = item if isinstance(item, bytes) else str(item).encode('utf-8')
+        return zlib.crc32(item) % len(self.shards)
+
+    def _group_by_shard(self, items):
+        """
+        :param items: List of items
+        :return: Generator of (shard, list of (index in items, item)) tuples
+        """
+        groups = {}
+        for index, item in enumerate(items):
+            groups.setdefault(self._get_shard_index(item), []).append((index, item))
+        for shard_index in sorted(groups):
+            yield self.shards[shard_index], groups[shard_index]
@@ -0,0 +1,341 @@
+"""
+Copyright (c) 2021 Heureka Group a.s. All Rights Reserved.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import time
+import socket
+import os
+
+from pyrq import helpers
+
+CHUNK_SIZE = 10
+ADD_CHUNK_SIZE = 1000
+ADD_PIPELINE_CHUNKS = 10
+SEQUENCE_SUFFIX = '-sequence'
+PROCESSING_SUFFIX = '-processing'
+PROCESSING_TIMEOUT_SUFFIX = '-timeouts'
+PROCESSING_TIMEOUT = 7200  # seconds
+
+DEFAULT_SYNC_SLAVES_COUNT = 0
+DEFAULT_SYNC_SLAVES_TIMEOUT = 100
+
+
+class SortedUniqueQueue(object):
+    """
+    SortedUniqueQueue is a unique queue implemented using Sorted Set as the queue, multiple Lists as the processing
+    queues and a Hash as a storage for processing queue timeouts (so you can tell which processing queue is expired).
+    Items are scored by their insertion sequence, so the uniqueness check, moving an item to the head of the queue and
+    popping all cost O(log N) and no separate set of queued items is needed.
+    The items are processed as they were inserted into the queue, rejected and re-enqueued items are processed first,
+    exactly like in UniqueQueue.
+
+    Queue needs a garbage collector process because the queue creates a processing queues every time you request items
+    from it. This process is implemented by the methods reEnqueue* and drop* of this class and they should be called
+    before getting the items or periodically (if you don't care about the order of the items).
+
+    author: Heureka.cz <vyvoj@heureka.cz>
+    """
+
+    def __init__(self, queue_name: str, redis, **kwargs):
+        """
+        :param queue_name: Name of the queue
+        :param redis: Redis client
+        :param **kwargs: [
+            synced_slaves_enabled: bool Enables slave synchronous syncing
+            synced_slaves_count: int Number of slaves that need to be synced in order to continue
+            synced_slaves_timeout: int Timeout for syncing slaves. If reached, exception is raised
+            read_redis: Redis client for read-only commands (e.g. a replica), the primary is used as of default
+        ]
+        :return:
+        """
+        self.client_id = '{0}[{1}][{2}]'.format(socket.gethostname(), os.getpid(), int(time.time()))
+        self.redis = redis
+        self.queue_name = queue_name
+        self.options = kwargs
+        self._register_commands()
+
+    def _register_commands(self):
+        self.add_command = helpers.register_script(self.redis, self.QueueCommand.add())
+        self.ack_command = helpers.register_script(self.redis, self.QueueCommand.ack())
+        self.get_command = helpers.register_script(self.redis, self.QueueCommand.get())
+        self.reject_command = helpers.register_script(self.redis, self.QueueCommand.reject())
+        self.re_enqueue_command = helpers.register_script(self.redis, self.QueueCommand.re_enqueue())
+
+    def get_count(self, max_staleness: int=None) -> int:
+        """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
+        :return: Number of items in the queue
+        """
+        return self._get_read_redis(max_staleness).zcard(self.queue_name)
+
+    def add_item(self, item) -> bool:
+        """
+        :param item: Anything that is convertible to str
+        :return: Returns true if item was inserted into queue, false otherwise
+        """
+        result = self.add_command(keys=[self.queue_name, self.sequence_name], args=[str(item)])
+        self._wait_for_synced_slaves()
+        return result == 1
+
+    def add_items(self, items: list) -> int:
+        """
+        :param items: List of items to be added via pipeline
+        :return: Number of items that were actually inserted into the queue
+        """
+        added = 0
+        # the chunks are sent ADD_PIPELINE_CHUNKS at a time without MULTI, so a bulk load does not block the server
+        pipeline = self.redis.pipeline(transaction=False)
+        for index, chunk in enumerate(helpers.create_chunks(items, ADD_CHUNK_SIZE), 1):
+            self.add_command(keys=[self.queue_name, self.sequence_name], args=[str(item) for item in chunk],
+                             client=pipeline)
+            if index % ADD_PIPELINE_CHUNKS == 0:
+                added += sum(pipeline.execute())
+        added += sum(pipeline.execute())
+
+        self._wait_for_synced_slaves()
+        return added
+
+    def get_items(self, count: int) -> list:
+        """
+        :param count: Number of items to be returned
+        :return: List of items
+        """
+        return self.get_command(keys=[self.queue_name, self.processing_queue_name, self.timeouts_hash_name],
+                                args=[count, int(time.time())])
+
+    def ack_item(self, item):
+        """
+        :param item: Anything that is convertible to str
+        """
+        self.ack_command(keys=[self.processing_queue_name, self.timeouts_hash_name],
+                         args=[str(item)])
+        self._wait_for_synced_slaves()
+
+    def ack_items(self, items: list):
+        """
+        :param items: List of items that are convertible to str
+        """
+        pipeline = self.redis.pipeline()
+        for item in items:
+            self.ack_command(keys=[self.processing_queue_name, self.timeouts_hash_name],
+                             args=[str(item)],
+                             client=pipeline)
+        pipeline.execute()
+        self._wait_for_synced_slaves()
+
+    def reject_item(self, item):
+        """
+        :param item: Anything that is convertible to str
+        """
+        self.reject_command(keys=[self.queue_name, self.sequence_name, self.processing_queue_name,
+                                  self.timeouts_hash_name],
+                            args=[str(item)])
+        self._wait_for_synced_slaves()
+
+    def reject_items(self, items: list):
+        """
+        :param items: List of items that are convertible to str
+        """
+        pipeline = self.redis.pipeline()
+        for item in reversed(items):
+            self.reject_command(keys=[self.queue_name, self.sequence_name, self.processing_queue_name,
+                                      self.timeouts_hash_name],
+                                args=[str(item)],
+                                client=pipeline)
+        pipeline.execute()
+        self._wait_for_synced_slaves()
+
+    def re_enqueue_timeout_items(self, timeout: int=PROCESSING_TIMEOUT):
+        """
+        :param timeout: int seconds
+        """
+        for queue, value_time in self._get_sorted_processing_queues():
+            if int(float(value_time)) + timeout < int(time.time()):
+                self.re_enqueue_command(keys=[self.queue_name, self.sequence_name, queue, self.timeouts_hash_name])
+        self._wait_for_synced_slaves()
+
+    def re_enqueue_all_items(self):
+        for queue, value_time in self._get_sorted_processing_queues():
+            self.re_enqueue_command(keys=[self.queue_name, self.sequence_name, queue, self.timeouts_hash_name])
+        self._wait_for_synced_slaves()
+
+    def drop_timeout_items(self, timeout: int=PROCESSING_TIMEOUT):
+        """
+        :param timeout: int seconds
+        """
+        for queue, value_time in self._get_sorted_processing_queues():
+            if int(float(value_time)) + timeout < int(time.time()):
+                self.redis.delete(queue)
+                self.redis.hdel(self.timeouts_hash_name, queue)
+        self._wait_for_synced_slaves()
+
+    def drop_all_items(self):
+        for queue, value_time in self._get_sorted_processing_queues():
+            self.redis.delete(queue)
+            self.redis.hdel(self.timeouts_hash_name, queue)
+        self._wait_for_synced_slaves()
+
+    def clear_queue(self, chunked: bool=False):
+        """ Clears all the items from the queue including the processing queues and the sequence, the memory is freed
+        in background
+        :param chunked: Deletes the items in chunks, for servers without UNLINK (see helpers.purge_keys)
+        """
+        processing_queues = [queue for queue, value_time in self._get_sorted_processing_queues()]
+        keys = [self.queue_name, self.sequence_name] + processing_queues + [self.timeouts_hash_name]
+        helpers.purge_keys(self.redis, keys, chunked)
+        self._wait_for_synced_slaves()
+
+    def _get_sorted_processing_queues(self):
+        return sorted(self.redis.hscan_iter(self.timeouts_hash_name), reverse=True)
+
+    def _get_read_redis(self, max_staleness: int=None):
+        """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
+        :return: Redis client for read-only commands
+        """
+        return helpers.get_read_client(self.redis, self.options.get('read_redis'), max_staleness)
+
+    @property
+    def sequence_name(self):
+        """
+        :return: Name of the insertion sequence counter
+        """
+        return self.queue_name + SEQUENCE_SUFFIX
+
+    @property
+    def processing_queue_name(self):
+        """
+        :return: Name of the processing queue
+        """
+        return self.queue_name + PROCESSING_SUFFIX + '-' + self.client_id
+
+    @property
+    def timeouts_hash_name(self):
+        """
+        :return: Name of the timeouts hash
+        """
+        return self.queue_name + PROCESSING_TIMEOUT_SUFFIX
+
+    def _wait_for_synced_slaves(self):
+        if self.options.get('synced_slaves_enabled'):
+            count = self.options['synced_slaves_count'] if self.options['synced_slaves_count'] \
+                else DEFAULT_SYNC_SLAVES_COUNT
+            timeout = self.options['synced_slaves_timeout'] if self.options['synced_slaves_timeout'] \
+                else DEFAULT_SYNC_SLAVES_TIMEOUT
+            helpers.wait_for_synced_slaves(self.redis, count, timeout)
+
+    class QueueCommand(object):
+
+        @staticmethod
+        def add():
+            """
+            :return: LUA Script for ADD command
+            """
+            return """
+            local queue = KEYS[1]
+            local sequence = KEYS[2]
+            local added = 0
+            for i = 1, #ARGV, 1 do
+                if not redis.call('zscore', queue, ARGV[i]) then
+                    redis.call('zadd', queue, redis.call('incr', sequence), ARGV[i])
+                    added = added + 1
+                end
+            end
+            return added
+            """
+
+        @staticmethod
+        def ack():
+            """
+            :return: LUA Script for ACK command
+            """
+            return """
+            local processing = KEYS[1]
+            local timeouts = KEYS[2]
+            local item = ARGV[1]
+            local result = redis.call('lrem', processing, -1, item)
+            local count = redis.call('llen', processing)
+            if count == 0 then
+                redis.call('hdel', timeouts, processing)
+            end
+            """
+
+        @staticmethod
+        def get():
+            """
+            :return: LUA Script for GET command
+            """
+            return """
+            local queue = KEYS[1]
+            local processing = KEYS[2]
+            local timeouts = KEYS[3]
+            local size = tonumber(ARGV[1])
+            local time = ARGV[2]
+            redis.call('hset', timeouts, processing, time)
+            if size < 1 then
+                return {}
+            end
+            local items = redis.call('zrange', queue, 0, size - 1)
+            if #items > 0 then
+                redis.call('zremrangebyrank', queue, 0, #items - 1)
+                for i = 1, #items, 1 do
+                    redis.call('lpush', processing, items[i])
+                end
+            end
+            return items
+            """
+
+        @staticmethod
+        def reject():
+            """
+            :return: LUA Script for REJECT command
+            """
+            return """
+            local queue = KEYS[1]
+            local sequence = KEYS[2]
+            local processing = KEYS[3]
+            local timeouts = KEYS[4]
+            local item = ARGV[1]
+            local removed = redis.call('lrem', processing, -1, item)
+            if removed == 1 and not redis.call('zscore', queue, item) then
+                local head = redis.call('zrange', queue, 0, 0, 'WITHSCORES')
+                local score = tonumber(head[2] or redis.call('get', sequence) or 0)
+                redis.call('zadd', queue, score - 1, item)
+            end
+            local count = redis.call('llen', processing)
+            if count == 0 then
+                redis.call('hdel', timeouts, processing)
+            end
+            """
+
+        @staticmethod
+        def re_enqueue():
+            """
+            :return: LUA Script for reject queue
+            """
+            return """
+            local queue = KEYS[1]
+            local sequence = KEYS[2]
+            local processing = KEYS[3]
+            local timeouts = KEYS[4]
+            local head = redis.call('zrange', queue, 0, 0, 'WITHSCORES')
+            local score = tonumber(head[2] or redis.call('get', sequence) or 0)
+            local item
+            while true do
+                item = redis.call('lpop', processing)
+                if not item then
+                    break
+                end
+                score = score - 1
+                redis.call('zadd', queue, score, item)
+            end
+            redis.call('hdel', timeouts, processing)
+            """
@@ -0,0 +1,271 @@
+"""
+Copyright (c) 2021 Heureka Group a.s. All Rights Reserved.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import time
+import socket
+import os
+
+from redis.exceptions import ResponseError
+
+from pyrq import helpers
+
+CHUNK_SIZE = 100
+ITEM_FIELD = 'item'
+DEFAULT_GROUP_NAME = 'pyrq'
+PROCESSING_TIMEOUT = 7200  # seconds
+
+DEFAULT_SYNC_SLAVES_COUNT = 0
+DEFAULT_SYNC_SLAVES_TIMEOUT = 100
+
+
+class StreamQueue(object):
+    """
+    StreamQueue is a queue with the same interface as Queue implemented using Redis Stream (requires Redis 6.2) and
+    a consumer group. The items being processed are the pending entries of the consumer group, so the acknowledgement
+    is O(1) XACK, getting the items can block on the server and the timed out items are reclaimed incrementally
+    (XAUTOCLAIM) without any processing queues to be collected.
+
+    The items are processed as they were inserted into the queue. Unlike Queue, rejected and re-enqueued items are
+    added to the end of the queue, because a Stream can only be appended to. The stream entry IDs of the items being
+    processed are remembered by the instance which got them, so the items must be acknowledged (or rejected) by the
+    same instance. Items of a lost instance are handed out again by re_enqueue_timeout_items.
+
+    The processed entries are deleted from the Stream, so a Stream can be consumed by a single consumer group only.
+
+    author: Heureka.cz <vyvoj@heureka.cz>
+    """
+
+    def __init__(self, name: str, redis, **kwargs):
+        """
+        :param name: Name of the queue (Stream)
+        :param redis: Redis client
+        :param **kwargs: [
+            group_name: str Name of the consumer group, all the instances of the queue must use the same one
+            synced_slaves_enabled: bool Enables slave synchronous syncing
+            synced_slaves_count: int Number of slaves that need to be synced in order to continue
+            synced_slaves_timeout: int Timeout for syncing slaves. If reached, exception is raised
+        ]
+        :return:
+        """
+        self.client_id = '{0}[{1}][{2}]'.format(socket.gethostname(), os.getpid(), int(time.time()))
+        self.redis = redis
+        self.name = name
+        self.options = kwargs
+        self._deliveries = {}
+        self._create_group()
+        self._check_groups()
+
+    def _create_group(self):
+        try:
+            self.redis.xgroup_create(self.name, self.group_name, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def _check_groups(self):
+        """
+        Raises ValueError if the Stream is consumed by another consumer group, whose items would be deleted by
+        the acknowledgements of this group
+        """
+        for group in self.redis.xinfo_groups(self.name):
+            name = group['name'].decode() if isinstance(group['name'], bytes) else group['name']
+            if name != self.group_name:
+                raise ValueError('Stream {} is already consumed by group {}'.format(self.name, name))
+
+    def get_count(self) -> int:
+        """
+        :return: Number of items in the queue, the items being processed are not counted
+        """
+        pipeline = self.redis.pipeline()
+        pipeline.xlen(self.name)
+        pipeline.xpending(self.name, self.group_name)
+        length, pending = pipeline.execute()
+        return length - pending['pending']
+
+    def add_item(self, item) -> bool:
+        """
+        :param item: Anything that is convertible to str
+        :return: Returns true if item was inserted into queue, false otherwise
+        """
+        result = self.redis.xadd(self.name, {ITEM_FIELD: item})
+        self._wait_for_synced_slaves()
+        return bool(result)
+
+    def add_items(self, items: list):
+        """
+        :param items: List of items to be added via pipeline
+        """
+        pipeline = self.redis.pipeline()
+        for item in items:
+            pipeline.xadd(self.name, {ITEM_FIELD: item})
+        pipeline.execute()
+        self._wait_for_synced_slaves()
+
+    def get_items(self, count: int, timeout: int=None) -> list:
+        """
+        :param count: Number of items to be returned
+        :param timeout: Number of seconds to wait for the items if the queue is empty, no waiting as of default
+        :return: List of items
+        """
+        response = self.redis.xreadgroup(self.group_name, self.client_id, {self.name: '>'}, count=count,
+                                         block=int(timeout * 1000) if timeout else None)
+        result = []
+        for stream, entries in response:
+            for entry_id, fields in entries:
+                item = self._get_item(fields)
+                self._deliveries.setdefault(item, []).append(entry_id)
+                result.append(item)
+        return result
+
+    def ack_item(self, item):
+        """
+        :param item: Anything that is convertible to str
+        """
+        self.ack_items([item])
+
+    def ack_items(self, items: list):
+        """
+        :param items: List of items that are convertible to str
+        """
+        entry_ids = self._pop_entry_ids(items)
+        if entry_ids:
+            self._delete_entries(self.redis.pipeline(), entry_ids).execute()
+        self._wait_for_synced_slaves()
+
+    def reject_item(self, item):
+        """
+        :param item: Anything that is convertible to str
+        """
+        self.reject_items([item])
+
+    def reject_items(self, items: list):
+        """
+        :param items: List of items that are convertible to str
+        """
+        rejected = [item for item in items if self._find_delivery(item) is not None]
+        entry_ids = self._pop_entry_ids(rejected)
+        if entry_ids:
+            pipeline = self.redis.pipeline()
+            for item in rejected:
+                pipeline.xadd(self.name, {ITEM_FIELD: item})
+            self._delete_entries(pipeline, entry_ids).execute()
+        self._wait_for_synced_slaves()
+
+    def re_enqueue_timeout_items(self, timeout: int=PROCESSING_TIMEOUT):
+        """
+        :param timeout: int seconds
+        """
+        for entries in self._claim_timeout_entries(timeout):
+            pipeline = self.redis.pipeline()
+            for entry_id, item in entries:
+                pipeline.xadd(self.name, {ITEM_FIELD: item})
+            self._delete_entries(pipeline, [entry_id for entry_id, item in entries]).execute()
+        self._wait_for_synced_slaves()
+
+    def re_enqueue_all_items(self):
+        self.re_enqueue_timeout_items(0)
+
+    def drop_timeout_items(self, timeout: int=PROCESSING_TIMEOUT):
+        """
+        :param timeout: int seconds
+        """
+        for entries in self._claim_timeout_entries(timeout):
+            self._delete_entries(self.redis.pipeline(), [entry_id for entry_id, item in entries]).execute()
+        self._wait_for_synced_slaves()
+
+    def drop_all_items(self):
+        self.drop_timeout_items(0)
+
+    def clear_queue(self, chunked: bool=False):
+        """ Clears all the items from the queue including the items being processed and the consumer group
+        :param chunked: Kept for the interface of Queue, a Stream is always UNLINKed
+        """
+        self.redis.unlink(self.name)
+        self._deliveries = {}
+        self._create_group()
+        self._wait_for_synced_slaves()
+
+    def _claim_timeout_entries(self, timeout: int):
+        """
+        Claims the entries pending for more than timeout seconds chunk by chunk
+        :param timeout: int seconds
+        :return: Generator of lists of (entry id, item) tuples
+        """
+        cursor = '0-0'
+        while True:
+            response = self.redis.execute_command('XAUTOCLAIM', self.name, self.group_name, self.client_id,
+                                                  int(timeout * 1000), cursor, 'COUNT', CHUNK_SIZE)
+            cursor, entries = response[0], response[1]
+            claimed = [(entry[0], self._get_item(entry[1])) for entry in entries if entry]
+            if claimed:
+                yield claimed
+            if cursor in ('0-0', b'0-0'):
+                return
+
+    def _delete_entries(self, pipeline, entry_ids: list):
+        """
+        Acknowledges and deletes the stream entries, so the stream does not grow with the processed items
+        :return: Pipeline
+        """
+        pipeline.xack(self.name, self.group_name, *entry_ids)
+        pipeline.xdel(self.name, *entry_ids)
+        return pipeline
+
+    def _find_delivery(self, item):
+        """
+        :param item: Anything that is convertible to str
+        :return: Key of the item in the deliveries of this instance, None if the item is not being processed
+        """
+        for key in (item, str(item)):
+            if self._deliveries.get(key):
+                return key
+        return None
+
+    def _pop_entry_ids(self, items: list) -> list:
+        """
+        :param items: List of items being processed by this instance
+        :return: Stream entry IDs of the items
+        """
+        entry_ids = []
+        for item in items:
+            key = self._find_delivery(item)
+            if key is None:
+                continue
+            entry_ids.append(self._deliveries[key].pop(0))
+            if not self._deliveries[key]:
+                del self._deliveries[key]
+        return entry_ids
+
+    @staticmethod
+    def _get_item(fields):
+        """
+        :param fields: Fields of the stream entry, as dict or as flat list
+        :return: Item stored in the entry
+        """
+        if not isinstance(fields, dict):
+            fields = dict(zip(fields[::2], fields[1::2]))
+        return fields.get(ITEM_FIELD, fields.get(ITEM_FIELD.encode()))
+
+    @property
+    def group_name(self):
+        """
+        :return: Name of the consumer group
+        """
+        return self.options.get('group_name') or DEFAULT_GROUP_NAME
+
+    def _wait_for_synced_slaves(self):
+        if self.options.get('synced_slaves_enabled'):
+            count = self.options['synced_slaves_count'] if self.options['synced_slaves_count'] \
+                else DEFAULT_SYNC_SLAVES_COUNT
+            timeout = self.options['synced_slaves_timeout'] if self.options['synced_slaves_timeout'] \
+                else DEFAULT_SYNC_SLAVES_TIMEOUT
+            helpers.wait_for_synced_slaves(self.redis, count, timeout)
@@ -0,0 +1,136 @@
+"""
+Copyright (c) 2021 Heureka Group a.s. All Rights Reserved.
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+    http://www.apache.org/licenses/LICENSE-2.0
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import uuid
+
+from pyrq import helpers
+
+CHUNK_SIZE = 100
+PAYLOAD_SUFFIX = '-payload-'
+DEFAULT_PAYLOAD_TTL = 604800  # seconds
+
+DEFAULT_SYNC_SLAVES_COUNT = 0
+DEFAULT_SYNC_SLAVES_TIMEOUT = 100
+
+
+class Topic(object):
+    """
+    Topic publishes the items to many subscriber Queues at once. Every chunk of items is pushed to all the queues by
+    a single script call, so the subscribers get either all of them or none, and the slaves are waited for once per
+    publish.
+
+    With by_reference option the item is stored just once (in a String with payload_ttl expiration) and the
+    subscribers get its reference (name of the String), use resolve_items to load the items back. It saves memory of
+    wide fan-out of big items.
+
+    To use it with Redis Cluster, the topic and the queues must share a hash tag.
+
+    author: Heureka.cz <vyvoj@heureka.cz>
+    """
+
+    def __init__(self, name: str, redis, queues: list, **kwargs):
+        """
+        :param name: Name of the topic, prefix of the stored items
+        :param redis: Redis client
+        :param queues: List of subscriber Queue instances (or their names), queues with max_length, max_bytes,
+                       claim_check_threshold or track_latency option are not supported
+        :param **kwargs: [
+            by_reference: bool Stores the items once and publishes their references
+            payload_ttl: int Expiration of the items stored by reference in seconds
+            synced_slaves_enabled: bool Enables slave synchronous syncing
+            synced_slaves_count: int Number of slaves that need to be synced in order to continue
+            synced_slaves_timeout: int Timeout for syncing slaves. If reached, exception is raised
+        ]
+        """
+        if any(not isinstance(queue, str) and (queue.options.get('max_length') or queue.options.get('max_bytes')
+                                               or queue.options.get('claim_check_threshold')
+                                               or queue.options.get('track_latency')) for queue in queues):
+            raise ValueError('Queues with max_length, max_bytes, claim_check_threshold or track_latency option are not '
+                             'supported')
+        self.redis = redis
+        self.name = name
+        self.queue_names = [queue if isinstance(queue, str) else queue.name for queue in queues]
+        self.options = kwargs
+        self.publish_command = helpers.register_script(self.redis, self.TopicCommand.publish())
+
+    def publish_item(self, item):
+        """
+        :param item: Anything that is convertible to str
+        :return: Reference of the item with by_reference option, the item otherwise
+        """
+        return self.publish_items([item])[0]
+
+    def publish_items(self, items: list) -> list:
+        """
+        :param items: List of items to be pushed to all the queues
+        :return: List of references of the items with by_reference option, the items otherwise
+        """
+        result = []
+        pipeline = self.redis.pipeline()
+        for chunk in helpers.create_chunks(items, CHUNK_SIZE):
+            references = [self._create_reference() for item in chunk] if self.options.get('by_reference') else []
+            self.publish_command(keys=self.queue_names + references,
+                                 args=[len(self.queue_names), self.options.get('payload_ttl', DEFAULT_PAYLOAD_TTL)]
+                                 + list(chunk),
+                                 client=pipeline)
+            result += references or list(chunk)
+        pipeline.execute()
+        self._wait_for_synced_slaves()
+        return result
+
+    def resolve_items(self, references: list) -> list:
+        """
+        :param references: List of references got from the subscriber queue
+        :return: List of the published items, None for the expired ones
+        """
+        if not references:
+            return []
+        return self.redis.mget(references)
+
+    def _create_reference(self) -> str:
+        return self.name + PAYLOAD_SUFFIX + uuid.uuid4().hex
+
+    def _wait_for_synced_slaves(self):
+        if self.options.get('synced_slaves_enabled'):
+            count = self.options['synced_slaves_count'] if self.options['synced_slaves_count'] \
+                else DEFAULT_SYNC_SLAVES_COUNT
+            timeout = self.options['synced_slaves_timeout'] if self.options['synced_slaves_timeout'] \
+                else DEFAULT_SYNC_SLAVES_TIMEOUT
+            helpers.wait_for_synced_slaves(self.redis, count, timeout)
+
+    class TopicCommand(object):
+
+        @staticmethod
+        def publish():
+            """
+            :return: LUA Script for PUBLISH command, keys are the queues followed by the item references (if any)
+            """
+            return """
+            local queuesCount = tonumber(ARGV[1])
+            local ttl = ARGV[2]
+
+            local items = {}
+            for i = 3, #ARGV, 1 do
+                if #KEYS > queuesCount then
+                    redis.call('set', KEYS[queuesCount + i - 2], ARGV[i], 'EX', ttl)
+                    table.insert(items, KEYS[queuesCount + i - 2])
+                else
+                    table.insert(items, ARGV[i])
+                end
+            end
+
+            if #items > 0 then
+                for i = 1, queuesCount, 1 do
+                    redis.call('lpush', KEYS[i], unpack(items))
+                end
+            end
+            """
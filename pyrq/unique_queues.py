@@ -10,6 +10,7 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import math
 import time
 import socket
 import os
@@ -17,13 +18,21 @@ import os
 from pyrq import helpers
 
 CHUNK_SIZE = 10
+ADD_CHUNK_SIZE = 1000
+ADD_PIPELINE_CHUNKS = 10
 SET_QUEUE_SUFFIX = '-unique'
+BLOOM_FILTER_SUFFIX = '-bloom'
+PREVIOUS_BLOOM_FILTER_SUFFIX = '-bloom-previous'
+MAX_BLOOM_FILTER_SIZE = 2 ** 32  # bits, maximum size of a Redis String
+PROCESSED_SUFFIX = '-processed'
 PROCESSING_SUFFIX = '-processing'
 PROCESSING_TIMEOUT_SUFFIX = '-timeouts'
 PROCESSING_TIMEOUT = 7200  # seconds
 
 DEFAULT_SYNC_SLAVES_COUNT = 0
 DEFAULT_SYNC_SLAVES_TIMEOUT = 100
+DEFAULT_BLOOM_FILTER_ERROR_RATE = 0.001
+BLOCK_POLL_INTERVAL = 0.1  # seconds
 
 
 def _create_chunks(items):
@@ -42,6 +51,14 @@ class UniqueQueue(object):
     from it. This process is implemented by the methods reEnqueue* and drop* of this class and they should be called
     before getting the items or periodically (if you don't care about the order of the items).
 
+    When bloom_filter_capacity is set, the Set of queued items is replaced by a Bloom filter stored in a bitmap. Items
+    are then deduplicated against everything added since the last but one rotation of the filter (not only against
+    the waiting items) and a small fraction of new items (bloom_filter_error_rate) is dropped as false positives.
+    The filter has to be rotated by rotate_bloom_filter periodically, roughly every bloom_filter_capacity added items.
+
+    When dedup_window is set, items handed out by get_items are also remembered in an expiring Sorted Set and adding
+    them again is ignored until dedup_window seconds have passed.
+
     author: Jakub Chábek <jakub.chabek@heureka.cz>
     author: Vladimír Kašpar <vladimir.kaspar@heureka.cz>
     author: Heureka.cz <vyvoj@heureka.cz>
@@ -55,6 +72,14 @@ class UniqueQueue(object):
             synced_slaves_enabled: bool Enables slave synchronous syncing
             synced_slaves_count: int Number of slaves that need to be synced in order to continue
             synced_slaves_timeout: int Timeout for syncing slaves. If reached, exception is raised
+            read_redis: Redis client for read-only commands (e.g. a replica), the primary is used as of default
+            bloom_filter_capacity: int Number of items added between two rotations of the Bloom filter, enables
+                                   Bloom filter deduplication
+            bloom_filter_error_rate: float False positive rate of the Bloom filter (0.001 as of default)
+            dedup_window: int Number of seconds the items handed out are ignored by add_item(s), not used together
+                          with the Bloom filter (which remembers the handed out items by itself)
+            max_length: int Maximum number of items waiting in the queue, unbounded as of default, not supported with
+                        bloom_filter_capacity nor dedup_window
         ]
         :return:
         """
@@ -65,46 +90,141 @@ class UniqueQueue(object):
         self._register_commands()
 
     def _register_commands(self):
-        self.add_command = self.redis.register_script(self.QueueCommand.add())
-        self.ack_command = self.redis.register_script(self.QueueCommand.ack())
-        self.get_command = self.redis.register_script(self.QueueCommand.get())
-        self.reject_command = self.redis.register_script(self.QueueCommand.reject())
-        self.re_enqueue_command = self.redis.register_script(self.QueueCommand.re_enqueue())
-
-    def get_count(self) -> int:
+        if self.options.get('max_length') and (self.options.get('bloom_filter_capacity')
+                                               or self.options.get('dedup_window')):
+            raise ValueError('max_length is not supported together with bloom_filter_capacity nor dedup_window')
+
+        if self.options.get('bloom_filter_capacity'):
+            bloom_filter = self.QueueCommand.bloom_filter(*self._get_bloom_filter_parameters())
+            self.add_command = helpers.register_script(self.redis, bloom_filter + self.QueueCommand.add_bloom())
+            self.add_batch_command = helpers.register_script(self.redis,
+                                                             bloom_filter + self.QueueCommand.add_batch_bloom())
+            get = self.QueueCommand.get_bloom()
+            self.reject_command = helpers.register_script(self.redis, bloom_filter + self.QueueCommand.reject_bloom())
+            self.re_enqueue_command = helpers.register_script(self.redis,
+                                                             bloom_filter + self.QueueCommand.re_enqueue_bloom())
+        elif self.options.get('dedup_window'):
+            self.add_command = helpers.register_script(self.redis, self.QueueCommand.add_windowed())
+            self.add_batch_command = self.add_command
+            get = self.QueueCommand.get_windowed()
+            self.reject_command = helpers.register_script(self.redis, self.QueueCommand.reject())
+            self.re_enqueue_command = helpers.register_script(self.redis, self.QueueCommand.re_enqueue())
+        else:
+            self.add_command = helpers.register_script(self.redis, self.QueueCommand.add())
+            self.add_batch_command = helpers.register_script(self.redis, self.QueueCommand.add_batch())
+            if self.options.get('max_length'):
+                self.add_bounded_command = helpers.register_script(self.redis, self.QueueCommand.add_bounded())
+            get = self.QueueCommand.get()
+            self.reject_command = helpers.register_script(self.redis, self.QueueCommand.reject())
+            self.re_enqueue_command = helpers.register_script(self.redis, self.QueueCommand.re_enqueue())
+        self.get_command = helpers.register_script(self.redis, get)
+        self.ack_and_get_command = helpers.register_script(self.redis, helpers.ack_batch_prelude() + get)
+        self.ack_command = helpers.register_script(self.redis, self.QueueCommand.ack())
+
+    def _get_bloom_filter_parameters(self):
         """
+        :return: Size of the Bloom filter in bits and number of its hash functions
+        """
+        capacity = self.options['bloom_filter_capacity']
+        error_rate = self.options.get('bloom_filter_error_rate') or DEFAULT_BLOOM_FILTER_ERROR_RATE
+        size = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        if size > MAX_BLOOM_FILTER_SIZE:
+            message = 'Bloom filter of {} bits exceeds the Redis limit of {} bits, lower bloom_filter_capacity or ' \
+                      'raise bloom_filter_error_rate'
+            raise ValueError(message.format(size, MAX_BLOOM_FILTER_SIZE))
+        hashes = max(1, int(round(size / capacity * math.log(2))))
+        return size, hashes
+
+    def get_count(self, max_staleness: int=None) -> int:
+        """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
         :return: Number of items in the queue
         """
-        return self.redis.llen(self.queue_name)
+        return self._get_read_redis(max_staleness).llen(self.queue_name)
 
     def add_item(self, item) -> bool:
         """
         :param item: Anything that is convertible to str
         """
-        self.add_command(keys=[self.queue_name, self.set_name], args=[str(item)])
+        if self.options.get('max_length'):
+            return self.add_items([item]) == 1
+
+        if self._dedup_window:
+            self.add_command(keys=[self.queue_name, self.set_name, self.processed_set_name],
+                             args=[int(time.time()), str(item)])
+        else:
+            self.add_command(keys=[self.queue_name] + self._unique_keys, args=[str(item)])
 
         self._wait_for_synced_slaves()
 
-    def add_items(self, items: list):
+    def add_items(self, items: list, block: bool=False, timeout: int=None) -> int:
         """
         :param items: List of items to be added via pipeline
+        :param block: Waits for the capacity of a bounded queue (max_length option) until all the items are added
+        :param timeout: Maximum number of seconds to wait for the capacity, waits forever as of default
+        :return: Number of items that were actually inserted into the queue, a bounded queue adds just the items that
+                 fit (from the start of the list)
         """
-        for chunk in helpers.create_chunks(items, CHUNK_SIZE):
-            pipeline = self.redis.pipeline()
-            for item in chunk:
-                self.add_command(keys=[self.queue_name, self.set_name], args=[str(item)], client=pipeline)
-            pipeline.execute()
+        if self.options.get('max_length'):
+            return self._add_items_bounded(items, block, timeout)
+
+        added = 0
+        # the chunks are sent ADD_PIPELINE_CHUNKS at a time without MULTI, so a bulk load does not block the server
+        pipeline = self.redis.pipeline(transaction=False)
+        for index, chunk in enumerate(helpers.create_chunks(items, ADD_CHUNK_SIZE), 1):
+            if self._dedup_window:
+                self.add_batch_command(keys=[self.queue_name, self.set_name, self.processed_set_name],
+                                       args=[int(time.time())] + [str(item) for item in chunk],
+                                       client=pipeline)
+            else:
+                self.add_batch_command(keys=[self.queue_name] + self._unique_keys,
+                                       args=[str(item) for item in chunk],
+                                       client=pipeline)
+            if index % ADD_PIPELINE_CHUNKS == 0:
+                added += sum(pipeline.execute())
+        added += sum(pipeline.execute())
 
         self._wait_for_synced_slaves()
+        return added
+
+    def _add_items_bounded(self, items: list, block: bool, timeout: int) -> int:
+        deadline = time.time() + timeout if timeout else None
+        processed = 0
+        added = 0
+        while True:
+            for chunk in helpers.create_chunks(items[processed:], ADD_CHUNK_SIZE):
+                chunk_processed, chunk_added = self.add_bounded_command(
+                    keys=[self.queue_name, self.set_name],
+                    args=[self.options['max_length']] + [str(item) for item in chunk])
+                processed += chunk_processed
+                added += chunk_added
+                if chunk_processed < len(chunk):
+                    break
+            if processed == len(items) or not block or (deadline is not None and time.time() >= deadline):
+                break
+            time.sleep(BLOCK_POLL_INTERVAL)
+        self._wait_for_synced_slaves()
+        return added
 
     def get_items(self, count: int) -> list:
         """
         :param count: Number of items to be returned
         :return: List of items
         """
-        return self.get_command(keys=[self.queue_name, self.set_name, self.processing_queue_name,
-                                      self.timeouts_hash_name],
-                                args=[count, int(time.time())])
+        keys, args = self._get_get_arguments(count)
+        return self.get_command(keys=keys, args=args)
+
+    def ack_and_get(self, acked: list, count: int) -> list:
+        """ Acknowledges the items (e.g. the previous batch) and gets the next ones by a single script call
+        :param acked: List of items that are convertible to str
+        :param count: Number of items to be returned
+        :return: List of items
+        """
+        keys, args = self._get_get_arguments(count)
+        items = self.ack_and_get_command(keys=keys, args=args + [str(item) for item in acked]
+                                         + [keys.index(self.processing_queue_name) + 1, len(acked)])
+        self._wait_for_synced_slaves()
+        return items
 
     def ack_item(self, item):
         """
@@ -131,7 +251,8 @@ class UniqueQueue(object):
         """
         :param item: Anything that is convertible to str
         """
-        self.reject_command(keys=[self.queue_name, self.set_name, self.processing_queue_name, self.timeouts_hash_name],
+        self.reject_command(keys=[self.queue_name] + self._unique_keys + [self.processing_queue_name,
+                                                                          self.timeouts_hash_name],
                             args=[str(item)])
         self._wait_for_synced_slaves()
 
@@ -141,8 +262,8 @@ class UniqueQueue(object):
         """
         pipeline = self.redis.pipeline()
         for item in reversed(items):
-            self.reject_command(keys=[self.queue_name, self.set_name, self.processing_queue_name,
-                                      self.timeouts_hash_name],
+            self.reject_command(keys=[self.queue_name] + self._unique_keys + [self.processing_queue_name,
+                                                                              self.timeouts_hash_name],
                                 args=[str(item)],
                                 client=pipeline)
         pipeline.execute()
@@ -154,12 +275,12 @@ class UniqueQueue(object):
         """
         for queue, value_time in self._get_sorted_processing_queues():
             if int(float(value_time)) + timeout < int(time.time()):
-                self.re_enqueue_command(keys=[self.queue_name, self.set_name, queue, self.timeouts_hash_name])
+                self.re_enqueue_command(keys=[self.queue_name] + self._unique_keys + [queue, self.timeouts_hash_name])
         self._wait_for_synced_slaves()
 
     def re_enqueue_all_items(self):
         for queue, value_time in self._get_sorted_processing_queues():
-            self.re_enqueue_command(keys=[self.queue_name, self.set_name, queue, self.timeouts_hash_name])
+            self.re_enqueue_command(keys=[self.queue_name] + self._unique_keys + [queue, self.timeouts_hash_name])
         self._wait_for_synced_slaves()
 
     def drop_timeout_items(self, timeout: int=PROCESSING_TIMEOUT):
@@ -178,9 +299,65 @@ class UniqueQueue(object):
             self.redis.hdel(self.timeouts_hash_name, queue)
         self._wait_for_synced_slaves()
 
+    def clear_queue(self, chunked: bool=False):
+        """ Clears all the items from the queue including the processing queues and the uniqueness keys, the memory is
+        freed in background
+        :param chunked: Deletes the items in chunks, for servers without UNLINK (see helpers.purge_keys)
+        """
+        processing_queues = [queue for queue, value_time in self._get_sorted_processing_queues()]
+        keys = [self.queue_name] + self._unique_keys + [self.processed_set_name] + processing_queues \
+            + [self.timeouts_hash_name]
+        helpers.purge_keys(self.redis, keys, chunked)
+        self._wait_for_synced_slaves()
+
+    def rotate_bloom_filter(self):
+        """
+        Starts a new generation of the Bloom filter. Items are deduplicated against the current and the previous
+        generation, so the items added before the previous rotation are forgotten.
+        """
+        if self.redis.exists(self.bloom_filter_name):
+            self.redis.rename(self.bloom_filter_name, self.previous_bloom_filter_name)
+        self._wait_for_synced_slaves()
+
+    def _get_get_arguments(self, count: int) -> tuple:
+        """
+        :param count: Number of items to be returned
+        :return: Keys and arguments of the GET command
+        """
+        if self._dedup_window:
+            return [self.queue_name, self.set_name, self.processing_queue_name, self.timeouts_hash_name,
+                    self.processed_set_name], [count, int(time.time()), self._dedup_window]
+        return [self.queue_name] + self._unique_keys + [self.processing_queue_name, self.timeouts_hash_name], \
+            [count, int(time.time())]
+
     def _get_sorted_processing_queues(self):
         return sorted(self.redis.hscan_iter(self.timeouts_hash_name), reverse=True)
 
+    def _get_read_redis(self, max_staleness: int=None):
+        """
+        :param max_staleness: Maximum lag of the read client in seconds, see helpers.get_read_client
+        :return: Redis client for read-only commands
+        """
+        return helpers.get_read_client(self.redis, self.options.get('read_redis'), max_staleness)
+
+    @property
+    def _dedup_window(self):
+        """
+        :return: Number of seconds the handed out items are ignored by add_item(s), None if disabled
+        """
+        if self.options.get('bloom_filter_capacity'):
+            return None
+        return self.options.get('dedup_window')
+
+    @property
+    def _unique_keys(self):
+        """
+        :return: Names of the keys the uniqueness of the items is checked against
+        """
+        if self.options.get('bloom_filter_capacity'):
+            return [self.bloom_filter_name, self.previous_bloom_filter_name]
+        return [self.set_name]
+
     @property
     def set_name(self):
         """
@@ -188,6 +365,27 @@ class UniqueQueue(object):
         """
         return self.queue_name + SET_QUEUE_SUFFIX
 
+    @property
+    def processed_set_name(self):
+        """
+        :return: Name of the sorted set of the recently handed out items
+        """
+        return self.queue_name + PROCESSED_SUFFIX
+
+    @property
+    def bloom_filter_name(self):
+        """
+        :return: Name of the current Bloom filter
+        """
+        return self.queue_name + BLOOM_FILTER_SUFFIX
+
+    @property
+    def previous_bloom_filter_name(self):
+        """
+        :return: Name of the previous Bloom filter
+        """
+        return self.queue_name + PREVIOUS_BLOOM_FILTER_SUFFIX
+
     @property
     def processing_queue_name(self):
         """
@@ -229,6 +427,81 @@ class UniqueQueue(object):
             end
             """
 
+        @staticmethod
+        def add_batch():
+            """
+            :return: LUA Script for batch ADD command
+            """
+            return """
+            local queue = KEYS[1]
+            local set = KEYS[2]
+            local items = {}
+            local added = 0
+            for i = 1, #ARGV, 1 do
+                if redis.call('sadd', set, ARGV[i]) == 1 then
+                    table.insert(items, ARGV[i])
+                end
+                if #items == 100 or (i == #ARGV and #items > 0) then
+                    redis.call('lpush', queue, unpack(items))
+                    added = added + #items
+                    items = {}
+                end
+            end
+            return added
+            """
+
+        @staticmethod
+        def add_bounded():
+            """
+            :return: LUA Script for ADD command of bounded queue, adds the items until the queue is full
+            """
+            return """
+            local queue = KEYS[1]
+            local set = KEYS[2]
+            local maxLength = tonumber(ARGV[1])
+            local length = redis.call('llen', queue)
+            local processed = 0
+            local added = 0
+            for i = 2, #ARGV, 1 do
+                if redis.call('sismember', set, ARGV[i]) == 0 then
+                    if length + added >= maxLength then
+                        break
+                    end
+                    redis.call('lpush', queue, ARGV[i])
+                    redis.call('sadd', set, ARGV[i])
+                    added = added + 1
+                end
+                processed = processed + 1
+            end
+            return {processed, added}
+            """
+
+        @staticmethod
+        def add_windowed():
+            """
+            :return: LUA Script for ADD command ignoring recently handed out items
+            """
+            return """
+            local queue = KEYS[1]
+            local set = KEYS[2]
+            local processed = KEYS[3]
+            local time = ARGV[1]
+            local items = {}
+            local added = 0
+            redis.call('zremrangebyscore', processed, '-inf', time)
+            for i = 2, #ARGV, 1 do
+                if not redis.call('zscore', processed, ARGV[i]) and redis.call('sadd', set, ARGV[i]) == 1 then
+                    table.insert(items, ARGV[i])
+                end
+                if #items == 100 or (i == #ARGV and #items > 0) then
+                    redis.call('lpush', queue, unpack(items))
+                    added = added + #items
+                    items = {}
+                end
+            end
+            return added
+            """
+
         @staticmethod
         def ack():
             """
@@ -271,6 +544,39 @@ class UniqueQueue(object):
             return items
             """
 
+        @staticmethod
+        def get_windowed():
+            """
+            :return: LUA Script for GET command remembering handed out items
+            """
+            return """
+            local queue = KEYS[1]
+            local set = KEYS[2]
+            local processing = KEYS[3]
+            local timeouts = KEYS[4]
+            local processed = KEYS[5]
+            local size = ARGV[1]
+            local time = ARGV[2]
+            local window = tonumber(ARGV[3])
+            redis.call('hset', timeouts, processing, time)
+            redis.call('zremrangebyscore', processed, '-inf', time)
+            local item
+            local items = {}
+            for i = 1, size, 1 do
+                item = redis.call('rpoplpush', queue, processing)
+                if not item then
+                    break
+                end
+                redis.call('srem', set, item)
+                redis.call('zadd', processed, time + window, item)
+                table.insert(items, item)
+            end
+            if #items > 0 then
+                redis.call('expire', processed, window)
+            end
+            return items
+            """
+
         @staticmethod
         def reject():
             """
@@ -324,3 +630,155 @@ class UniqueQueue(object):
             end
             redis.call('hdel', timeouts, processing)
             """
+
+        @staticmethod
+        def bloom_filter(size: int, hashes: int):
+            """
+            :param size: Size of the Bloom filter in bits
+            :param hashes: Number of hash functions
+            :return: LUA functions for Bloom filter manipulation, to be prepended to the *_bloom scripts
+            """
+            return """
+            local bloomSize = {size}
+            local bloomHashes = {hashes}
+
+            local function bloomPositions(item)
+                local digest = redis.sha1hex(item)
+                local h1 = tonumber(string.sub(digest, 1, 8), 16)
+                local h2 = tonumber(string.sub(digest, 9, 16), 16)
+                local positions = {{}}
+                for i = 0, bloomHashes - 1, 1 do
+                    table.insert(positions, (h1 + i * (h2 + 1)) % bloomSize)
+                end
+                return positions
+            end
+
+            local function bloomContains(bloom, positions)
+                for _, position in ipairs(positions) do
+                    if redis.call('getbit', bloom, position) == 0 then
+                        return false
+                    end
+                end
+                return true
+            end
+
+            local function bloomAdd(bloom, previous, item)
+                local positions = bloomPositions(item)
+                local added = false
+                for _, position in ipairs(positions) do
+                    if redis.call('setbit', bloom, position, 1) == 0 then
+                        added = true
+                    end
+                end
+                return added and not bloomContains(previous, positions)
+            end
+            """.format(size=size, hashes=hashes)
+
+        @staticmethod
+        def add_bloom():
+            """
+            :return: LUA Script for ADD command with Bloom filter
+            """
+            return """
+            local queue = KEYS[1]
+            local bloom = KEYS[2]
+            local previous = KEYS[3]
+            local item = ARGV[1]
+            if bloomAdd(bloom, previous, item) then
+                redis.call('lpush', queue, item)
+            end
+            """
+
+        @staticmethod
+        def add_batch_bloom():
+            """
+            :return: LUA Script for batch ADD command with Bloom filter
+            """
+            return """
+            local queue = KEYS[1]
+            local bloom = KEYS[2]
+            local previous = KEYS[3]
+            local items = {}
+            local added = 0
+            for i = 1, #ARGV, 1 do
+                if bloomAdd(bloom, previous, ARGV[i]) then
+                    table.insert(items, ARGV[i])
+                end
+                if #items == 100 or (i == #ARGV and #items > 0) then
+                    redis.call('lpush', queue, unpack(items))
+                    added = added + #items
+                    items = {}
+                end
+            end
+            return added
+            """
+
+        @staticmethod
+        def get_bloom():
+            """
+            :return: LUA Script for GET command with Bloom filter
+            """
+            return """
+            local queue = KEYS[1]
+            local processing = KEYS[4]
+            local timeouts = KEYS[5]
+            local size = ARGV[1]
+            local time = ARGV[2]
+            redis.call('hset', timeouts, processing, time)
+            local item
+            local items = {}
+            for i = 1, size, 1 do
+                item = redis.call('rpoplpush', queue, processing)
+                if not item then
+                    break
+                end
+                table.insert(items, item)
+            end
+            return items
+            """
+
+        @staticmethod
+        def reject_bloom():
+            """
+            :return: LUA Script for REJECT command with Bloom filter
+            """
+            return """
+            local queue = KEYS[1]
+            local bloom = KEYS[2]
+            local previous = KEYS[3]
+            local processing = KEYS[4]
+            local timeouts = KEYS[5]
+            local item = ARGV[1]
+            local removed = redis.call('lrem', processing, -1, item)
+            if removed == 1 then
+                bloomAdd(bloom, previous, item)
+                redis.call('rpush', queue, item)
+            end
+            local count = redis.call('llen', processing)
+            if count == 0 then
+                redis.call('hdel', timeouts, processing)
+            end
+            """
+
+        @staticmethod
+        def re_enqueue_bloom():
+            """
+            :return: LUA Script for reject queue with Bloom filter
+            """
+            return """
+            local queue = KEYS[1]
+            local bloom = KEYS[2]
+            local previous = KEYS[3]
+            local processing = KEYS[4]
+            local timeouts = KEYS[5]
+            local item
+            while true do
+                item = redis.call('lpop', processing);
+                if not item then
+                    break
+                end
+                bloomAdd(bloom, previous, item)
+                redis.call('rpush', queue, item)
+            end
+            redis.call('hdel', timeouts, processing)
+            """
@@ -0,0 +1,67 @@
+import unittest
+import os
+from unittest.mock import patch
+
+from redis import Redis
+from pyrq.batch_sizes import AdaptiveBatchSize
+from pyrq.queues import Queue
+from pyrq.pools import Pool
+
+QUEUE_NAME = os.getenv('QUEUE_NAME', 'test-queue')
+
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+REDIS_DB = int(os.getenv('REDIS_DB', 0))
+REDIS_PASSWORD = os.getenv('REDIS_PASS', None)
+
+
+@patch('pyrq.helpers.wait_for_synced_slaves')
+class TestAdaptiveBatchSize(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                            decode_responses=True)
+        self.queue_instance = Queue(QUEUE_NAME, self.client)
+
+    def tearDown(self):
+        for key in self.client.keys(QUEUE_NAME + '*'):
+            self.client.delete(key)
+
+    def test_record(self, slaves_mock):
+        batch_size = AdaptiveBatchSize(self.queue_instance, 1, initial_count=10, max_count=100, smoothing=0.5,
+                                       depth_check_interval=0)
+
+        batch_size.record(10, 0.1)
+        self.assertEqual(20, batch_size.get_batch_size())
+        batch_size.record(20, 0.2)
+        self.assertEqual(40, batch_size.get_batch_size())
+        batch_size.record(40, 0.0)
+        self.assertEqual(80, batch_size.get_batch_size())
+        batch_size.record(80, 0.0)
+        self.assertEqual(100, batch_size.get_batch_size())
+
+        batch_size.record(100, 10)
+        self.assertEqual(19, batch_size.get_batch_size())
+        batch_size.record(0, 10)
+        self.assertEqual(19, batch_size.get_batch_size())
+        batch_size.record(19, 1000)
+        self.assertEqual(1, batch_size.get_batch_size())
+
+    def test_queue_depth(self, slaves_mock):
+        batch_size = AdaptiveBatchSize(self.queue_instance, 1, initial_count=10, consumers=2)
+        self.queue_instance.add_items(['a', 'b', 'c', 'd', 'e'])
+
+        self.assertEqual(['a', 'b', 'c'], batch_size.get_items())
+        self.assertEqual(3, batch_size.get_batch_size())
+
+    def test_pool(self, slaves_mock):
+        pool = Pool(QUEUE_NAME, self.client)
+        pool.add_items(['a', 'b'])
+        batch_size = AdaptiveBatchSize(pool, 1, initial_count=10)
+
+        self.assertEqual(['a', 'b'], sorted(batch_size.get_items()))
+        self.assertEqual(2, batch_size.get_batch_size())
+
+
+if __name__ == 'main':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import os
+from collections import Counter
+from unittest.mock import patch
+
+from redis import Redis
+from pyrq.fair_pools import FairPool
+
+POOL_NAME = os.getenv('POOL_NAME', 'test-pool')
+
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+REDIS_DB = int(os.getenv('REDIS_DB', 0))
+REDIS_PASSWORD = os.getenv('REDIS_PASS', None)
+
+TEST_TIME = 1444222459.0
+
+
+@patch('pyrq.helpers.wait_for_synced_slaves')
+class TestFairPool(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                            decode_responses=True)
+        self._delete_keys()
+        self.pool_instance = FairPool(POOL_NAME, self.client, synced_slaves_enabled=True, synced_slaves_count=1,
+                                      synced_slaves_timeout=2)
+
+    def tearDown(self):
+        self._delete_keys()
+
+    def test_add_items(self, slaves_mock):
+        self.pool_instance.add_items(['a-1', 'a-2'], 'a')
+        self.pool_instance.add_item('b-1', 'b')
+        self.pool_instance.add_item('a-2', 'b')
+
+        self.assertEqual(3, self.pool_instance.get_count())
+        self.assertEqual(3, self.pool_instance.get_count_to_process())
+        self.assertEqual(1, self.pool_instance.get_tenant_count('a'))
+        self.assertEqual(2, self.pool_instance.get_tenant_count('b'))
+        self.assertTrue(self.pool_instance.is_in_pool('a-2'))
+        self.assertFalse(self.pool_instance.is_in_pool('c-1'))
+        self.assertEqual({'a', 'b'}, self.client.smembers(self.pool_instance.tenants_name))
+        self.assertEqual(3, slaves_mock.call_count)
+
+    @patch('pyrq.fair_pools.time.time')
+    def test_get_items_is_fair(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        self.pool_instance.add_items(['big-{}'.format(i) for i in range(100)], 'big')
+        self.pool_instance.add_items(['small-1', 'small-2'], 'small')
+
+        items = self.pool_instance.get_items(4)
+        self.assertEqual(Counter({'big': 2, 'small': 2}), Counter(item.split('-')[0] for item in items))
+
+        items = self.pool_instance.get_items(4)
+        self.assertEqual(['big'] * 4, [item.split('-')[0] for item in items])
+        self.assertEqual(94, self.pool_instance.get_count_to_process())
+
+    @patch('pyrq.fair_pools.time.time')
+    def test_get_items_respects_weights(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        self.pool_instance.set_tenant_weight('big', 3)
+        self.pool_instance.add_items(['big-{}'.format(i) for i in range(100)], 'big')
+        self.pool_instance.add_items(['small-{}'.format(i) for i in range(100)], 'small')
+
+        items = self.pool_instance.get_items(8)
+        self.assertEqual(Counter({'big': 6, 'small': 2}), Counter(item.split('-')[0] for item in items))
+
+    @patch('pyrq.fair_pools.time.time')
+    def test_get_items_skips_zero_weight_tenants(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        self.pool_instance.set_tenant_weight('paused', 0)
+        self.pool_instance.add_items(['paused-1', 'paused-2'], 'paused')
+        self.pool_instance.add_items(['active-1'], 'active')
+
+        self.assertEqual(['active-1'], self.pool_instance.get_items(5))
+        self.assertEqual([], self.pool_instance.get_items(5))
+        self.assertEqual(2, self.pool_instance.get_tenant_count('paused'))
+        with self.assertRaises(ValueError):
+            self.pool_instance.set_tenant_weight('paused', -1)
+
+    @patch('pyrq.helpers.PIPELINE_CHUNKS', 2)
+    def test_items_in_several_pipelines(self, slaves_mock):
+        pool_instance = FairPool(POOL_NAME, self.client, chunk_size=1)
+        items = ['a-{}'.format(i) for i in range(5)]
+
+        with patch.object(self.client, 'pipeline', wraps=self.client.pipeline) as pipeline_mock:
+            pool_instance.add_items(items, 'a')
+            self.assertEqual(sorted(items), sorted(pool_instance.get_items(5)))
+            self.assertEqual([True] * 5, pool_instance.ack_items(items))
+            self.assertEqual([False] * 5, pool_instance.remove_items(items))
+        pipeline_mock.assert_called_with(transaction=False)
+        self.assertEqual(3, pipeline_mock.call_count)
+        self.assertEqual(5, pool_instance.get_count())
+
+    @patch('pyrq.fair_pools.time.time')
+    def test_ack_and_remove_items(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        self.pool_instance.add_items(['a-1', 'a-2'], 'a')
+        self.pool_instance.add_items(['b-1'], 'b')
+
+        self.assertEqual(['a-1', 'a-2', 'b-1'], sorted(self.pool_instance.get_items(5)))
+        self.assertEqual([], self.pool_instance.get_items(5))
+        self.assertEqual(TEST_TIME + 600.1, self.client.zscore(self.pool_instance.get_tenant_pool_name('a'), 'a-1'))
+
+        self.assertEqual([True, False], self.pool_instance.ack_items(['a-1', 'missing']))
+        self.assertEqual(TEST_TIME + 129600, self.client.zscore(self.pool_instance.get_tenant_pool_name('a'), 'a-1'))
+        self.assertEqual([False, True, True], self.pool_instance.remove_items(['a-1', 'a-2', 'b-1']))
+
+        self.assertEqual(1, self.pool_instance.get_count())
+        self.assertEqual({'a'}, self.client.smembers(self.pool_instance.tenants_name))
+
+        time_mock.return_value = TEST_TIME + 700
+        self.assertEqual([], self.pool_instance.get_items(5))
+
+    def test_clear_pool(self, slaves_mock):
+        self.pool_instance.set_tenant_weight('a', 2)
+        self.pool_instance.add_items(['a-1', 'a-2'], 'a')
+        self.pool_instance.add_items(['b-1'], 'b')
+        self.pool_instance.get_items(1)
+
+        self.pool_instance.clear_pool()
+
+        self.assertEqual([self.pool_instance.weights_name], self.client.keys(POOL_NAME + '*'))
+
+    def _delete_keys(self):
+        for key in self.client.keys(POOL_NAME + '*'):
+            self.client.delete(key)
+
+
+if __name__ == 'main':
+    unittest.main()
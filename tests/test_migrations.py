@@ -0,0 +1,110 @@
+import unittest
+import io
+import os
+import pickle
+from unittest.mock import patch
+
+from redis import Redis
+from pyrq import migrations
+from pyrq.queues import Queue
+from pyrq.unique_queues import UniqueQueue
+from pyrq.pools import Pool
+
+QUEUE_NAME = os.getenv('QUEUE_NAME', 'test-queue')
+SOURCE_NAME = QUEUE_NAME + '-source'
+TARGET_NAME = QUEUE_NAME + '-target'
+
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+REDIS_DB = int(os.getenv('REDIS_DB', 0))
+REDIS_PASSWORD = os.getenv('REDIS_PASS', None)
+
+
+@patch('pyrq.helpers.wait_for_synced_slaves')
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                            decode_responses=True)
+
+    def tearDown(self):
+        for key in self.client.keys(QUEUE_NAME + '*'):
+            self.client.delete(key)
+
+    def test_queue(self, slaves_mock):
+        source = Queue(SOURCE_NAME, self.client, claim_check_threshold=5)
+        target = Queue(TARGET_NAME, self.client)
+        source.add_items(['a', 'b', 'x' * 10, 'c', 'd'])
+        source.get_items(2)
+        file = io.StringIO()
+
+        self.assertEqual(5, migrations.export_queue(source, file, chunk_size=2))
+        file.seek(0)
+        self.assertEqual(5, migrations.import_queue(target, file, chunk_size=2))
+
+        self.assertEqual(['a', 'b', 'x' * 10, 'c', 'd'], target.get_items(10))
+
+    def test_unique_queue(self, slaves_mock):
+        source = UniqueQueue(SOURCE_NAME, self.client)
+        target = UniqueQueue(TARGET_NAME, self.client)
+        source.add_items(['a', 'b', 'c'])
+        target.add_items(['b'])
+        file = io.StringIO()
+
+        migrations.export_queue(source, file)
+        file.seek(0)
+        self.assertEqual(2, migrations.import_queue(target, file))
+
+        self.assertEqual(['b', 'a', 'c'], target.get_items(10))
+
+    def test_pool(self, slaves_mock):
+        source = Pool(SOURCE_NAME, self.client)
+        target = Pool(TARGET_NAME, self.client)
+        source.add_items(['item-{}'.format(i) for i in range(25)])
+        source.add_item('long', valid_for=60, ack_ttl=30)
+        file = io.StringIO()
+
+        self.assertEqual(26, migrations.export_pool(source, file, chunk_size=10))
+        file.seek(0)
+        self.assertEqual(26, migrations.import_pool(target, file, chunk_size=10))
+
+        self.assertEqual(self.client.zrange(SOURCE_NAME, 0, -1, withscores=True),
+                         self.client.zrange(TARGET_NAME, 0, -1, withscores=True))
+        self.assertEqual(self.client.hgetall(source.durations_name), self.client.hgetall(target.durations_name))
+
+    def test_binary_items(self, slaves_mock):
+        client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD)
+        items = [pickle.dumps({'a': 1}), 'text'.encode(), pickle.dumps([2, 3])]
+
+        source = Queue(SOURCE_NAME, client)
+        target = Queue(TARGET_NAME, client)
+        source.add_items(items)
+        file = io.StringIO()
+        self.assertEqual(3, migrations.export_queue(source, file))
+        file.seek(0)
+        self.assertEqual(3, migrations.import_queue(target, file))
+        self.assertEqual(items, target.get_items(10))
+
+        source = Pool(SOURCE_NAME + '-pool', client)
+        target = Pool(TARGET_NAME + '-pool', client)
+        source.add_items(items)
+        source.add_item(items[0], valid_for=60)
+        file = io.StringIO()
+        self.assertEqual(3, migrations.export_pool(source, file))
+        file.seek(0)
+        self.assertEqual(3, migrations.import_pool(target, file))
+        self.assertEqual(client.zrange(source.name, 0, -1, withscores=True),
+                         client.zrange(target.name, 0, -1, withscores=True))
+        self.assertEqual(client.hgetall(source.durations_name), client.hgetall(target.durations_name))
+
+    def test_import_checks_header(self, slaves_mock):
+        file = io.StringIO()
+        migrations.export_pool(Pool(SOURCE_NAME, self.client), file)
+
+        for content in [file.getvalue(), 'item\n', '']:
+            with self.assertRaises(ValueError):
+                migrations.import_queue(Queue(TARGET_NAME, self.client), io.StringIO(content))
+
+
+if __name__ == 'main':
+    unittest.main()
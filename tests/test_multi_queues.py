@@ -0,0 +1,76 @@
+import unittest
+import os
+from unittest.mock import patch
+
+from redis import Redis
+from pyrq.queues import Queue
+from pyrq.multi_queues import MultiQueue
+
+QUEUE_NAME = os.getenv('QUEUE_NAME', 'test-queue')
+
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+REDIS_DB = int(os.getenv('REDIS_DB', 0))
+REDIS_PASSWORD = os.getenv('REDIS_PASS', None)
+
+
+@patch('pyrq.helpers.wait_for_synced_slaves')
+class TestMultiQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                            decode_responses=True)
+        self.high = Queue('{' + QUEUE_NAME + '}-high', self.client)
+        self.low = Queue('{' + QUEUE_NAME + '}-low', self.client)
+        self.idle = Queue('{' + QUEUE_NAME + '}-idle', self.client)
+        self.multi_queue = MultiQueue([self.high, self.low, self.idle], [3, 1, 1], synced_slaves_enabled=True,
+                                      synced_slaves_count=1, synced_slaves_timeout=2)
+
+    def tearDown(self):
+        for key in self.client.keys('{' + QUEUE_NAME + '}*'):
+            self.client.delete(key)
+
+    def test_get_count(self, slaves_mock):
+        self.high.add_items([1, 2])
+        self.low.add_items([3])
+        self.assertEqual(3, self.multi_queue.get_count())
+
+    def test_get_items(self, slaves_mock):
+        self.high.add_items(['h1', 'h2', 'h3', 'h4', 'h5'])
+        self.low.add_items(['l1', 'l2', 'l3'])
+
+        self.assertEqual(['h1', 'h2', 'h3', 'l1', 'h4', 'h5'], self.multi_queue.get_items(6))
+        self.assertEqual(['l2', 'l3'], self.multi_queue.get_items(6))
+        self.assertEqual([], self.multi_queue.get_items(6))
+
+        self.assertEqual(['h5', 'h4', 'h3', 'h2', 'h1'], self.client.lrange(self.high.processing_queue_name, 0, 10))
+        self.assertEqual(['l3', 'l2', 'l1'], self.client.lrange(self.low.processing_queue_name, 0, 10))
+        self.assertEqual([], self.client.keys(self.idle.name + '*'))
+
+    def test_ack_and_reject_items(self, slaves_mock):
+        self.high.add_items(['a', 'b'])
+        self.low.add_items(['a', 'c'])
+        self.multi_queue.get_items(4)
+
+        self.multi_queue.ack_items(['a', 'b'])
+        self.multi_queue.reject_items(['a', 'c', 'missing'])
+        self.multi_queue.ack_item('a')
+
+        self.assertEqual(0, self.client.llen(self.high.processing_queue_name))
+        self.assertEqual(0, self.client.llen(self.low.processing_queue_name))
+        self.assertEqual({}, self.client.hgetall(self.high.timeouts_hash_name))
+        self.assertEqual(['c', 'a'], self.client.lrange(self.low.name, 0, 10))
+        self.assertEqual(0, self.client.llen(self.high.name))
+        self.assertEqual(3, slaves_mock.call_count)
+
+    def test_weights_must_match_queues(self, slaves_mock):
+        with self.assertRaises(ValueError):
+            MultiQueue([self.high, self.low], [1])
+
+    def test_claim_check_queues_are_not_supported(self, slaves_mock):
+        with self.assertRaises(ValueError):
+            MultiQueue([self.high, Queue('{' + QUEUE_NAME + '}-big', self.client, claim_check_threshold=100)])
+
+
+if __name__ == 'main':
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 import time
+import threading
 import os
 from unittest.mock import patch
 
@@ -7,6 +8,8 @@ from redis import Redis
 from pyrq.pools import Pool
 
 POOL_NAME = os.getenv('POOL_NAME', 'test-pool')
+LEASES_NAME = POOL_NAME + '-leases'
+DURATIONS_NAME = POOL_NAME + '-durations'
 
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
@@ -24,13 +27,13 @@ class TestPool(unittest.TestCase):
         synced_slaves_timeout = 2
         self.client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
                             decode_responses=True)
-        self.client.delete(POOL_NAME)
+        self.client.delete(POOL_NAME, DURATIONS_NAME)
         self.pool_instance = Pool(POOL_NAME, self.client, synced_slaves_enabled=True,
                                   synced_slaves_count=synced_slaves_count,
                                   synced_slaves_timeout=synced_slaves_timeout)
 
     def tearDown(self):
-        self.client.delete(POOL_NAME)
+        self.client.delete(POOL_NAME, DURATIONS_NAME)
 
     def test_get_count(self, slaves_mock):
         self._load_items_to_pool('a', 'b')
@@ -52,6 +55,42 @@ class TestPool(unittest.TestCase):
         self.assertEquals(2, self.pool_instance.get_count_to_process())
         self.assertEquals([POOL_NAME], self.client.keys())
 
+    @patch('pyrq.pools.time.time')
+    def test_get_stats(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        self.client.zadd(POOL_NAME, {'a': TEST_TIME - 4000, 'b': TEST_TIME - 30, 'c': TEST_TIME, 'd': TEST_TIME + 30,
+                                     'e': TEST_TIME + 600.1, 'f': TEST_TIME + 7200})
+
+        self.assertEquals({
+            'due': [(-3600, 1), (-600, 0), (-60, 0), (0, 2), (60, 1), (600, 0), (3600, 1), (None, 1)],
+            'in_flight': None,
+            'oldest_overdue_age': 4000
+        }, self.pool_instance.get_stats())
+        self.assertEquals([(0, 3), (None, 3)], self.pool_instance.get_stats((0,))['due'])
+        self.assertEquals([POOL_NAME], self.client.keys())
+
+    def test_read_redis(self, slaves_mock):
+        read_client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB + 1, password=REDIS_PASSWORD,
+                            decode_responses=True)
+        pool_instance = Pool(POOL_NAME, self.client, read_redis=read_client)
+        self._load_items_to_pool('a', 'b')
+        read_client.zadd(POOL_NAME, {'c': int(time.time())})
+
+        try:
+            self.assertEquals(1, pool_instance.get_count())
+            self.assertEquals(1, pool_instance.get_count_to_process())
+            self.assertTrue(pool_instance.is_in_pool('c'))
+
+            replication = {'role': 'slave', 'master_link_status': 'up', 'master_last_io_seconds_ago': 5}
+            with patch.object(read_client, 'info', return_value=replication):
+                self.assertEquals(1, pool_instance.get_count(max_staleness=10))
+                self.assertEquals(2, pool_instance.get_count(max_staleness=1))
+                self.assertFalse(pool_instance.is_in_pool('c', max_staleness=1))
+            with patch.object(read_client, 'info', return_value=dict(replication, master_link_status='down')):
+                self.assertEquals(2, pool_instance.get_count(max_staleness=10))
+        finally:
+            read_client.delete(POOL_NAME)
+
     def test_is_in_pool(self, slaves_mock):
         self._load_items_to_pool('a', 'b')
         self.assertTrue(self.pool_instance.is_in_pool('a'))
@@ -98,6 +137,23 @@ class TestPool(unittest.TestCase):
 
         self.assertEquals([POOL_NAME], self.client.keys())
 
+    def test_iter_items(self, slaves_mock):
+        items = ['a', 'b', 'c', 'd', 'e']
+        self._load_items_to_pool(*items)
+
+        self.assertEquals([['a', 'b'], ['c', 'd'], ['e']], list(self.pool_instance.iter_items(2)))
+        self.assertEquals([], list(self.pool_instance.iter_items(2)))
+
+    def test_iter_items_with_prefetch(self, slaves_mock):
+        items = ['a', 'b', 'c', 'd']
+        self._load_items_to_pool(*items)
+
+        chunks = self.pool_instance.iter_items(2, prefetch=True)
+        self.assertEquals(['a', 'b'], next(chunks))
+        self.assertEquals(['c', 'd'], next(chunks))
+        self.assertEquals([], list(chunks))
+        self.assertEquals(0, self.pool_instance.get_count_to_process())
+
     @patch('pyrq.pools.time.time')
     def test_ack_item(self, time_mock, slaves_mock):
         time_mock.return_value = TEST_TIME
@@ -121,8 +177,8 @@ class TestPool(unittest.TestCase):
         time_mock.return_value = TEST_TIME
         self._load_test_data_to_pool()
 
-        self.pool_instance.ack_items(['a'])
-        self.pool_instance.ack_items(['c', 'b'])
+        self.assertEquals([True], self.pool_instance.ack_items(['a']))
+        self.assertEquals([True, False, True, False], self.pool_instance.ack_items(['c', 'e', 'b', 'missing']))
 
         self.assertEquals(5, self.client.zcard(POOL_NAME))
         self.assertEquals(TEST_TIME + 129600, int(self.client.zscore(POOL_NAME, 'a')))
@@ -133,6 +189,69 @@ class TestPool(unittest.TestCase):
 
         self.assertEquals([POOL_NAME], self.client.keys())
 
+    @patch('pyrq.pools.time.time')
+    def test_renew_items(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        self._load_test_data_to_pool()
+
+        self.assertEquals([True, False, True, False], self.pool_instance.renew_items(['a', 'e', 'd', 'missing']))
+
+        self.assertEquals(TEST_TIME + 600.1, self.client.zscore(POOL_NAME, 'a'))
+        self.assertEquals(TEST_TIME - 5 + 600.1, self.client.zscore(POOL_NAME, 'b'))
+        self.assertEquals(TEST_TIME + 600.1, self.client.zscore(POOL_NAME, 'd'))
+        self.assertEquals(TEST_TIME + 5, self.client.zscore(POOL_NAME, 'e'))
+        self.assertEquals([True], self.pool_instance.ack_items(['a']))
+        self.assertEquals(2, slaves_mock.call_count)
+
+    @patch('pyrq.helpers.PIPELINE_CHUNKS', 2)
+    @patch('pyrq.pools.time.time')
+    def test_renew_items_in_several_pipelines(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        pool_instance = Pool(POOL_NAME, self.client, chunk_size=1)
+        self._load_test_data_to_pool()
+
+        with patch.object(self.client, 'pipeline', wraps=self.client.pipeline) as pipeline_mock:
+            self.assertEquals([True, False, True, False, True],
+                              pool_instance.renew_items(['a', 'e', 'd', 'missing', 'b']))
+        pipeline_mock.assert_called_once_with(transaction=False)
+
+    def test_heartbeat(self, slaves_mock):
+        self._load_test_data_to_pool()
+        renewed = threading.Event()
+
+        with patch.object(self.pool_instance, 'renew_items', side_effect=lambda items: renewed.set()) as renew_mock:
+            with self.pool_instance.heartbeat(['a', 'b'], interval=0.01):
+                self.assertTrue(renewed.wait(5))
+            call_count = renew_mock.call_count
+            time.sleep(0.05)
+
+        self.assertEquals(call_count, renew_mock.call_count)
+        renew_mock.assert_called_with(['a', 'b'])
+
+    def test_heartbeat_interval(self, slaves_mock):
+        self.pool_instance.add_items(['a', 'b'], ack_ttl={'b': 30})
+
+        with patch.object(self.pool_instance, 'renew_items'):
+            with self.pool_instance.heartbeat(['a', 'b']) as heartbeat:
+                self.assertEqual(10, heartbeat.interval)
+            with self.pool_instance.heartbeat(['a']) as heartbeat:
+                self.assertEqual(200, heartbeat.interval)
+
+    def test_heartbeat_error(self, slaves_mock):
+        failed = threading.Event()
+
+        def renew_items(items):
+            failed.set()
+            raise ConnectionError('Connection lost')
+
+        with patch.object(self.pool_instance, 'renew_items', side_effect=renew_items) as renew_mock:
+            heartbeat = self.pool_instance.heartbeat(['a'], interval=0.01)
+            self.assertTrue(failed.wait(5))
+            time.sleep(0.05)
+            self.assertRaises(ConnectionError, heartbeat.stop)
+
+        self.assertLess(1, renew_mock.call_count)
+
     def test_remove_item(self, slaves_mock):
         self._load_test_data_to_pool()
 
@@ -148,14 +267,103 @@ class TestPool(unittest.TestCase):
     def test_remove_items(self, slaves_mock):
         self._load_test_data_to_pool()
 
-        self.pool_instance.remove_items(['a'])
-        self.pool_instance.remove_items(['d', 'c'])
+        self.assertEquals([True], self.pool_instance.remove_items(['a']))
+        self.assertEquals([True, False, True], self.pool_instance.remove_items(['d', 'e', 'c']))
 
         self.assertEquals(2, self.client.zcard(POOL_NAME))
         self.assertEquals(['e', 'b'], self.client.zrange(POOL_NAME, 0, 5))
 
         self.assertEquals([POOL_NAME], self.client.keys())
 
+    @patch('pyrq.pools.time.time')
+    def test_ack_items_with_multiple_chunks(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        pool_instance = Pool(POOL_NAME, self.client, chunk_size=2, synced_slaves_enabled=True,
+                             synced_slaves_count=1, synced_slaves_timeout=2)
+        self._load_test_data_to_pool()
+
+        self.assertEquals([True, True, True, True, False], pool_instance.ack_items(['a', 'b', 'c', 'd', 'e']))
+        self.assertEquals(4, self.client.zcount(POOL_NAME, TEST_TIME + 129600, TEST_TIME + 129600))
+        self.assertEquals([False, False], pool_instance.remove_items(['a', 'b']))
+        self.assertEquals(2, slaves_mock.call_count)
+
+    @patch('pyrq.helpers.PIPELINE_CHUNKS', 2)
+    @patch('pyrq.pools.time.time')
+    def test_ack_and_remove_items_in_several_pipelines(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        pool_instance = Pool(POOL_NAME, self.client, chunk_size=1)
+        self._load_test_data_to_pool()
+
+        with patch.object(self.client, 'pipeline', wraps=self.client.pipeline) as pipeline_mock:
+            self.assertEquals([True, True, True, True, False], pool_instance.ack_items(['a', 'b', 'c', 'd', 'e']))
+            self.assertEquals([False, False, False, False, False],
+                              pool_instance.remove_items(['a', 'b', 'c', 'd', 'e']))
+        pipeline_mock.assert_called_with(transaction=False)
+        self.assertEquals(2, pipeline_mock.call_count)
+
+    @patch('pyrq.pools.time.time')
+    def test_jitter(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        pool_instance = Pool(POOL_NAME, self.client, jitter=3600)
+        pool_instance.add_items(['item-{}'.format(i) for i in range(200)])
+
+        scores = [score for item, score in self.client.zrange(POOL_NAME, 0, -1, withscores=True)]
+        self.assertLessEqual(TEST_TIME, min(scores))
+        self.assertGreaterEqual(TEST_TIME + 3600, max(scores))
+        self.assertLess(100, len(set(scores)))
+
+        self.client.zadd(POOL_NAME, {'item-0': TEST_TIME + 0.1, 'item-1': TEST_TIME + 0.1})
+        pool_instance.ack_items(['item-0', 'item-1'])
+        for item in ['item-0', 'item-1']:
+            self.assertLessEqual(TEST_TIME + 129600, self.client.zscore(POOL_NAME, item))
+            self.assertGreaterEqual(TEST_TIME + 129600 + 3600, self.client.zscore(POOL_NAME, item))
+
+    @patch('pyrq.pools.time.time')
+    def test_per_item_durations(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        self.pool_instance.add_item('a', valid_for=60, ack_ttl=30)
+        self.pool_instance.add_items(['b', 'c', 'd'], valid_for={'b': 3600}, ack_ttl=120)
+        self.pool_instance.add_item('e')
+
+        self.assertEquals({'a': '60:30', 'b': '3600:120', 'c': ':120', 'd': ':120'},
+                          self.client.hgetall(DURATIONS_NAME))
+
+        self.assertEquals(['a', 'b', 'c', 'd', 'e'], self.pool_instance.get_items(5))
+        self.assertEquals(TEST_TIME + 30.1, self.client.zscore(POOL_NAME, 'a'))
+        self.assertEquals(TEST_TIME + 120.1, self.client.zscore(POOL_NAME, 'b'))
+        self.assertEquals(TEST_TIME + 600.1, self.client.zscore(POOL_NAME, 'e'))
+
+        self.pool_instance.ack_item('a')
+        self.assertEquals([True, True, True], self.pool_instance.ack_items(['b', 'c', 'e']))
+
+        self.assertEquals(TEST_TIME + 60, self.client.zscore(POOL_NAME, 'a'))
+        self.assertEquals(TEST_TIME + 3600, self.client.zscore(POOL_NAME, 'b'))
+        self.assertEquals(TEST_TIME + 129600, self.client.zscore(POOL_NAME, 'c'))
+        self.assertEquals(TEST_TIME + 129600, self.client.zscore(POOL_NAME, 'e'))
+
+        self.assertEquals([True], self.pool_instance.remove_items(['d']))
+        self.assertEquals({'a': '60:30', 'b': '3600:120', 'c': ':120'}, self.client.hgetall(DURATIONS_NAME))
+
+        self.pool_instance.add_item('a')
+        self.pool_instance.add_items(['b'])
+        self.assertEquals({'c': ':120'}, self.client.hgetall(DURATIONS_NAME))
+
+        self.pool_instance.clear_pool()
+        self.assertEquals([], self.client.keys())
+
+    @patch('pyrq.pools.time.time')
+    def test_ack_items_with_validity(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        self.pool_instance.add_items(['a', 'b', 'c'], valid_for={'c': 3600})
+        self.pool_instance.get_items(3)
+
+        self.pool_instance.ack_item('a', valid_for=60)
+        self.assertEquals([True, True], self.pool_instance.ack_items(['b', 'c'], valid_for={'b': 120}))
+
+        self.assertEquals(TEST_TIME + 60, self.client.zscore(POOL_NAME, 'a'))
+        self.assertEquals(TEST_TIME + 120, self.client.zscore(POOL_NAME, 'b'))
+        self.assertEquals(TEST_TIME + 3600, self.client.zscore(POOL_NAME, 'c'))
+
     def test_clear_pool(self, slaves_mock):
         self._load_test_data_to_pool()
 
@@ -163,6 +371,14 @@ class TestPool(unittest.TestCase):
 
         self.assertEquals([], self.client.keys())
 
+    def test_clear_pool_chunked(self, slaves_mock):
+        pool_instance = Pool(POOL_NAME, self.client, chunk_size=2)
+        pool_instance.add_items(['item-{}'.format(i) for i in range(7)], valid_for=60)
+
+        pool_instance.clear_pool(chunked=True)
+
+        self.assertEquals([], self.client.keys())
+
     @patch('pyrq.pools.time.time')
     def test_real_use_case_example(self, time_mock, slaves_mock):
         time_mock.return_value = TEST_TIME
@@ -221,3 +437,99 @@ class TestPool(unittest.TestCase):
         }
         self.client.zadd(POOL_NAME, prepared_items)
 
+
+@patch('pyrq.helpers.wait_for_synced_slaves')
+class TestLeaseIndexPool(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                            decode_responses=True)
+        self.client.delete(POOL_NAME, LEASES_NAME, DURATIONS_NAME)
+        self.pool_instance = Pool(POOL_NAME, self.client, synced_slaves_enabled=True, synced_slaves_count=1,
+                                  synced_slaves_timeout=2, lease_index=True)
+
+    def tearDown(self):
+        self.client.delete(POOL_NAME, LEASES_NAME, DURATIONS_NAME)
+
+    @patch('pyrq.pools.time.time')
+    def test_real_use_case_example(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        self.pool_instance.add_items(['a', 'b', 'c', 'd'])
+
+        self.assertEquals(['a', 'b', 'c'], self.pool_instance.get_items(3))
+        self.assertEquals(1, self.pool_instance.get_count_to_process())
+        self.assertEquals(3, self.pool_instance.get_count_in_flight())
+        self.assertEquals([('a', TEST_TIME + 600), ('b', TEST_TIME + 600)],
+                          self.pool_instance.get_items_in_flight(2))
+        self.assertEquals(TEST_TIME + 600, self.client.zscore(POOL_NAME, 'a'))
+
+        self.assertEquals([True, False], self.pool_instance.ack_items(['a', 'd']))
+        self.pool_instance.remove_item('b')
+        self.pool_instance.remove_item('d')
+
+        self.assertEquals(['d', 'c', 'a'], self.client.zrange(POOL_NAME, 0, 5))
+        self.assertEquals(TEST_TIME + 129600, self.client.zscore(POOL_NAME, 'a'))
+        self.assertEquals([('c', TEST_TIME + 600)], self.pool_instance.get_items_in_flight())
+
+        time_mock.return_value = TEST_TIME + 600
+        self.assertEquals(0, self.pool_instance.get_count_in_flight())
+        self.assertEquals(['d', 'c'], self.pool_instance.get_items(3))
+        self.assertEquals([True, True], self.pool_instance.remove_items(['c', 'd']))
+        self.assertEquals(['a'], self.client.zrange(POOL_NAME, 0, 5))
+        self.assertEquals([POOL_NAME], self.client.keys())
+
+    @patch('pyrq.pools.time.time')
+    def test_per_item_durations(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        self.pool_instance.add_items(['a', 'b'], valid_for={'a': 60}, ack_ttl={'b': 30})
+
+        self.assertEquals(['a', 'b'], self.pool_instance.get_items(2))
+        self.assertEquals([('b', TEST_TIME + 30), ('a', TEST_TIME + 600)], self.pool_instance.get_items_in_flight())
+
+        self.assertEquals([True, True], self.pool_instance.ack_items(['a', 'b']))
+        self.assertEquals(TEST_TIME + 60, self.client.zscore(POOL_NAME, 'a'))
+        self.assertEquals(TEST_TIME + 129600, self.client.zscore(POOL_NAME, 'b'))
+
+        self.pool_instance.add_items(['c', 'd'])
+        self.assertEquals(['c', 'd'], self.pool_instance.get_items(2))
+        self.pool_instance.ack_item('c', valid_for=90)
+        self.assertEquals([True], self.pool_instance.ack_items(['d'], valid_for=120))
+        self.assertEquals(TEST_TIME + 90, self.client.zscore(POOL_NAME, 'c'))
+        self.assertEquals(TEST_TIME + 120, self.client.zscore(POOL_NAME, 'd'))
+
+    @patch('pyrq.pools.time.time')
+    def test_renew_items(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        self.pool_instance.add_items(['a', 'b', 'c'])
+        self.assertEquals(['a', 'b'], self.pool_instance.get_items(2))
+
+        time_mock.return_value = TEST_TIME + 300
+        self.assertEquals([True, False], self.pool_instance.renew_items(['a', 'c']))
+        self.assertEquals([('b', TEST_TIME + 600), ('a', TEST_TIME + 900)], self.pool_instance.get_items_in_flight())
+        self.assertEquals(TEST_TIME + 900, self.client.zscore(POOL_NAME, 'a'))
+
+        time_mock.return_value = TEST_TIME + 600
+        self.assertEquals(['c', 'b'], self.pool_instance.get_items(3))
+
+    @patch('pyrq.pools.time.time')
+    def test_get_stats(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        self.pool_instance.add_items(['a', 'b', 'c'])
+        self.pool_instance.get_items(2)
+
+        stats = self.pool_instance.get_stats((0, 600))
+        self.assertEquals([(0, 1), (600, 2), (None, 0)], stats['due'])
+        self.assertEquals(2, stats['in_flight'])
+        self.assertEquals(0, stats['oldest_overdue_age'])
+
+    def test_clear_pool(self, slaves_mock):
+        self.pool_instance.add_items(['a', 'b'])
+        self.pool_instance.get_items(1)
+
+        self.pool_instance.clear_pool()
+
+        self.assertEquals([], self.client.keys())
+
+    def test_in_flight_requires_lease_index(self, slaves_mock):
+        pool_instance = Pool(POOL_NAME, self.client)
+        self.assertRaises(ValueError, pool_instance.get_count_in_flight)
@@ -1,10 +1,12 @@
 import unittest
 import time
+import threading
 import socket
 import os
 from unittest.mock import patch
 
 from redis import Redis
+from pyrq import helpers
 from pyrq.queues import Queue
 
 QUEUE_NAME = os.getenv('QUEUE_NAME', 'test-queue')
@@ -145,6 +147,179 @@ class TestQueue(unittest.TestCase):
         self.assertEqual(0, self.client.llen(QUEUE_NAME))
         self.assertEqual(4, slaves_mock.call_count)
 
+    def test_add_items_with_max_length(self, slaves_mock):
+        queue_instance = Queue(QUEUE_NAME, self.client, max_length=3)
+
+        self.assertTrue(queue_instance.add_item(1))
+        self.assertEqual(2, queue_instance.add_items([2, 3, 4, 5]))
+        self.assertFalse(queue_instance.add_item(6))
+        self.assertEqual(['3', '2', '1'], self.client.lrange(QUEUE_NAME, 0, 10))
+
+        self.assertEqual(0, queue_instance.add_items([4], block=True, timeout=0.2))
+        threading.Timer(0.1, queue_instance.get_items, [2]).start()
+        self.assertEqual(2, queue_instance.add_items([4, 5], block=True, timeout=5))
+        self.assertEqual(['5', '4', '3'], self.client.lrange(QUEUE_NAME, 0, 10))
+
+    def test_add_items_with_max_bytes(self, slaves_mock):
+        queue_instance = Queue(QUEUE_NAME, self.client, max_bytes=10)
+
+        self.assertEqual(2, queue_instance.add_items(['aaaa', 'bbbb', 'cccc', 'd']))
+        self.assertEqual('8', self.client.get(queue_instance.bytes_name))
+        self.assertEqual(['aaaa'], queue_instance.get_items(1))
+        self.assertEqual('4', self.client.get(queue_instance.bytes_name))
+        queue_instance.reject_item('aaaa')
+        self.assertEqual('8', self.client.get(queue_instance.bytes_name))
+        queue_instance.get_items(2)
+        queue_instance.re_enqueue_all_items()
+        self.assertEqual('8', self.client.get(queue_instance.bytes_name))
+        self.assertEqual(1, queue_instance.add_items(['cc', 'd']))
+        with self.assertRaises(ValueError):
+            queue_instance.add_items(['x' * 20], block=True)
+
+        queue_instance.clear_queue()
+        self.assertEqual([], self.client.keys(QUEUE_NAME + '*'))
+
+    def test_claim_check(self, slaves_mock):
+        queue_instance = Queue(QUEUE_NAME, self.client, claim_check_threshold=5, claim_check_ttl=60)
+        big_item = 'x' * 10
+
+        queue_instance.add_items(['a', big_item, big_item])
+        self.assertTrue(queue_instance.add_item('b'))
+        reference = queue_instance._get_reference(big_item)
+        self.assertEqual(['b', reference, reference, 'a'], self.client.lrange(QUEUE_NAME, 0, 10))
+        self.assertEqual(big_item, self.client.get(reference))
+        self.assertLessEqual(self.client.ttl(reference), 60)
+
+        self.assertEqual(['a', big_item, big_item], queue_instance.get_items(3))
+        queue_instance.reject_item(big_item)
+        queue_instance.ack_item(big_item)
+        self.assertEqual('1', self.client.get(reference + '-references'))
+        self.assertEqual(['b', reference], self.client.lrange(QUEUE_NAME, 0, 10))
+
+        self.assertEqual([big_item, 'b'], queue_instance.get_items(2))
+        queue_instance.ack_items(['a', 'b', big_item])
+        queue_instance.clear_queue()
+        self.assertEqual([], self.client.keys(QUEUE_NAME + '*'))
+
+        queue_instance.add_items([big_item, 'y' * 10, 'c'])
+        self.assertEqual([big_item], queue_instance.get_items(1))
+        queue_instance.clear_queue()
+        self.assertEqual([], self.client.keys(QUEUE_NAME + '*'))
+
+    def test_claim_check_double_ack(self, slaves_mock):
+        queue_instance = Queue(QUEUE_NAME, self.client, claim_check_threshold=5)
+        big_item = 'x' * 10
+        reference = queue_instance._get_reference(big_item)
+
+        queue_instance.add_items([big_item, big_item])
+        self.assertEqual([big_item], queue_instance.get_items(1))
+        queue_instance.ack_items([big_item])
+        queue_instance.ack_items([big_item])
+        self.assertEqual('1', self.client.get(reference + '-references'))
+        self.assertEqual([big_item], queue_instance.get_items(1))
+        queue_instance.ack_item(big_item)
+        self.assertIsNone(self.client.get(reference))
+
+        queue_instance.add_items([big_item, 'a'])
+        self.client.delete(reference)
+        self.assertEqual(['a'], queue_instance.get_items(2))
+        self.assertEqual(['a'], self.client.lrange(queue_instance.processing_queue_name, 0, 10))
+        self.assertIsNone(self.client.get(reference + '-references'))
+        queue_instance.clear_queue()
+
+    def test_claim_check_with_max_length(self, slaves_mock):
+        queue_instance = Queue(QUEUE_NAME, self.client, claim_check_threshold=5, max_length=1)
+
+        self.assertEqual(1, queue_instance.add_items(['x' * 10, 'y' * 10]))
+        self.assertIsNone(self.client.get(queue_instance._get_reference('y' * 10)))
+        self.assertEqual(['x' * 10], queue_instance.get_items(2))
+        queue_instance.ack_item('x' * 10)
+        queue_instance.clear_queue()
+        self.assertEqual([], self.client.keys(QUEUE_NAME + '*'))
+
+    def test_track_latency(self, slaves_mock):
+        queue_instance = Queue(QUEUE_NAME, self.client, track_latency=True, latency_buckets=(10, 60))
+        self.assertIsNone(self.queue_instance.oldest_item_age())
+        self.assertEqual(0, queue_instance.oldest_item_age())
+
+        with patch('time.time', return_value=1000.0):
+            queue_instance.add_items(['a', 'b'])
+        self.assertTrue(queue_instance.add_item('c'))
+        self.assertGreater(queue_instance.oldest_item_age(), 3600)
+
+        self.assertEqual(['a', 'b'], queue_instance.get_items(2))
+        self.assertLess(queue_instance.oldest_item_age(), 10)
+        queue_instance.ack_item('a')
+        queue_instance.reject_item('b')
+        self.assertEqual(['b', 'c'], queue_instance.get_items(2))
+        queue_instance.re_enqueue_all_items()
+        self.assertEqual(2, self.client.llen(queue_instance.enqueued_name))
+        self.assertEqual(['b', 'c'], queue_instance.get_items(2))
+        queue_instance.ack_items(['b', 'c'])
+
+        self.assertEqual({'wait': [(10, 4), (60, 0), (None, 2)], 'processing': [(10, 3), (60, 0), (None, 0)]},
+                         queue_instance.get_latency_stats())
+        queue_instance.clear_queue()
+        self.assertEqual([], self.client.keys(QUEUE_NAME + '*'))
+
+    def test_track_latency_with_max_length(self, slaves_mock):
+        queue_instance = Queue(QUEUE_NAME, self.client, track_latency=True, max_length=2, max_bytes=10)
+
+        self.assertEqual(2, queue_instance.add_items(['a', 'b', 'c']))
+        self.assertEqual(2, self.client.llen(queue_instance.enqueued_name))
+        self.assertEqual(['a'], queue_instance.get_items(1))
+        queue_instance.reject_item('a')
+        self.assertEqual(2, self.client.llen(queue_instance.enqueued_name))
+        self.assertEqual('2', self.client.get(queue_instance.bytes_name))
+        queue_instance.clear_queue()
+
+    def test_ack_and_get(self, slaves_mock):
+        self.queue_instance.add_items([1, 5, 3, 5])
+
+        self.assertEqual(['1', '5'], self.queue_instance.ack_and_get([], 2))
+        self.assertEqual(['3', '5'], self.queue_instance.ack_and_get(['1', 5], 2))
+        self.assertEqual(['5', '3'], self.client.lrange(self.processing_queue, 0, 10))
+        self.assertEqual([], self.queue_instance.ack_and_get([3, 5], 2))
+        self.assertEqual(0, self.client.llen(self.processing_queue))
+        self.assertEqual(4, slaves_mock.call_count)
+
+    def test_ack_and_get_with_options(self, slaves_mock):
+        queue_instance = Queue(QUEUE_NAME, self.client, claim_check_threshold=5, track_latency=True, max_bytes=100)
+        queue_instance.add_items(['a', 'x' * 10])
+
+        self.assertEqual(['a'], queue_instance.ack_and_get([], 1))
+        self.assertEqual(['x' * 10], queue_instance.ack_and_get(['a'], 1))
+        self.assertEqual([], queue_instance.ack_and_get(['x' * 10], 1))
+
+        self.assertEqual([], self.client.keys(QUEUE_NAME + '-payload-*'))
+        self.assertEqual('0', self.client.get(queue_instance.bytes_name))
+        self.assertEqual(2, sum(count for bound, count in queue_instance.get_latency_stats()['processing']))
+        queue_instance.clear_queue()
+
+    def test_read_redis(self, slaves_mock):
+        read_client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB + 1, password=REDIS_PASSWORD,
+                            decode_responses=True)
+        queue_instance = Queue(QUEUE_NAME, self.client, read_redis=read_client)
+        self.client.lpush(QUEUE_NAME, 1, 2)
+        read_client.lpush(QUEUE_NAME, 1)
+        read_client.hset(TIMEOUT_QUEUE, self.processing_queue, 0)
+
+        try:
+            self.assertEqual(1, queue_instance.get_count())
+            self.assertEqual([], queue_instance._get_sorted_processing_queues())
+            self.assertEqual(2, self.queue_instance.get_count())
+        finally:
+            read_client.delete(QUEUE_NAME, TIMEOUT_QUEUE)
+
+    def test_scripts_are_shared(self, slaves_mock):
+        other_instance = Queue(QUEUE_NAME + '-other', self.client)
+        self.assertIs(self.queue_instance.get_command, other_instance.get_command)
+        self.assertEqual([True], self.client.script_exists(self.queue_instance.get_command.sha))
+
+        self.client.script_flush()
+        helpers.load_scripts(self.client)
+        self.assertEqual([True], self.client.script_exists(self.queue_instance.get_command.sha))
+
     def test_re_enqueue_timeout_items(self, slaves_mock):
         microtimestamp = time.time()
         timestamp = int(microtimestamp)
@@ -251,6 +426,16 @@ class TestQueue(unittest.TestCase):
 
         self.assertEqual(1, slaves_mock.call_count)
 
+    def test_clear_queue(self, slaves_mock):
+        for chunked in [False, True]:
+            self.queue_instance.add_items(['item-{}'.format(i) for i in range(2500)])
+            self.queue_instance.get_items(5)
+
+            self.queue_instance.clear_queue(chunked=chunked)
+
+            self.assertEqual([], self.client.keys(QUEUE_NAME + '*'))
+        self.assertEqual(4, slaves_mock.call_count)
+
 
 if __name__ == 'main':
     unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import os
+from unittest.mock import patch
+
+from redis import Redis
+from pyrq.sharded_pools import ShardedPool
+
+POOL_NAME = os.getenv('POOL_NAME', 'test-pool')
+SHARD_NAMES = ['{' + POOL_NAME + '-' + str(index) + '}' for index in range(4)]
+
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+REDIS_DB = int(os.getenv('REDIS_DB', 0))
+REDIS_PASSWORD = os.getenv('REDIS_PASS', None)
+
+TEST_TIME = 1444222459.0
+
+
+@patch('pyrq.helpers.wait_for_synced_slaves')
+class TestShardedPool(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                            decode_responses=True)
+        self.client.delete(*SHARD_NAMES)
+        self.pool_instance = ShardedPool(POOL_NAME, self.client, shards_count=4, synced_slaves_enabled=True,
+                                         synced_slaves_count=1, synced_slaves_timeout=2)
+
+    def tearDown(self):
+        self.client.delete(*SHARD_NAMES)
+
+    def test_add_items(self, slaves_mock):
+        items = ['item-{}'.format(i) for i in range(40)]
+        self.pool_instance.add_items(items)
+
+        self.assertEqual(40, self.pool_instance.get_count())
+        self.assertEqual(40, self.pool_instance.get_count_to_process())
+        self.assertEqual(sorted(SHARD_NAMES), sorted(self.client.keys()))
+        for item in items:
+            self.assertTrue(self.pool_instance.is_in_pool(item))
+            self.assertIsNotNone(self.client.zscore(self.pool_instance._get_shard(item).name, item))
+        self.assertFalse(self.pool_instance.is_in_pool('whatever'))
+
+    def test_get_items(self, slaves_mock):
+        items = ['item-{}'.format(i) for i in range(10)]
+        self.pool_instance.add_items(items)
+
+        first = self.pool_instance.get_items(7)
+        second = self.pool_instance.get_items(7)
+        self.assertEqual(7, len(first))
+        self.assertEqual(3, len(second))
+        self.assertEqual(sorted(items), sorted(first + second))
+        self.assertEqual([], self.pool_instance.get_items(7))
+
+    def test_get_all_items(self, slaves_mock):
+        items = ['item-{}'.format(i) for i in range(10)]
+        self.pool_instance.add_items(items)
+
+        self.assertEqual(sorted(items), sorted(self.pool_instance.get_all_items()))
+        self.assertEqual(0, self.pool_instance.get_count_to_process())
+
+    @patch('pyrq.pools.time.time')
+    def test_ack_and_remove_items(self, time_mock, slaves_mock):
+        time_mock.return_value = TEST_TIME
+        items = ['item-{}'.format(i) for i in range(10)]
+        self.pool_instance.add_items(items)
+        self.pool_instance.get_items(6)
+        leased = [item for item in items if self.client.zscore(self.pool_instance._get_shard(item).name, item) % 1]
+
+        self.assertEqual([item in leased for item in items], self.pool_instance.ack_items(items))
+        for item in leased:
+            self.assertEqual(TEST_TIME + 129600,
+                             self.client.zscore(self.pool_instance._get_shard(item).name, item))
+
+        self.assertEqual(sorted(set(items) - set(leased)), sorted(self.pool_instance.get_items(10)))
+        self.assertEqual([item not in leased for item in items] + [False],
+                         self.pool_instance.remove_items(items + ['whatever']))
+        self.assertEqual(6, self.pool_instance.get_count())
+
+    def test_ack_items_without_decoded_responses(self, slaves_mock):
+        client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD)
+        pool_instance = ShardedPool(POOL_NAME, client, shards_count=4)
+        items = ['a', 'b', 'c', 'd', 'e', 'f']
+        pool_instance.add_items(items)
+
+        leased = pool_instance.get_items(6)
+        self.assertEqual(sorted(item.encode() for item in items), sorted(leased))
+        self.assertEqual([True] * 6, pool_instance.ack_items(leased))
+        self.assertEqual(0, pool_instance.get_count_to_process())
+
+    def test_clear_pool(self, slaves_mock):
+        self.pool_instance.add_items(['item-{}'.format(i) for i in range(10)])
+
+        self.pool_instance.clear_pool()
+
+        self.assertEqual([], self.client.keys())
+
+
+if __name__ == 'main':
+    unittest.main()
@@ -0,0 +1,209 @@
+import unittest
+import time
+import socket
+import os
+from unittest.mock import patch
+
+from redis import Redis
+from pyrq.sorted_unique_queues import SortedUniqueQueue, ADD_CHUNK_SIZE
+
+QUEUE_NAME = os.getenv('QUEUE_NAME', 'test-queue')
+PROCESSING_QUEUE_SCHEMA = QUEUE_NAME + '-processing-{}[{}][{}]'
+TIMEOUT_QUEUE = QUEUE_NAME + '-timeouts'
+SEQUENCE_NAME = QUEUE_NAME + '-sequence'
+
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+REDIS_DB = int(os.getenv('REDIS_DB', 0))
+REDIS_PASSWORD = os.getenv('REDIS_PASS', None)
+
+
+@patch('pyrq.helpers.wait_for_synced_slaves')
+class TestSortedUniqueQueue(unittest.TestCase):
+
+    def setUp(self):
+        synced_slaves_count = 1
+        synced_slaves_timeout = 2
+        self.client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                            decode_responses=True)
+        self.client.delete(QUEUE_NAME)
+        self.queue_instance = SortedUniqueQueue(QUEUE_NAME, self.client, synced_slaves_enabled=True,
+                                                synced_slaves_count=synced_slaves_count,
+                                                synced_slaves_timeout=synced_slaves_timeout)
+        self.processing_queue = self.queue_instance.processing_queue_name
+        self.timeouts_hash = self.queue_instance.timeouts_hash_name
+
+    def tearDown(self):
+        self.client.eval("""
+            local keys = redis.call("keys", ARGV[1])
+            for i, key in ipairs(keys) do
+                redis.call("del", key)
+            end
+        """, 0, QUEUE_NAME + '*')
+
+    def test_get_count(self, slaves_mock):
+        self.queue_instance.add_items([1, 2, 1])
+        self.assertEqual(2, self.queue_instance.get_count())
+
+    def test_add_items(self, slaves_mock):
+        items = ['first-message', 'second-message', 'first-message']
+
+        self.assertEqual(2, self.queue_instance.add_items(items))
+        self.assertEqual(['first-message', 'second-message'], self.client.zrange(QUEUE_NAME, 0, -1))
+        self.assertEqual([QUEUE_NAME, SEQUENCE_NAME], sorted(self.client.keys(QUEUE_NAME + '*')))
+        self.assertEqual(1, slaves_mock.call_count)
+
+    def test_add_items_with_multiple_chunks(self, slaves_mock):
+        items = ['message-{}'.format(i % ADD_CHUNK_SIZE) for i in range(ADD_CHUNK_SIZE + 5)]
+
+        self.assertEqual(ADD_CHUNK_SIZE, self.queue_instance.add_items(items))
+        self.assertEqual(ADD_CHUNK_SIZE, self.client.zcard(QUEUE_NAME))
+        self.assertEqual(1, slaves_mock.call_count)
+
+    @patch('pyrq.sorted_unique_queues.ADD_PIPELINE_CHUNKS', 2)
+    def test_add_items_in_several_pipelines(self, slaves_mock):
+        items = ['message-{}'.format(i) for i in range(5 * ADD_CHUNK_SIZE)]
+        with patch.object(self.client, 'pipeline', wraps=self.client.pipeline) as pipeline_mock:
+            self.assertEqual(len(items), self.queue_instance.add_items(items + items[:10]))
+        pipeline_mock.assert_called_once_with(transaction=False)
+        self.assertEqual(len(items), self.client.zcard(QUEUE_NAME))
+        self.assertEqual(items[:3], self.client.zrange(QUEUE_NAME, 0, 2))
+
+    def test_add_item(self, slaves_mock):
+        results = [self.queue_instance.add_item(i) for i in [3, 5, 3, 1]]
+        self.assertEqual([True, True, False, True], results)
+        self.assertEqual(['3', '5', '1'], self.client.zrange(QUEUE_NAME, 0, 5))
+        self.assertEqual(4, slaves_mock.call_count)
+
+    def test_get_items(self, slaves_mock):
+        self.queue_instance.add_items([3, 5, 2, 1])
+        self.assertEqual(['3', '5', '2'], self.queue_instance.get_items(3))
+        self.assertEqual(['1'], self.queue_instance.get_items(1))
+        self.assertEqual([], self.queue_instance.get_items(1))
+        self.assertEqual(['1', '2', '5', '3'], self.client.lrange(self.processing_queue, 0, 5))
+        self.assertEqual(1, slaves_mock.call_count)
+
+    def test_ack_items(self, slaves_mock):
+        self.client.lpush(self.processing_queue, *[1, 5, 5, 3, 6, 7])
+        saved_time = int(time.time())
+        self.client.hset(self.timeouts_hash, self.processing_queue, saved_time)
+        self.queue_instance.ack_items([1, 5])
+        self.queue_instance.ack_item(1)
+
+        self.assertEqual(['7', '6', '3', '5'], self.client.lrange(self.processing_queue, 0, 5))
+        self.assertEqual({self.processing_queue: str(saved_time)}, self.client.hgetall(self.timeouts_hash))
+
+        self.queue_instance.ack_items([5, 3, 6, 7])
+        self.assertEqual(0, self.client.llen(self.processing_queue))
+        self.assertEqual({}, self.client.hgetall(self.timeouts_hash))
+        self.assertEqual(3, slaves_mock.call_count)
+
+    def test_reject_items(self, slaves_mock):
+        self.queue_instance.add_items([8, 9])
+        self.client.lpush(self.processing_queue, *[1, 5, 5, 3, 6, 7])
+        saved_time = int(time.time())
+        self.client.hset(self.timeouts_hash, self.processing_queue, saved_time)
+
+        self.queue_instance.reject_items([1, 5])
+        self.queue_instance.reject_item(5)
+        self.queue_instance.reject_items([9])
+
+        self.assertEqual(['1', '5', '8', '9'], self.client.zrange(QUEUE_NAME, 0, 5))
+        self.assertEqual(['7', '6', '3'], self.client.lrange(self.processing_queue, 0, 5))
+        self.assertEqual({self.processing_queue: str(saved_time)}, self.client.hgetall(self.timeouts_hash))
+
+        self.queue_instance.reject_items([3, 6, 7])
+        self.assertEqual(['3', '6', '7', '1', '5', '8', '9'], self.client.zrange(QUEUE_NAME, 0, 10))
+        self.assertEqual(0, self.client.llen(self.processing_queue))
+        self.assertEqual(5, slaves_mock.call_count)
+
+    def test_integration(self, slaves_mock):
+        self.queue_instance.add_items([1, 5, 2, 6, 7])
+        self.assertEqual(['1', '5', '2', '6', '7'], self.queue_instance.get_items(5))
+        self.assertEqual([], self.queue_instance.get_items(1))
+        self.queue_instance.ack_items([1, 5])
+        self.queue_instance.add_items([3, 2])
+        self.queue_instance.reject_items([2, 6, 7])
+        self.assertEqual(['6', '7', '3', '2'], self.queue_instance.get_items(5))
+        self.queue_instance.ack_items([2, 6, 7, 3])
+        self.assertEqual(0, self.queue_instance.get_count())
+        self.assertEqual(5, slaves_mock.call_count)
+
+    def test_re_enqueue_timeout_items(self, slaves_mock):
+        microtimestamp = time.time()
+        timestamp = int(microtimestamp)
+
+        processing_queue1 = PROCESSING_QUEUE_SCHEMA.format(socket.gethostname(), os.getpid(), timestamp - 15)
+        self.client.lpush(processing_queue1, 1, 5, 3)
+        self.client.hset(TIMEOUT_QUEUE, processing_queue1, microtimestamp - 15)
+
+        processing_queue2 = PROCESSING_QUEUE_SCHEMA.format(socket.gethostname(), os.getpid(), timestamp - 10)
+        self.client.lpush(processing_queue2, 1, 4, 6)
+        self.client.hset(TIMEOUT_QUEUE, processing_queue2, microtimestamp - 10)
+
+        processing_queue3 = PROCESSING_QUEUE_SCHEMA.format(socket.gethostname(), os.getpid(), timestamp - 5)
+        self.client.lpush(processing_queue3, 4, 7, 8)
+        self.client.hset(TIMEOUT_QUEUE, processing_queue3, microtimestamp - 5)
+
+        self.queue_instance.re_enqueue_timeout_items(7)
+
+        self.assertEqual(['1', '5', '3', '4', '6'], self.client.zrange(QUEUE_NAME, 0, 10))
+        self.assertEqual(['8', '7', '4'], self.client.lrange(processing_queue3, 0, 5))
+        self.assertEqual({processing_queue3: str(microtimestamp - 5)}, self.client.hgetall(TIMEOUT_QUEUE))
+        self.assertEqual([QUEUE_NAME, processing_queue3, TIMEOUT_QUEUE], sorted(self.client.keys(QUEUE_NAME + '*')))
+
+        self.queue_instance.re_enqueue_timeout_items(0)
+
+        self.assertEqual(['4', '7', '8', '1', '5', '3', '6'], self.client.zrange(QUEUE_NAME, 0, 10))
+        self.assertEqual([QUEUE_NAME], self.client.keys(QUEUE_NAME + '*'))
+
+        self.assertEqual(2, slaves_mock.call_count)
+
+    def test_re_enqueue_all_times(self, slaves_mock):
+        microtimestamp = time.time()
+        timestamp = int(microtimestamp)
+        self.queue_instance.add_items([9, 6])
+
+        processing_queue1 = PROCESSING_QUEUE_SCHEMA.format(socket.gethostname(), os.getpid(), timestamp - 15)
+        self.client.lpush(processing_queue1, 1, 5, 3)
+        self.client.hset(TIMEOUT_QUEUE, processing_queue1, microtimestamp - 15)
+
+        processing_queue2 = PROCESSING_QUEUE_SCHEMA.format(socket.gethostname(), os.getpid(), timestamp - 10)
+        self.client.lpush(processing_queue2, 1, 4, 6)
+        self.client.hset(TIMEOUT_QUEUE, processing_queue2, microtimestamp - 10)
+
+        self.queue_instance.re_enqueue_all_items()
+
+        self.assertEqual(['1', '5', '3', '4', '6', '9'], self.client.zrange(QUEUE_NAME, 0, 10))
+        self.assertEqual([QUEUE_NAME, SEQUENCE_NAME], sorted(self.client.keys(QUEUE_NAME + '*')))
+
+        self.assertEqual(2, slaves_mock.call_count)
+
+    def test_drop_all_items(self, slaves_mock):
+        microtimestamp = time.time()
+        timestamp = int(microtimestamp)
+
+        processing_queue1 = PROCESSING_QUEUE_SCHEMA.format(socket.gethostname(), os.getpid(), timestamp - 15)
+        self.client.lpush(processing_queue1, 1, 5, 3)
+        self.client.hset(TIMEOUT_QUEUE, processing_queue1, microtimestamp - 15)
+
+        self.queue_instance.drop_all_items()
+
+        self.assertEqual([], self.client.keys(QUEUE_NAME + '*'))
+
+        self.assertEqual(1, slaves_mock.call_count)
+
+    def test_clear_queue(self, slaves_mock):
+        for chunked in [False, True]:
+            self.queue_instance.add_items(['item-{}'.format(i) for i in range(2500)])
+            self.queue_instance.get_items(5)
+
+            self.queue_instance.clear_queue(chunked=chunked)
+
+            self.assertEqual([], self.client.keys(QUEUE_NAME + '*'))
+            self.assertEqual(1, self.queue_instance.add_items(['item-1']))
+            self.client.delete(QUEUE_NAME, SEQUENCE_NAME)
+
+
+if __name__ == 'main':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import os
+from unittest.mock import patch
+
+from redis import Redis
+from pyrq.stream_queues import StreamQueue
+
+QUEUE_NAME = os.getenv('QUEUE_NAME', 'test-queue')
+
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+REDIS_DB = int(os.getenv('REDIS_DB', 0))
+REDIS_PASSWORD = os.getenv('REDIS_PASS', None)
+
+
+@patch('pyrq.helpers.wait_for_synced_slaves')
+class TestStreamQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                            decode_responses=True)
+        self.client.delete(QUEUE_NAME)
+        self.queue_instance = StreamQueue(QUEUE_NAME, self.client, synced_slaves_enabled=True,
+                                          synced_slaves_count=1, synced_slaves_timeout=2)
+
+    def tearDown(self):
+        self.client.delete(QUEUE_NAME)
+
+    def test_add_items(self, slaves_mock):
+        self.assertTrue(self.queue_instance.add_item('first-message'))
+        self.queue_instance.add_items(['second-message', 'third-message'])
+
+        self.assertEqual(3, self.queue_instance.get_count())
+        self.assertEqual(['first-message', 'second-message', 'third-message'],
+                         [fields['item'] for entry_id, fields in self.client.xrange(QUEUE_NAME)])
+        self.assertEqual(2, slaves_mock.call_count)
+
+    def test_get_items(self, slaves_mock):
+        self.queue_instance.add_items([3, 5, 3, 1])
+
+        self.assertEqual(['3', '5', '3'], self.queue_instance.get_items(3))
+        self.assertEqual(['1'], self.queue_instance.get_items(1, timeout=1))
+        self.assertEqual([], self.queue_instance.get_items(1))
+        self.assertEqual(0, self.queue_instance.get_count())
+        self.assertEqual(4, self.client.xpending(QUEUE_NAME, self.queue_instance.group_name)['pending'])
+
+    def test_ack_items(self, slaves_mock):
+        self.queue_instance.add_items([1, 5, 5, 3])
+        self.queue_instance.get_items(4)
+
+        self.queue_instance.ack_items([1, 5])
+        self.queue_instance.ack_item(1)
+
+        self.assertEqual(['5', '3'], [fields['item'] for entry_id, fields in self.client.xrange(QUEUE_NAME)])
+        self.assertEqual(2, self.client.xpending(QUEUE_NAME, self.queue_instance.group_name)['pending'])
+
+        self.queue_instance.ack_items([5, 3])
+        self.assertEqual(0, self.client.xlen(QUEUE_NAME))
+        self.assertEqual(4, slaves_mock.call_count)
+
+    def test_reject_items(self, slaves_mock):
+        self.queue_instance.add_items([1, 5, 3])
+        self.queue_instance.get_items(3)
+
+        self.queue_instance.reject_items([1, 9])
+        self.queue_instance.reject_item(3)
+
+        self.assertEqual(2, self.queue_instance.get_count())
+        self.assertEqual(['1', '3'], self.queue_instance.get_items(5))
+        self.queue_instance.ack_items([5, 1, 3])
+        self.assertEqual(0, self.client.xlen(QUEUE_NAME))
+
+    def test_integration(self, slaves_mock):
+        self.queue_instance.add_items([1, 5, 2, 6, 7])
+        self.assertEqual(['1', '5', '2', '6', '7'], self.queue_instance.get_items(5))
+        self.assertEqual([], self.queue_instance.get_items(1))
+        self.queue_instance.ack_items([1, 5])
+        self.queue_instance.add_items([3, 2])
+        self.queue_instance.reject_items([2, 6, 7])
+        self.assertEqual(['3', '2', '2', '6', '7'], self.queue_instance.get_items(5))
+        self.queue_instance.ack_items([2, 6, 7, 3, 2])
+        self.assertEqual(0, self.queue_instance.get_count())
+        self.assertEqual(0, self.client.xlen(QUEUE_NAME))
+
+    def test_re_enqueue_timeout_items(self, slaves_mock):
+        lost_instance = StreamQueue(QUEUE_NAME, self.client)
+        lost_instance.add_items([1, 5, 3])
+        self.assertEqual(['1', '5', '3'], lost_instance.get_items(3))
+
+        self.queue_instance.re_enqueue_timeout_items(3600)
+        self.assertEqual(0, self.queue_instance.get_count())
+
+        self.queue_instance.re_enqueue_all_items()
+        self.assertEqual(3, self.queue_instance.get_count())
+        self.assertEqual(['1', '5', '3'], self.queue_instance.get_items(3))
+        self.queue_instance.ack_items([1, 5, 3])
+        self.assertEqual(0, self.client.xlen(QUEUE_NAME))
+
+    def test_drop_all_items(self, slaves_mock):
+        lost_instance = StreamQueue(QUEUE_NAME, self.client)
+        lost_instance.add_items([1, 5, 3, 4])
+        lost_instance.get_items(3)
+
+        self.queue_instance.drop_all_items()
+
+        self.assertEqual(['4'], [fields['item'] for entry_id, fields in self.client.xrange(QUEUE_NAME)])
+        self.assertEqual(0, self.client.xpending(QUEUE_NAME, self.queue_instance.group_name)['pending'])
+
+    def test_other_group_is_rejected(self, slaves_mock):
+        StreamQueue(QUEUE_NAME, self.client, group_name=self.queue_instance.group_name)
+
+        with self.assertRaises(ValueError):
+            StreamQueue(QUEUE_NAME, self.client, group_name='other-group')
+
+    def test_clear_queue(self, slaves_mock):
+        self.queue_instance.add_items([1, 5, 3])
+        self.queue_instance.get_items(1)
+
+        self.queue_instance.clear_queue()
+
+        self.assertEqual(0, self.queue_instance.get_count())
+        self.assertEqual([], self.queue_instance.get_items(1))
+
+
+if __name__ == 'main':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import os
+from unittest.mock import patch
+
+from redis import Redis
+from pyrq.queues import Queue
+from pyrq.topics import Topic
+
+QUEUE_NAME = os.getenv('QUEUE_NAME', 'test-queue')
+TOPIC_NAME = '{' + QUEUE_NAME + '}-topic'
+
+REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+REDIS_DB = int(os.getenv('REDIS_DB', 0))
+REDIS_PASSWORD = os.getenv('REDIS_PASS', None)
+
+
+@patch('pyrq.helpers.wait_for_synced_slaves')
+class TestTopic(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                            decode_responses=True)
+        self.queues = [Queue('{' + QUEUE_NAME + '}-' + str(index), self.client) for index in range(3)]
+
+    def tearDown(self):
+        for key in self.client.keys('{' + QUEUE_NAME + '}*'):
+            self.client.delete(key)
+
+    def test_publish_items(self, slaves_mock):
+        topic = Topic(TOPIC_NAME, self.client, self.queues, synced_slaves_enabled=True, synced_slaves_count=1,
+                      synced_slaves_timeout=2)
+
+        self.assertEqual(['a', 'b'], topic.publish_items(['a', 'b']))
+        self.assertEqual('c', topic.publish_item('c'))
+
+        for queue in self.queues:
+            self.assertEqual(['a', 'b', 'c'], queue.get_items(5))
+        self.assertEqual(2, slaves_mock.call_count)
+
+    def test_publish_items_in_chunks(self, slaves_mock):
+        topic = Topic(TOPIC_NAME, self.client, [queue.name for queue in self.queues])
+        items = [str(i) for i in range(250)]
+
+        topic.publish_items(items)
+
+        for queue in self.queues:
+            self.assertEqual(items, queue.get_items(300))
+
+    def test_queues_with_options_are_rejected(self, slaves_mock):
+        for options in [{'max_length': 10}, {'max_bytes': 10}, {'claim_check_threshold': 10}, {'track_latency': True}]:
+            with self.assertRaises(ValueError):
+                Topic(TOPIC_NAME, self.client, self.queues + [Queue(QUEUE_NAME, self.client, **options)])
+
+    def test_publish_items_by_reference(self, slaves_mock):
+        topic = Topic(TOPIC_NAME, self.client, self.queues, by_reference=True, payload_ttl=60)
+
+        references = topic.publish_items(['a', 'b'])
+
+        self.assertEqual(2, len(set(references)))
+        for queue in self.queues:
+            self.assertEqual(references, queue.get_items(5))
+        self.assertEqual(['a', 'b', None], topic.resolve_items(references + [TOPIC_NAME + '-payload-missing']))
+        self.assertLessEqual(self.client.ttl(references[0]), 60)
+        self.assertEqual([], topic.resolve_items([]))
+
+
+if __name__ == 'main':
+    unittest.main()
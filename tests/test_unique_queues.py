@@ -5,12 +5,15 @@ import os
 from unittest.mock import patch
 
 from redis import Redis
-from pyrq.unique_queues import UniqueQueue, CHUNK_SIZE
+from pyrq.unique_queues import UniqueQueue, CHUNK_SIZE, ADD_CHUNK_SIZE
 
 QUEUE_NAME = os.getenv('QUEUE_NAME', 'test-queue')
 PROCESSING_QUEUE_SCHEMA = QUEUE_NAME + '-processing-{}[{}][{}]'
 TIMEOUT_QUEUE = QUEUE_NAME + '-timeouts'
 SET_QUEUE_NAME = QUEUE_NAME + '-unique'
+BLOOM_FILTER_NAME = QUEUE_NAME + '-bloom'
+PREVIOUS_BLOOM_FILTER_NAME = QUEUE_NAME + '-bloom-previous'
+PROCESSED_SET_NAME = QUEUE_NAME + '-processed'
 
 REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
@@ -44,7 +47,7 @@ class TestUniqueQueue(unittest.TestCase):
     def test_add_items(self, slaves_mock):
         items = ['first-message', 'second-message', 'first-message']
 
-        self.queue_instance.add_items(items)
+        self.assertEqual(2, self.queue_instance.add_items(items))
         self.assertEqual(items[0], self.client.rpop(QUEUE_NAME))
         self.assertEqual(items[1], self.client.rpop(QUEUE_NAME))
         self.assertEqual(None, self.client.rpop(QUEUE_NAME))
@@ -57,6 +60,42 @@ class TestUniqueQueue(unittest.TestCase):
         self.queue_instance.add_items(items)
         self.assertEqual(1, slaves_mock.call_count)
 
+    def test_add_items_with_duplicates_across_chunks(self, slaves_mock):
+        items = ['message-{}'.format(i % ADD_CHUNK_SIZE) for i in range(ADD_CHUNK_SIZE + 5)]
+        self.client.sadd(SET_QUEUE_NAME, 'message-1')
+
+        self.assertEqual(ADD_CHUNK_SIZE - 1, self.queue_instance.add_items(items))
+        self.assertEqual(ADD_CHUNK_SIZE - 1, self.client.llen(QUEUE_NAME))
+        self.assertEqual('message-0', self.client.rpop(QUEUE_NAME))
+        self.assertEqual('message-2', self.client.rpop(QUEUE_NAME))
+        self.assertEqual(ADD_CHUNK_SIZE, self.client.scard(SET_QUEUE_NAME))
+        self.assertEqual(1, slaves_mock.call_count)
+
+    @patch('pyrq.unique_queues.ADD_PIPELINE_CHUNKS', 2)
+    def test_add_items_in_several_pipelines(self, slaves_mock):
+        items = ['message-{}'.format(i) for i in range(5 * ADD_CHUNK_SIZE)]
+
+        with patch.object(self.client, 'pipeline', wraps=self.client.pipeline) as pipeline_mock:
+            self.assertEqual(len(items), self.queue_instance.add_items(items + items[:10]))
+        pipeline_mock.assert_called_once_with(transaction=False)
+        self.assertEqual(len(items), self.client.llen(QUEUE_NAME))
+
+    def test_add_items_with_max_length(self, slaves_mock):
+        queue_instance = UniqueQueue(QUEUE_NAME, self.client, max_length=3)
+
+        self.assertTrue(queue_instance.add_item(1))
+        self.assertEqual(2, queue_instance.add_items([1, 2, 2, 3, 4]))
+        self.assertFalse(queue_instance.add_item(4))
+        self.assertEqual(['3', '2', '1'], self.client.lrange(QUEUE_NAME, 0, 10))
+
+        self.assertEqual(0, queue_instance.add_items([4], block=True, timeout=0.2))
+        queue_instance.get_items(1)
+        self.assertEqual(1, queue_instance.add_items([4, 5]))
+        self.assertEqual(['4', '3', '2'], self.client.lrange(QUEUE_NAME, 0, 10))
+
+        with self.assertRaises(ValueError):
+            UniqueQueue(QUEUE_NAME, self.client, max_length=3, dedup_window=10)
+
     def test_add_item(self, slaves_mock):
         items = [3, 5, 3, 1]
         for i in items:
@@ -264,6 +303,154 @@ class TestUniqueQueue(unittest.TestCase):
 
         self.assertEqual(1, slaves_mock.call_count)
 
+    def test_ack_and_get(self, slaves_mock):
+        self.queue_instance.add_items([1, 5, 3])
+
+        self.assertEqual(['1', '5'], self.queue_instance.ack_and_get([], 2))
+        self.assertEqual(['3'], self.queue_instance.ack_and_get([1, 5], 2))
+        self.assertEqual(['3'], self.client.lrange(self.processing_queue, 0, 10))
+        self.assertEqual([], self.queue_instance.ack_and_get([3], 2))
+        self.assertEqual(0, self.client.llen(self.processing_queue))
+        self.assertEqual(4, slaves_mock.call_count)
+
+    def test_clear_queue(self, slaves_mock):
+        for chunked in [False, True]:
+            self.queue_instance.add_items(['item-{}'.format(i) for i in range(2500)])
+            self.queue_instance.get_items(5)
+
+            self.queue_instance.clear_queue(chunked=chunked)
+
+            self.assertEqual([], self.client.keys(QUEUE_NAME + '*'))
+            self.assertEqual(1, self.queue_instance.add_items(['item-1']))
+            self.client.delete(QUEUE_NAME, QUEUE_NAME + '-unique')
+
+
+@patch('pyrq.helpers.wait_for_synced_slaves')
+class TestBloomFilterUniqueQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                            decode_responses=True)
+        self.client.delete(QUEUE_NAME)
+        self.queue_instance = UniqueQueue(QUEUE_NAME, self.client, synced_slaves_enabled=True,
+                                          synced_slaves_count=1, synced_slaves_timeout=2,
+                                          bloom_filter_capacity=1000, bloom_filter_error_rate=0.001)
+        self.processing_queue = self.queue_instance.processing_queue_name
+
+    def tearDown(self):
+        self.client.eval("""
+            local keys = redis.call("keys", ARGV[1])
+            for i, key in ipairs(keys) do
+                redis.call("del", key)
+            end
+        """, 0, QUEUE_NAME + '*')
+
+    def test_add_items(self, slaves_mock):
+        items = ['first-message', 'second-message', 'first-message']
+
+        self.assertEqual(2, self.queue_instance.add_items(items))
+        self.queue_instance.add_item('second-message')
+        self.assertEqual(['second-message', 'first-message'], self.client.lrange(QUEUE_NAME, 0, 5))
+        self.assertEqual([QUEUE_NAME, BLOOM_FILTER_NAME], sorted(self.client.keys(QUEUE_NAME + '*')))
+        self.assertEqual(2, slaves_mock.call_count)
+
+    def test_bloom_filter_size(self, slaves_mock):
+        self.queue_instance.add_items(['message-{}'.format(i) for i in range(1000)])
+
+        self.assertEqual(1798, self.client.strlen(BLOOM_FILTER_NAME))
+        self.assertLessEqual(995, self.client.llen(QUEUE_NAME))
+
+    def test_bloom_filter_too_big(self, slaves_mock):
+        with self.assertRaises(ValueError):
+            UniqueQueue(QUEUE_NAME, self.client, bloom_filter_capacity=300000000)
+        UniqueQueue(QUEUE_NAME, self.client, bloom_filter_capacity=300000000, bloom_filter_error_rate=0.01)
+
+    def test_bloom_filter_error_rate(self, slaves_mock):
+        queue_instance = UniqueQueue(QUEUE_NAME, self.client, bloom_filter_capacity=5000,
+                                     bloom_filter_error_rate=0.01)
+        queue_instance.add_items(['https://example.com/product/{}'.format(i) for i in range(5000)])
+
+        added = queue_instance.add_items(['https://example.com/product/{}'.format(i) for i in range(5000, 6000)])
+        self.assertLess((1000 - added) / 1000, 2 * 0.01)
+
+    def test_processed_items_are_not_added_again(self, slaves_mock):
+        self.queue_instance.add_items([1, 2, 3])
+        self.assertEqual(['1', '2'], self.queue_instance.get_items(2))
+        self.queue_instance.ack_items(['1'])
+
+        self.assertEqual(0, self.queue_instance.add_items([1, 2, 3]))
+        self.assertEqual(['3'], self.client.lrange(QUEUE_NAME, 0, 5))
+
+    def test_reject_and_re_enqueue_items(self, slaves_mock):
+        self.queue_instance.add_items([1, 2, 3, 4])
+        self.assertEqual(['1', '2', '3'], self.queue_instance.get_items(3))
+
+        self.queue_instance.reject_items([1, 2])
+        self.assertEqual(['4', '2', '1'], self.client.lrange(QUEUE_NAME, 0, 5))
+
+        self.queue_instance.re_enqueue_all_items()
+        self.assertEqual(['4', '2', '1', '3'], self.client.lrange(QUEUE_NAME, 0, 5))
+        self.assertEqual([QUEUE_NAME, BLOOM_FILTER_NAME], sorted(self.client.keys(QUEUE_NAME + '*')))
+
+    def test_rotate_bloom_filter(self, slaves_mock):
+        self.queue_instance.add_items([1, 2])
+        self.queue_instance.rotate_bloom_filter()
+
+        self.assertEqual(1, self.queue_instance.add_items([1, 3]))
+        self.assertEqual([QUEUE_NAME, BLOOM_FILTER_NAME, PREVIOUS_BLOOM_FILTER_NAME],
+                         sorted(self.client.keys(QUEUE_NAME + '*')))
+
+        self.queue_instance.rotate_bloom_filter()
+        self.assertEqual(1, self.queue_instance.add_items([1, 2, 3]))
+        self.assertEqual(['2', '3', '2', '1'], self.client.lrange(QUEUE_NAME, 0, 5))
+
+
+@patch('pyrq.helpers.wait_for_synced_slaves')
+class TestDedupWindowUniqueQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PASSWORD,
+                            decode_responses=True)
+        self.client.delete(QUEUE_NAME)
+        self.queue_instance = UniqueQueue(QUEUE_NAME, self.client, synced_slaves_enabled=True,
+                                          synced_slaves_count=1, synced_slaves_timeout=2, dedup_window=60)
+
+    def tearDown(self):
+        self.client.eval("""
+            local keys = redis.call("keys", ARGV[1])
+            for i, key in ipairs(keys) do
+                redis.call("del", key)
+            end
+        """, 0, QUEUE_NAME + '*')
+
+    def test_ack_and_get(self, slaves_mock):
+        self.queue_instance.add_items([1, 2])
+
+        self.assertEqual(['1'], self.queue_instance.ack_and_get([], 1))
+        self.assertEqual(['2'], self.queue_instance.ack_and_get([1], 1))
+        self.assertEqual(0, self.queue_instance.add_items([1, 2]))
+        self.assertEqual(['2'], self.client.lrange(self.queue_instance.processing_queue_name, 0, 10))
+
+    @patch('pyrq.unique_queues.time.time')
+    def test_handed_out_items_are_ignored_within_window(self, time_mock, slaves_mock):
+        time_mock.return_value = 1444222459.0
+        self.assertEqual(3, self.queue_instance.add_items([1, 2, 3, 1]))
+        self.assertEqual(['1', '2'], self.queue_instance.get_items(2))
+        self.queue_instance.ack_items([1, 2])
+
+        self.queue_instance.add_item(1)
+        self.assertEqual(0, self.queue_instance.add_items([1, 2, 3]))
+        self.assertEqual(['3'], self.client.lrange(QUEUE_NAME, 0, 5))
+        self.assertEqual({'1': 1444222519.0, '2': 1444222519.0}, dict(self.client.zrange(PROCESSED_SET_NAME, 0, 5,
+                                                                                          withscores=True)))
+        self.assertLessEqual(0, self.client.ttl(PROCESSED_SET_NAME))
+
+        time_mock.return_value = 1444222459.0 + 60
+        self.assertEqual(2, self.queue_instance.add_items([1, 2, 3]))
+        self.assertEqual(['2', '1', '3'], self.client.lrange(QUEUE_NAME, 0, 5))
+        self.assertEqual(0, self.client.zcard(PROCESSED_SET_NAME))
+        self.assertEqual(5, slaves_mock.call_count)
+
 
 if __name__ == 'main':
     unittest.main()